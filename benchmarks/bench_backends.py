@@ -0,0 +1,222 @@
+"""ローカルのシラバスサーバーに対して各変換バックエンドのスループットを計測する
+
+    python benchmarks/bench_backends.py [--pages 40] [--concurrency 1,2,4]
+        [--backends pdfkit,weasyprint,wkhtmltopdf] [--baseline FILE] [--save-baseline FILE]
+
+benchmarks/syllabus_server.py の合成シラバスページを、次の3つの経路で変換する。
+
+- pdfkit      : 1件ごとにwkhtmltopdfを起動する pdfkit.from_url
+- weasyprint  : SharedHTTPSession で取得し、スレッドごとの RenderSession で描画
+- wkhtmltopdf : 起動したままのwkhtmltopdfワーカープール（WkhtmltopdfPool）
+
+いずれも pdf_engines.py の変換エンジン（各スクリプトの --engine で選ぶもの）を使う。
+
+並列数ごとに ページ/秒、1ページあたりの所要時間の p50/p95/p99、ピークRSS を表示する。
+--save-baseline で結果を保存し、--baseline で保存済みの結果と比較する。
+インストールされていないバックエンドは理由を表示して飛ばす。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from syllabus_server import SyllabusServer, SyllabusServerConfig, course_codes
+from stage_trace import percentile
+from pdf_engines import DEFAULT_PRESET, ENGINES, OUTPUT_PRESETS
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class PeakRSSMonitor:
+    """計測中の自プロセスと子プロセス（wkhtmltopdf）の合計RSSの最大値を記録する"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak = max(self.peak, total)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if psutil is not None:
+            self._sample()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._sample()
+        else:
+            # psutilがない場合は自プロセスの最大RSS（子プロセスは含まない）
+            try:
+                import resource
+                scale = 1 if sys.platform == 'darwin' else 1024
+                self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+            except ImportError:
+                self.peak = 0
+
+class EngineBackend:
+    """pdf_engines の変換エンジンでURLをPDFにする（ページの取得もエンジンが行う）"""
+
+    def __init__(self, engine_class, preset=None):
+        self.engine = engine_class(preset=preset)
+        self.name = self.engine.name
+
+    def available(self):
+        return self.engine.available()
+
+    def open(self, concurrency):
+        self.engine.open(concurrency)
+
+    def convert(self, url, output_path):
+        try:
+            self.engine.render_url(url, output_path)
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        self.engine.close()
+
+BACKENDS = ENGINES
+
+def run_backend(backend, urls, concurrency):
+    """1つのバックエンドを指定の並列数で実行し、計測結果を返す"""
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+    output_dir = tempfile.mkdtemp(prefix='bench_')
+
+    def convert(index_url):
+        nonlocal failures
+        index, url = index_url
+        started = time.perf_counter()
+        success = backend.convert(url, os.path.join(output_dir, f"{index}.pdf"))
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not success:
+                failures += 1
+
+    try:
+        with PeakRSSMonitor() as monitor:
+            backend.open(concurrency)
+            try:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    list(executor.map(convert, enumerate(urls)))
+                wall = time.perf_counter() - started
+            finally:
+                backend.close()
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {
+        'pages': len(urls),
+        'failures': failures,
+        'pages_per_sec': len(urls) / wall if wall > 0 else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'peak_rss_mb': monitor.peak / (1024 * 1024),
+    }
+
+def format_row(name, concurrency, result, baseline=None):
+    row = (f"{name:12s} {concurrency:>4d} {result['pages']:>6d} {result['failures']:>5d} "
+           f"{result['pages_per_sec']:>9.2f} {result['p50'] * 1000:>8.0f} {result['p95'] * 1000:>8.0f} "
+           f"{result['p99'] * 1000:>8.0f} {result['peak_rss_mb']:>9.1f}")
+    if baseline:
+        speed = (result['pages_per_sec'] / baseline['pages_per_sec'] - 1) * 100 if baseline['pages_per_sec'] else 0.0
+        p95 = (result['p95'] / baseline['p95'] - 1) * 100 if baseline['p95'] else 0.0
+        row += f"   ページ/秒 {speed:+6.1f}%  p95 {p95:+6.1f}%"
+    return row
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help=f"計測するバックエンド（カンマ区切り、デフォルト: {','.join(BACKENDS)}）")
+    parser.add_argument("--concurrency", default="1,2,4", help="並列数（カンマ区切り）")
+    parser.add_argument("--pages", type=int, default=40, help="1回の計測で変換するページ数")
+    parser.add_argument("--year", type=int, default=2025)
+    parser.add_argument("--page-kb", type=float, default=30, help="ページ本文の大きさ（KB）")
+    parser.add_argument("--assets", type=int, default=3, help="1ページあたりのCSS・画像の数")
+    parser.add_argument("--latency-ms", type=float, default=50, help="サーバーの応答遅延（ミリ秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500を返すページの割合")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="404を返すページの割合")
+    parser.add_argument("--preset", choices=list(OUTPUT_PRESETS), default=DEFAULT_PRESET,
+                        help="出力サイズのプリセット（デフォルト: default）")
+    parser.add_argument("--baseline", help="比較する保存済みの結果（JSON）")
+    parser.add_argument("--save-baseline", help="今回の結果を保存するファイル（JSON）")
+    args = parser.parse_args()
+
+    concurrency_levels = [int(value) for value in args.concurrency.split(",") if value.strip()]
+    config = SyllabusServerConfig(args.page_kb, args.assets, args.latency_ms,
+                                  error_rate=args.error_rate, missing_rate=args.missing_rate)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file).get('results', {})
+
+    if psutil is None:
+        print("psutilがないため、ピークRSSは自プロセスの最大値（子プロセスを含まない）です")
+
+    results = {}
+    with SyllabusServer(config) as server:
+        urls = [server.url(args.year, code) for code in course_codes(args.pages)]
+        print(f"ページ: {args.pages}件 / {args.page_kb:g}KB / 資源 {args.assets}個 / "
+              f"遅延 {args.latency_ms:g}ms / 500: {args.error_rate:.0%} / 404: {args.missing_rate:.0%}")
+        print(f"{'backend':12s} {'並列':>4s} {'ページ':>6s} {'失敗':>5s} {'ページ/秒':>9s} "
+              f"{'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'RSS MB':>9s}")
+
+        for name in args.backends.split(","):
+            name = name.strip()
+            if name not in BACKENDS:
+                print(f"{name:12s} 不明なバックエンドです")
+                continue
+            backend = EngineBackend(BACKENDS[name], args.preset)
+            reason = backend.available()
+            if reason:
+                print(f"{name:12s} 飛ばします: {reason}")
+                continue
+
+            # 初回のインポート・初期化コストを計測から除く
+            run_backend(backend, urls[:1], 1)
+            for concurrency in concurrency_levels:
+                key = f"{name}@{concurrency}"
+                results[key] = run_backend(backend, urls, concurrency)
+                print(format_row(name, concurrency, results[key], baseline.get(key)))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump({'settings': vars(args), 'results': results}, file, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.save_baseline}")
+
+if __name__ == "__main__":
+    main()
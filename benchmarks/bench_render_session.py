@@ -0,0 +1,60 @@
+"""RenderSessionによる1文書あたりの描画時間の短縮を計測する
+
+    python benchmarks/bench_render_session.py [--documents 20]
+
+文書ごとにCSSとフォント設定を作り直す従来の描画と、RenderSessionを使い回す
+描画で、同じ合成シラバスページを描画して1文書あたりの平均時間を比較する。
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from weasyprint import HTML, CSS
+from render_session import RenderSession, DEFAULT_STYLESHEET
+
+def synthetic_syllabus(index, rows=40):
+    """日本語の表を含む合成シラバスページを生成する"""
+    body = "".join(
+        f"<tr><th>第{row + 1}回</th><td>授業内容の説明 {index}-{row}：講義と演習、課題のふりかえり</td></tr>"
+        for row in range(rows))
+    return (f"<html><head><meta charset='utf-8'><title>授業 {index}</title></head>"
+            f"<body><h1>シラバス {index}</h1><table>{body}</table></body></html>")
+
+def render_fresh(documents):
+    """従来の描画：文書ごとにCSSを解析し、フォントも毎回探索する"""
+    for i, html in enumerate(documents):
+        css_style = CSS(string=DEFAULT_STYLESHEET)
+        HTML(string=html, base_url=f"http://localhost/{i}.html").write_pdf(io.BytesIO(), stylesheets=[css_style])
+
+def render_session(documents):
+    """RenderSessionを使い回す描画"""
+    session = RenderSession()
+    for i, html in enumerate(documents):
+        session.render(html, f"http://localhost/{i}.html", io.BytesIO())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=20, help="描画する文書数")
+    args = parser.parse_args()
+
+    documents = [synthetic_syllabus(i) for i in range(args.documents)]
+
+    # 初回のインポート・初期化コストを計測から除く
+    render_session(documents[:1])
+
+    results = {}
+    for name, func in (("fresh", render_fresh), ("session", render_session)):
+        start = time.perf_counter()
+        func(documents)
+        results[name] = (time.perf_counter() - start) / len(documents)
+        print(f"{name:8s}: {results[name] * 1000:8.1f} ms/文書")
+
+    saving = results["fresh"] - results["session"]
+    print(f"短縮    : {saving * 1000:8.1f} ms/文書 ({saving / results['fresh'] * 100:.1f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""各スクリプトの起動時の読み込み時間と、wkhtmltopdfの確認時間を計測する
+
+    python benchmarks/bench_startup.py [--runs 5] [--modules url_to_pdf_gui,url_to_pdf_syllabus]
+        [--baseline FILE] [--save-baseline FILE]
+
+モジュールごとに新しいPythonプロセスで `python -X importtime -c "import モジュール"` を --runs 回実行し、
+モジュールの読み込み時間（中央値）と、時間のかかった読み込み上位を表示する。
+何も読み込まないPythonの起動時間も比較用に表示する。
+
+wkhtmltopdfの確認（pdf_engines.probe_wkhtmltopdf）は、保存した結果がない初回と、
+保存した結果を使う2回目以降の所要時間を比べる（wkhtmltopdfがなければ飛ばす）。
+
+--save-baseline で結果を保存し、--baseline で保存済みの結果と比較する。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pdf_engines import probe_wkhtmltopdf
+
+# 起動時間を計測するモジュール（GUI・コマンドライン・変換サーバー）
+DEFAULT_MODULES = ['url_to_pdf_gui', 'url_to_pdf_syllabus', 'url_to_pdf_converter', 'syllabus_converter',
+                   'conversion_server']
+
+# 時間のかかった読み込みとして表示する件数
+TOP_IMPORTS = 5
+
+def measure_import(module):
+    """新しいプロセスでモジュールを読み込み、(全体の秒数, 読み込みの秒数, {直下で読み込んだモジュール: 秒数}) を返す"""
+    command = [sys.executable, '-X', 'importtime', '-c', f"import {module}" if module else "pass"]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # import time: self [us] | cumulative | imported package
+    # 読み込まれたモジュールは親より先に1段深いインデントで出力される
+    total, children, pending = 0.0, {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.count('|') != 2:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        name = name.rstrip()[1:]
+        seconds = int(cumulative) / 1e6
+        if not name.startswith(' '):
+            if name == module:
+                total, children = seconds, pending
+            pending = {}
+        elif not name.startswith('   '):
+            pending[name.strip()] = seconds
+    return elapsed, total, children
+
+def bench_module(module, runs):
+    """--runs 回読み込み、プロセス全体と読み込みの秒数の中央値・時間のかかった直下の読み込みを返す"""
+    elapsed, imports, children = [], [], {}
+    for _ in range(runs):
+        seconds, total, imported = measure_import(module)
+        elapsed.append(seconds)
+        imports.append(total)
+        for name, child_seconds in imported.items():
+            children.setdefault(name, []).append(child_seconds)
+    top = sorted(((statistics.median(times), name) for name, times in children.items()), reverse=True)
+    return {
+        'process': statistics.median(elapsed),
+        'import': statistics.median(imports),
+        'top': [[name, seconds] for seconds, name in top[:TOP_IMPORTS]],
+    }
+
+def bench_probe(runs):
+    """保存した結果がない初回と、保存した結果を使う2回目以降の probe_wkhtmltopdf の秒数"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_path = os.path.join(temp_dir, 'wkhtmltopdf.json')
+        started = time.perf_counter()
+        path, _ = probe_wkhtmltopdf(cache_path)
+        cold = time.perf_counter() - started
+        if path is None:
+            return None
+        warm = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            probe_wkhtmltopdf(cache_path)
+            warm.append(time.perf_counter() - started)
+    return {'cold': cold, 'warm': statistics.median(warm)}
+
+def format_change(value, baseline):
+    if not baseline:
+        return ""
+    return f"  ({(value / baseline - 1) * 100:+.0f}%)"
+
+def main():
+    parser = argparse.ArgumentParser(description="各スクリプトの起動時の読み込み時間を計測します")
+    parser.add_argument("--runs", type=int, default=5, help="モジュールごとの計測回数（デフォルト: 5）")
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES),
+                        help="計測するモジュール（カンマ区切り）")
+    parser.add_argument("--baseline", help="比較する保存済みの結果（JSON）")
+    parser.add_argument("--save-baseline", help="今回の結果を保存するファイル（JSON）")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file).get('results', {})
+
+    results = {}
+    interpreter = statistics.median(measure_import(None)[0] for _ in range(args.runs))
+    print(f"Pythonの起動のみ: {interpreter * 1000:.0f} ms\n")
+    print(f"{'モジュール':<24}{'プロセス全体':>12}{'読み込み':>12}")
+    for module in [name.strip() for name in args.modules.split(",") if name.strip()]:
+        try:
+            result = bench_module(module, args.runs)
+        except RuntimeError as e:
+            print(f"{module:<24}  読み込めません: {e}")
+            continue
+        results[module] = result
+        previous = baseline.get(module, {})
+        print(f"{module:<24}{result['process'] * 1000:>10.0f}ms{result['import'] * 1000:>10.0f}ms"
+              f"{format_change(result['import'], previous.get('import'))}")
+        for name, seconds in result['top']:
+            print(f"    {name:<36}{seconds * 1000:>8.1f} ms")
+
+    probe = bench_probe(args.runs)
+    if probe is None:
+        print("\nwkhtmltopdfの確認: wkhtmltopdf が見つからないため飛ばしました")
+    else:
+        results['probe_wkhtmltopdf'] = probe
+        previous = baseline.get('probe_wkhtmltopdf', {})
+        print(f"\nwkhtmltopdfの確認: 初回 {probe['cold'] * 1000:.1f} ms / 2回目以降 {probe['warm'] * 1000:.2f} ms"
+              f"{format_change(probe['warm'], previous.get('warm'))}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as file:
+            json.dump({'runs': args.runs, 'python': sys.version.split()[0], 'results': results},
+                      file, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {args.save_baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""ベンチマーク用のローカルなシラバスサーバー
+
+    python benchmarks/syllabus_server.py [--port 8000] [--latency-ms 50] ...
+
+本物のシラバスサーバーと同じ形式のパス
+（/slResult/<年度>/japanese/syllabusHtml/SyllabusHtml.<年度>.<授業コード>.html）で
+合成したシラバスページを返す。ページの大きさ・画像などの資源数・応答遅延・
+エラーの割合を指定できる。エラーにする授業コードは授業コードのハッシュで決まるため、
+同じ設定なら毎回同じ授業コードがエラーになる。
+"""
+import argparse
+import hashlib
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PAGE_PATTERN = re.compile(r'/SyllabusHtml\.(\d{4})\.([A-Za-z0-9]+)\.html$')
+ASSET_PATTERN = re.compile(r'/assets/([A-Za-z0-9]+)/(\d+)\.(png|css)$')
+
+def solid_png(width=64, height=64, color=(70, 110, 160)):
+    """単色のPNG画像を生成する"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    row = b'\x00' + bytes(color) * width
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * height))
+            + chunk(b'IEND', b''))
+
+def course_codes(count, prefix='B'):
+    """ベンチマーク用の授業コードを生成する"""
+    return [f"{prefix}{i:05d}" for i in range(count)]
+
+class SyllabusServerConfig:
+    """合成ページの設定"""
+
+    def __init__(self, page_kb=30, assets=3, latency_ms=50, jitter_ms=10,
+                 error_rate=0.0, missing_rate=0.0):
+        self.page_kb = page_kb
+        self.assets = assets
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.missing_rate = missing_rate
+
+    def outcome(self, course_code):
+        """授業コードに対する応答（200/404/500）を決める"""
+        bucket = int(hashlib.sha256(course_code.encode('ascii')).hexdigest()[:8], 16) / 0xffffffff
+        if bucket < self.missing_rate:
+            return 404
+        if bucket < self.missing_rate + self.error_rate:
+            return 500
+        return 200
+
+def synthetic_page(year, course_code, config):
+    """指定の大きさになるまで授業計画の表を並べた合成シラバスページ"""
+    head = [f"<link rel='stylesheet' href='/assets/{course_code}/0.css'>"] if config.assets else []
+    images = "".join(f"<img src='/assets/{course_code}/{n}.png' width='64' height='64'>"
+                     for n in range(1, config.assets))
+    rows = []
+    size = 0
+    row = 0
+    while size < config.page_kb * 1024:
+        text = (f"<tr><th>第{row + 1}回</th><td>{course_code} 授業内容の説明：講義と演習、"
+                f"課題のふりかえり、参考文献の紹介（{year}年度）</td></tr>")
+        rows.append(text)
+        size += len(text.encode('utf-8'))
+        row += 1
+    return (f"<html><head><meta charset='utf-8'><title>{course_code}</title>{''.join(head)}</head>"
+            f"<body><h1>シラバス {year} {course_code}</h1>{images}"
+            f"<table>{''.join(rows)}</table></body></html>").encode('utf-8')
+
+class SyllabusRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # ヘッダーと本文を別々に書き出すため、Nagleアルゴリズムによる遅延を避ける
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        config = self.server.config
+        self.server.count_request()
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        path = self.path.split('?', 1)[0]
+        page = PAGE_PATTERN.search(path)
+        asset = ASSET_PATTERN.search(path)
+        if page:
+            year, course_code = page.groups()
+            status = config.outcome(course_code)
+            if status != 200:
+                self.send_plain(status, send_body)
+                return
+            self.send_body(synthetic_page(year, course_code, config), 'text/html; charset=utf-8', send_body)
+        elif asset and asset.group(3) == 'png':
+            self.send_body(self.server.png, 'image/png', send_body)
+        elif asset:
+            self.send_body(b"h1 { color: #335; } td { font-size: 10pt; }", 'text/css', send_body)
+        else:
+            self.send_plain(404, send_body)
+
+    def send_body(self, body, content_type, send_body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"' + hashlib.sha256(body).hexdigest()[:16] + '"')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def send_plain(self, status, send_body):
+        body = f"{status}".encode('ascii')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+class SyllabusServer(ThreadingHTTPServer):
+    """別スレッドで動くローカルなシラバスサーバー（with文で起動・停止する）"""
+
+    daemon_threads = True
+
+    def __init__(self, config=None, port=0):
+        super().__init__(('127.0.0.1', port), SyllabusRequestHandler)
+        self.config = config or SyllabusServerConfig()
+        self.png = solid_png()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def url(self, year, course_code):
+        host, port = self.server_address[:2]
+        return (f"http://{host}:{port}/slResult/{year}/japanese/syllabusHtml/"
+                f"SyllabusHtml.{year}.{course_code}.html")
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--page-kb", type=float, default=30, help="ページ本文の大きさ（KB）")
+    parser.add_argument("--assets", type=int, default=3, help="1ページあたりのCSS・画像の数")
+    parser.add_argument("--latency-ms", type=float, default=50, help="応答遅延（ミリ秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500を返す授業コードの割合")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="404を返す授業コードの割合")
+    args = parser.parse_args()
+
+    config = SyllabusServerConfig(args.page_kb, args.assets, args.latency_ms,
+                                  error_rate=args.error_rate, missing_rate=args.missing_rate)
+    with SyllabusServer(config, args.port) as server:
+        print(f"例: {server.url(2025, 'B00000')}")
+        print("Ctrl+Cで終了します")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
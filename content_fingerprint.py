@@ -0,0 +1,52 @@
+import hashlib
+import os
+import re
+import shutil
+
+# 内容の比較に影響しない、アクセスごとに変わる部分
+VOLATILE_PATTERNS = [
+    # コメントとスクリプト（アクセス解析やトークン埋め込みが多い）
+    re.compile(rb'<!--.*?-->', re.S),
+    re.compile(rb'<script\b.*?</script\s*>', re.S | re.I),
+    # hiddenのinput（セッション・CSRFトークン、ViewStateなど）
+    re.compile(rb'<input\b[^>]*type\s*=\s*["\']?hidden[^>]*>', re.I),
+    # URLに埋め込まれたセッションIDやトークン
+    re.compile(rb'[;?&](?:jsessionid|phpsessid|sid|sessionid|token|_)=[^"\'&\s<>]*', re.I),
+    # 更新日・生成日時などのラベルが付いた日付・日時
+    # （授業日程の日時は内容の一部なので、ラベルのない日時は取り除かない）
+    re.compile('(?:最終更新|更新日|作成日|出力日|印刷日|生成日|表示日|アクセス日|取得日|現在日時|現在時刻'
+               '|Last[ -]?(?:updated|modified)|Generated|Printed|Accessed|Retrieved)'
+               '[^<\\d]{0,10}[\\d年月日時分秒/.\\-:T ]+'.encode('utf-8'), re.I),
+    # 日時を埋め込む meta（<meta name="date" content="...">など）
+    re.compile(rb'<meta\b[^>]*name\s*=\s*["\']?(?:date|dcterms\.modified|generated|last-modified)\b[^>]*>', re.I),
+    # アクセスカウンター
+    re.compile('(?:アクセス数|閲覧数|訪問者数|カウンタ[ー]?|visits?|visitors?|hits?)\\s*[:：]?\\s*[\\d,]+'.encode('utf-8'), re.I),
+]
+
+WHITESPACE_PATTERN = re.compile(rb'\s+')
+
+def normalize_html(content):
+    """アクセスごとに変わる部分を取り除き、空白を詰めたHTML（bytes）を返す"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    for pattern in VOLATILE_PATTERNS:
+        content = pattern.sub(b'', content)
+    return WHITESPACE_PATTERN.sub(b' ', content).strip()
+
+def content_hash(content):
+    """正規化したHTMLのSHA-256。内容が変わっていなければ前回と同じ値になる"""
+    return hashlib.sha256(normalize_html(content)).hexdigest()
+
+def link_or_copy(source_path, output_path):
+    """同じ内容の既存PDFをハードリンクし、できない環境ではコピーする"""
+    directory, filename = os.path.split(output_path)
+    temp_path = os.path.join(directory, f".{filename}.{os.getpid()}.link.pdf")
+    try:
+        try:
+            os.link(source_path, temp_path)
+        except OSError:
+            shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
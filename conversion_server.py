@@ -0,0 +1,570 @@
+import argparse
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from http_cache import CachedResponse, HTTPCache, DEFAULT_MAX_CACHE_MB
+from http_session import SharedHTTPSession
+from host_limiter import HostRateLimiter, parse_host_limit
+from run_manifest import temporary_output
+from retry_policy import RetryPolicy, ERROR_LABELS, classify_error
+from pdf_engines import (AUTO, ENGINE_CHOICES, DEFAULT_PRESET, OUTPUT_PRESETS, open_engine, sanitize_filename,
+                         extract_course_id_from_url, syllabus_url)
+from render_workers import DEFAULT_MAX_RSS_MB, DEFAULT_RECYCLE_DOCUMENTS, process_limits
+
+DEFAULT_PORT = 8765
+
+# 1回のジョブで受け付けるURL・授業コードの最大数
+MAX_BATCH = 1000
+
+# リクエスト本文（JSON）の上限
+MAX_BODY_BYTES = 1024 * 1024
+
+# 変換対象の状態
+ITEM_QUEUED = 'queued'
+ITEM_RUNNING = 'running'
+ITEM_DONE = 'done'
+ITEM_FAILED = 'failed'
+
+# 起動直後とワーカーの開始時に描画して、フォントの探索や描画エンジンの初期化を済ませておくページ
+WARMUP_HTML = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>warm-up</title></head>
+<body><h1>シラバス</h1><table><tr><th>授業科目名</th><td>warm-up</td></tr></table></body></html>"""
+
+JOB_PATH = re.compile(r'^/jobs/([0-9a-f]{32})(?:/(events|files/([^/]+)))?$')
+
+class FairQueue:
+    """クライアントごとの待ち行列から1件ずつ順番に取り出す（ラウンドロビン）
+
+    大きなバッチを投入したクライアントがいても、後から投入した他のクライアントの
+    変換は1件ずつ交互に進む。delayを指定した項目はその秒数が経つまで取り出さない。
+    """
+
+    def __init__(self):
+        self._clients = OrderedDict()
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, client, item, delay=None):
+        with self._condition:
+            if delay:
+                heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), client, item))
+            else:
+                self._clients.setdefault(client, deque()).append(item)
+            self._condition.notify()
+
+    def get(self):
+        """次の項目を返す（close()されたらNone）"""
+        with self._condition:
+            while not self._closed:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, client, item = heapq.heappop(self._delayed)
+                    self._clients.setdefault(client, deque()).append(item)
+                if self._clients:
+                    # 先頭のクライアントから1件取り出し、残りがあれば末尾に回す
+                    client, items = self._clients.popitem(last=False)
+                    item = items.popleft()
+                    if items:
+                        self._clients[client] = items
+                    return item
+                self._condition.wait(self._delayed[0][0] - now if self._delayed else None)
+            return None
+
+    def remove(self, predicate):
+        """条件に合う待機中の項目を取り除き、その件数を返す"""
+        with self._condition:
+            removed = 0
+            for client in list(self._clients):
+                items = self._clients[client]
+                kept = deque(item for item in items if not predicate(item))
+                removed += len(items) - len(kept)
+                if kept:
+                    self._clients[client] = kept
+                else:
+                    del self._clients[client]
+            delayed = [entry for entry in self._delayed if not predicate(entry[3])]
+            removed += len(self._delayed) - len(delayed)
+            heapq.heapify(delayed)
+            self._delayed = delayed
+            return removed
+
+    def pending(self):
+        """クライアントごとの待機中の件数"""
+        with self._condition:
+            counts = {client: len(items) for client, items in self._clients.items()}
+            for _, _, client, _ in self._delayed:
+                counts[client] = counts.get(client, 0) + 1
+            return counts
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+class ConversionJob:
+    """1回に投入されたURL・授業コードの一覧と、その変換状況"""
+
+    def __init__(self, job_id, client, targets, output_dir, policy):
+        self.id = job_id
+        self.client = client
+        self.output_dir = output_dir
+        self.policy = policy
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancelled = False
+        self.items = []
+        # 終わった順の項目の番号（/events で順に返す）
+        self.events = []
+        self.changed = threading.Condition()
+
+        filenames = set()
+        for url, course_code in targets:
+            name = sanitize_filename(f"{course_code or extract_course_id_from_url(url)}.pdf")
+            # 同じファイル名になる場合は番号を付けて区別する
+            base, n = name[:-4], 2
+            while name in filenames:
+                name = f"{base}_{n}.pdf"
+                n += 1
+            filenames.add(name)
+            self.items.append({'url': url, 'course_code': course_code, 'filename': name,
+                               'status': ITEM_QUEUED, 'attempts': 0, 'seconds': None, 'size': None,
+                               'error': None, 'error_class': None})
+
+    def update(self, index, **fields):
+        with self.changed:
+            item = self.items[index]
+            item.update(fields)
+            if item['status'] in (ITEM_DONE, ITEM_FAILED):
+                self.events.append(index)
+                if len(self.events) == len(self.items):
+                    self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def cancel(self):
+        """待機中の項目を失敗として締める"""
+        with self.changed:
+            self.cancelled = True
+            for index, item in enumerate(self.items):
+                if item['status'] == ITEM_QUEUED:
+                    item.update(status=ITEM_FAILED, error="キャンセルされました")
+                    self.events.append(index)
+            if len(self.events) == len(self.items) and self.finished_at is None:
+                self.finished_at = time.time()
+            self.changed.notify_all()
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def item_view(self, index):
+        item = dict(self.items[index], index=index)
+        if item['error_class']:
+            item['error_label'] = ERROR_LABELS[item['error_class']]
+        if item['status'] == ITEM_DONE:
+            item['pdf'] = f"/jobs/{self.id}/files/{item['filename']}"
+        return item
+
+    def snapshot(self):
+        """ジョブの状態をJSONにできる辞書で返す"""
+        with self.changed:
+            counts = {}
+            for item in self.items:
+                counts[item['status']] = counts.get(item['status'], 0) + 1
+            return {
+                'id': self.id,
+                'client': self.client,
+                'state': 'finished' if self.finished else 'running',
+                'cancelled': self.cancelled,
+                'created_at': round(self.created_at, 3),
+                'finished_at': round(self.finished_at, 3) if self.finished_at else None,
+                'total': len(self.items),
+                'counts': counts,
+                'items': [self.item_view(index) for index in range(len(self.items))],
+            }
+
+class ConversionService:
+    """変換エンジン・接続プール・HTTPキャッシュを起動したまま保持し、投入されたジョブを変換する
+
+    変換はworkers個のスレッドで行い、FairQueueでクライアントごとに順番に取り出す。
+    失敗はジョブごとのRetryPolicyに従って待ち時間を置いて再投入する。
+    変換の終わったジョブは job_ttl 秒後に出力ごと削除する。
+    """
+
+    def __init__(self, engine, cache, output_dir, workers=2, job_ttl=3600, max_attempts=3, retry_budget=50,
+                 log=print):
+        self.engine = engine
+        self.cache = cache
+        self.output_dir = output_dir
+        self.job_ttl = job_ttl
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget
+        self.log = log
+        self.started_at = time.time()
+        self.converted = 0
+        self.failed = 0
+        self.jobs = {}
+        self.queue = FairQueue()
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        self.threads = [threading.Thread(target=self._worker, name=f"convert-{n + 1}", daemon=True)
+                        for n in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, client, targets):
+        """(URL, 授業コードまたはNone) の一覧をジョブとして投入する"""
+        self.purge()
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.output_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        job = ConversionJob(job_id, client, targets, job_dir, RetryPolicy(self.max_attempts, self.retry_budget))
+        with self._lock:
+            self.jobs[job_id] = job
+        for index in range(len(job.items)):
+            self.queue.put(client, (job, index))
+        self.log(f"ジョブ {job_id}: {client} から {len(job.items)}件")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job):
+        removed = self.queue.remove(lambda item: item[0] is job)
+        job.cancel()
+        self.log(f"ジョブ {job.id}: キャンセル（待機中 {removed}件）")
+
+    def purge(self):
+        """終わってから job_ttl 秒以上経ったジョブを出力ごと削除する"""
+        expired = []
+        with self._lock:
+            for job_id, job in list(self.jobs.items()):
+                if job.finished and time.time() - job.finished_at > self.job_ttl:
+                    expired.append(self.jobs.pop(job_id))
+        for job in expired:
+            shutil.rmtree(job.output_dir, ignore_errors=True)
+
+    def warm_up(self):
+        """フォントの探索や描画エンジンの初期化を済ませるため、小さなページを1回描画する"""
+        page = CachedResponse("http://localhost/warm-up.html", 200, {'Content-Type': 'text/html; charset=utf-8'},
+                              WARMUP_HTML.encode('utf-8'))
+        fd, path = tempfile.mkstemp(suffix='.pdf', prefix='warmup_')
+        os.close(fd)
+        try:
+            self.engine.render_page(page, path)
+        except Exception as e:
+            self.log(f"ウォームアップに失敗しました（{threading.current_thread().name}）: {e}")
+        finally:
+            os.remove(path)
+
+    def _worker(self):
+        self.warm_up()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            job, index = item
+            if not job.cancelled:
+                self._convert(job, index)
+
+    def _convert(self, job, index):
+        item = job.items[index]
+        attempt = item['attempts'] + 1
+        job.update(index, status=ITEM_RUNNING, attempts=attempt)
+        output_path = os.path.join(job.output_dir, item['filename'])
+        started = time.perf_counter()
+        try:
+            page = self.cache.get(item['url'])
+            with temporary_output(output_path) as temp_path:
+                self.engine.render_page(page, temp_path)
+                os.replace(temp_path, output_path)
+        except Exception as e:
+            error_class = classify_error(e)
+            delay = job.policy.next_delay(error_class, attempt)
+            if delay is not None and not job.cancelled:
+                job.update(index, status=ITEM_QUEUED, error=str(e)[:500], error_class=error_class)
+                self.queue.put(job.client, (job, index), delay)
+                return
+            job.update(index, status=ITEM_FAILED, seconds=round(time.perf_counter() - started, 3),
+                       error=str(e)[:500], error_class=error_class)
+            with self._lock:
+                self.failed += 1
+            return
+
+        job.update(index, status=ITEM_DONE, seconds=round(time.perf_counter() - started, 3),
+                   size=os.path.getsize(output_path), error=None, error_class=None)
+        with self._lock:
+            self.converted += 1
+
+    def status(self):
+        """サーバー全体の状態"""
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return {
+            'engine': self.engine.label,
+            'workers': len(self.threads),
+            'uptime': round(time.time() - self.started_at, 1),
+            'converted': self.converted,
+            'failed': self.failed,
+            'jobs': {'running': sum(not job.finished for job in jobs), 'finished': sum(job.finished for job in jobs)},
+            'pending_by_client': self.queue.pending(),
+            'http_cache': {'hits': self.cache.hits, 'misses': self.cache.misses},
+            'engine_summary': self.engine.summary(),
+            'host_rates': self.cache.http.limiter.summary(),
+        }
+
+    def close(self):
+        """変換中の項目を終えてからワーカーを止める（エンジンと接続プールは呼び出し側で閉じる）"""
+        self.queue.close()
+        for thread in self.threads:
+            thread.join()
+
+def parse_targets(body):
+    """リクエスト本文から (URL, 授業コードまたはNone) の一覧を作る（不正なら ValueError）"""
+    if not isinstance(body, dict):
+        raise ValueError("本文はJSONオブジェクトで指定してください")
+    targets = []
+    for url in body.get('urls') or []:
+        if not isinstance(url, str) or urlparse(url).scheme not in ('http', 'https'):
+            raise ValueError(f"http(s)のURLではありません: {url!r}")
+        targets.append((url, None))
+    codes = body.get('course_codes') or []
+    if codes:
+        year = body.get('year')
+        if not isinstance(year, int) or year < 2020:
+            raise ValueError("授業コードを指定する場合は year（2020以降の整数）も指定してください")
+        for code in codes:
+            if not isinstance(code, str) or not re.fullmatch(r'[A-Za-z0-9]+', code):
+                raise ValueError(f"授業コードが正しくありません: {code!r}")
+            targets.append((syllabus_url(code, year), code))
+    if not targets:
+        raise ValueError("urls か course_codes を指定してください")
+    if len(targets) > MAX_BATCH:
+        raise ValueError(f"1回に投入できるのは{MAX_BATCH}件までです")
+    return targets
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """変換サーバーのHTTP API
+
+    POST   /jobs                    {"urls": [...]} または {"course_codes": [...], "year": 2025} でジョブを投入
+    GET    /jobs/<id>               ジョブの状態（JSON）
+    GET    /jobs/<id>/events        終わった項目を1件1行のJSON（NDJSON）で順に返し、全件終わったら閉じる
+    GET    /jobs/<id>/files/<name>  変換したPDF
+    DELETE /jobs/<id>               待機中の項目を取り消す
+    GET    /status                  サーバーの状態
+
+    クライアントは本文の "client" か X-Client-Id ヘッダーで区別する（なければ接続元のアドレス）。
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "URLtoPDFServer/1.0"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, data, headers=None):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status, message):
+        self._send_json(status, {'error': message})
+
+    def _job(self):
+        match = JOB_PATH.match(urlparse(self.path).path)
+        job = self.service.get(match.group(1)) if match else None
+        return match, job
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/jobs':
+            return self._send_error(404, "見つかりません")
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            return self._send_error(400, "本文がないか大きすぎます")
+        try:
+            body = json.loads(self.rfile.read(length))
+            targets = parse_targets(body)
+        except ValueError as e:
+            return self._send_error(400, str(e))
+        client = str(body.get('client') or self.headers.get('X-Client-Id') or self.client_address[0])[:100]
+        job = self.service.submit(client, targets)
+        location = f"/jobs/{job.id}"
+        self._send_json(202, {'id': job.id, 'status': location, 'events': f"{location}/events",
+                              'total': len(job.items)}, {'Location': location})
+
+    def do_DELETE(self):
+        match, job = self._job()
+        if job is None or match.group(2):
+            return self._send_error(404, "ジョブが見つかりません")
+        self.service.cancel(job)
+        self._send_json(200, job.snapshot())
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/status':
+            return self._send_json(200, self.service.status())
+        match, job = self._job()
+        if job is None:
+            return self._send_error(404, "ジョブが見つかりません")
+        if match.group(2) is None:
+            return self._send_json(200, job.snapshot())
+        if match.group(2) == 'events':
+            return self._stream_events(job)
+        return self._send_file(job, match.group(3))
+
+    def _send_file(self, job, filename):
+        item = next((item for item in job.items if item['filename'] == filename), None)
+        if item is None or item['status'] != ITEM_DONE:
+            return self._send_error(404, "PDFがありません")
+        try:
+            file = open(os.path.join(job.output_dir, filename), 'rb')
+        except OSError:
+            return self._send_error(410, "PDFは削除されました")
+        with file:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.send_header('Content-Length', str(os.fstat(file.fileno()).st_size))
+            self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+            self.end_headers()
+            shutil.copyfileobj(file, self.wfile, 64 * 1024)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_events(self, job):
+        """終わった項目を順に1行ずつ送り、全件終わったらジョブの集計を送って閉じる"""
+        query = parse_qs(urlparse(self.path).query)
+        try:
+            # 負の値は先頭から送る（job.events を末尾から数えて切り出さないように）
+            cursor = max(0, int(query.get('from', ['0'])[0] or 0))
+        except ValueError:
+            return self._send_error(400, "from には整数を指定してください")
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            while True:
+                with job.changed:
+                    while cursor >= len(job.events) and not job.finished:
+                        # 接続が切れていないかを確かめるため、一定間隔で空行を送る
+                        if not job.changed.wait(15):
+                            break
+                    indexes = job.events[cursor:]
+                    finished = job.finished and cursor + len(indexes) >= len(job.events)
+                lines = [json.dumps(job.item_view(index), ensure_ascii=False) for index in indexes]
+                cursor += len(indexes)
+                self._write_chunk(("\n".join(lines) + "\n").encode('utf-8'))
+                if finished:
+                    snapshot = job.snapshot()
+                    summary = {key: snapshot[key] for key in ('id', 'state', 'cancelled', 'total', 'counts')}
+                    self._write_chunk((json.dumps(summary, ensure_ascii=False) + "\n").encode('utf-8'))
+                    self._write_chunk(b"")
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description="変換エンジンを起動したまま、HTTPでURL・授業コードのPDF変換を受け付けます")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="待ち受けるアドレス（デフォルト: 127.0.0.1。他のPCから使う場合は 0.0.0.0）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"待ち受けるポート（デフォルト: {DEFAULT_PORT}）")
+    parser.add_argument("--output-dir", default="conversion_server_output",
+                        help="変換したPDFの保存先（ジョブごとのディレクトリを作る）")
+    parser.add_argument("-j", "--workers", type=int, default=2, help="同時に変換する件数（デフォルト: 2）")
+    parser.add_argument("--engine", choices=ENGINE_CHOICES, default=AUTO,
+                        help="PDF変換エンジン。auto は --calibration-url のページで試し変換して最速のものを選ぶ（デフォルト: auto）")
+    parser.add_argument("--calibration-url", action="append", default=[], metavar="URL",
+                        help="--engine auto の試し変換に使うページ（複数指定可。なければ優先順で最初に使えるエンジン）")
+    parser.add_argument("--preset", choices=list(OUTPUT_PRESETS), default=DEFAULT_PRESET,
+                        help="出力サイズのプリセット（デフォルト: default）")
+    parser.add_argument("--cache-dir", help="HTTPキャッシュの保存先（デフォルト: ユーザーのキャッシュディレクトリ）")
+    parser.add_argument("--max-cache-mb", type=float, default=DEFAULT_MAX_CACHE_MB,
+                        help=f"HTTPキャッシュの上限サイズ（MB、デフォルト: {DEFAULT_MAX_CACHE_MB}）")
+    parser.add_argument("--host-limit", action="append", type=parse_host_limit, default=[],
+                        metavar="HOST=RATE[:MAX]",
+                        help="ホストごとの毎秒リクエスト数と最大同時接続数（例: syllabus.u-hyogo.ac.jp=4:6）")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="一時的な通信エラー・5xx・変換エンジンの異常終了時の1件あたりの最大試行回数（デフォルト: 3）")
+    parser.add_argument("--retry-budget", type=int, default=50, help="1ジョブあたりの再試行回数の上限（デフォルト: 50）")
+    parser.add_argument("--job-ttl-minutes", type=float, default=60,
+                        help="終わったジョブとPDFを保持する時間（分、デフォルト: 60）")
+    parser.add_argument("--recycle-after", type=int, default=DEFAULT_RECYCLE_DOCUMENTS, metavar="N",
+                        help=f"WeasyPrintの描画プロセスをN件描画するごとに入れ替える（デフォルト: {DEFAULT_RECYCLE_DOCUMENTS}）")
+    parser.add_argument("--max-worker-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB, metavar="MB",
+                        help=f"描画プロセスのRSSがこれを超えたら入れ替える（デフォルト: {DEFAULT_MAX_RSS_MB}。"
+                             "両方0なら描画プロセスを使わない）")
+    parser.add_argument("--verbose", action="store_true", help="HTTPリクエストを1件ずつ表示する")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers は1以上を指定してください")
+    return args
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+
+    # 接続プール・HTTPキャッシュ・変換エンジンは起動時に1回だけ用意し、全ジョブで使い回す
+    # WeasyPrintの描画プロセスは件数・RSSの上限で入れ替え、長く動かしてもメモリが増え続けないようにする
+    # ジョブのページは信頼できないため、ページからサーバー上のファイル（file:）を読み込ませない
+    http = SharedHTTPSession(pool_size=args.workers + 1, limiter=HostRateLimiter(dict(args.host_limit)))
+    cache = HTTPCache(args.cache_dir, args.max_cache_mb, http=http)
+    try:
+        engine = open_engine(args.engine, args.workers, http=http, cache=cache, sample_urls=args.calibration_url,
+                             fetch=cache.get, preset=args.preset,
+                             process_limits=process_limits(args.recycle_after, args.max_worker_rss_mb),
+                             allow_local_files=False)
+    except RuntimeError as e:
+        print(e)
+        http.close()
+        return
+
+    service = ConversionService(engine, cache, args.output_dir, args.workers, args.job_ttl_minutes * 60,
+                                args.max_attempts, args.retry_budget)
+    server = ThreadingHTTPServer((args.host, args.port), ConversionRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = args.verbose
+    print(f"変換サーバーを起動しました（{time.perf_counter() - started:.1f}秒）: "
+          f"http://{args.host}:{server.server_address[1]}/  エンジン: {engine.label} / ワーカー: {args.workers}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止しています...")
+    finally:
+        server.server_close()
+        service.close()
+        for line in engine.summary():
+            print(line)
+        engine.close()
+        http.close()
+
+if __name__ == "__main__":
+    # 描画プロセスを実行ファイル（PyInstaller）からも起動できるようにする
+    multiprocessing.freeze_support()
+    main()
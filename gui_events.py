@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import time
+import tkinter as tk
+
+# ログ欄に残す行数（古い行から消す。全行はログファイルに残る）
+LOG_VIEW_LINES = 2000
+
+# キューを処理してログ欄・進捗を描き直す間隔（ミリ秒）
+REFRESH_INTERVAL_MS = 100
+
+class GuiEventPump:
+    """ワーカースレッドのログ・進捗をキュー経由でTkのメインループに反映する
+
+    log() と progress() はどのスレッドからでも呼べる。ログは REFRESH_INTERVAL_MS ごとに
+    まとめてログ欄に挿入し、ログ欄は LOG_VIEW_LINES 行までに切り詰める。進捗は最新の
+    値だけを同じ間隔で反映する。ログファイルを開いている間は全行をファイルにも書き出す。
+    """
+
+    def __init__(self, root, log_text, progress_var, progress_bar, max_lines=LOG_VIEW_LINES):
+        self.root = root
+        self.log_text = log_text
+        self.progress_var = progress_var
+        self.progress_bar = progress_bar
+        self.max_lines = max_lines
+        self.log_file = None
+        self._lines = queue.SimpleQueue()
+        self._calls = queue.SimpleQueue()
+        self._progress = {}
+        self._lock = threading.Lock()
+        self.root.after(REFRESH_INTERVAL_MS, self._refresh)
+
+    def log(self, message):
+        with self._lock:
+            if self.log_file is not None:
+                self.log_file.write(message + "\n")
+        self._lines.put(message)
+
+    def progress(self, value=None, text=None, maximum=None):
+        """進捗を更新する（描き直しはメインループで一定間隔ごと）"""
+        with self._lock:
+            if value is not None:
+                self._progress['value'] = value
+            if maximum is not None:
+                self._progress['maximum'] = maximum
+            if text is not None:
+                self._progress['text'] = text
+
+    def call(self, func, *args, **kwargs):
+        """メッセージボックスやボタンの状態変更などをメインループで実行する"""
+        self._calls.put((func, args, kwargs))
+
+    def clear(self):
+        """ログ欄を空にする（メインループから呼ぶ）"""
+        while True:
+            try:
+                self._lines.get_nowait()
+            except queue.Empty:
+                break
+        self.log_text.delete(1.0, tk.END)
+
+    def open_log_file(self, directory, prefix):
+        """全ログを書き出すファイルを出力ディレクトリに作成し、そのパスを返す"""
+        path = os.path.join(directory, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.log")
+        with self._lock:
+            self.log_file = open(path, 'w', encoding='utf-8')
+        return path
+
+    def close_log_file(self):
+        with self._lock:
+            log_file, self.log_file = self.log_file, None
+        if log_file is not None:
+            log_file.close()
+
+    def _refresh(self):
+        try:
+            self._flush_lines()
+            self._apply_progress()
+            while True:
+                try:
+                    func, args, kwargs = self._calls.get_nowait()
+                except queue.Empty:
+                    break
+                func(*args, **kwargs)
+        finally:
+            self.root.after(REFRESH_INTERVAL_MS, self._refresh)
+
+    def _flush_lines(self):
+        lines = []
+        while True:
+            try:
+                lines.append(self._lines.get_nowait())
+            except queue.Empty:
+                break
+        if not lines:
+            return
+
+        # 1回で表示しきれない分はログファイルにだけ残す
+        lines = lines[-self.max_lines:]
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > self.max_lines:
+            self.log_text.delete(1.0, f"{line_count - self.max_lines + 1}.0")
+        self.log_text.see(tk.END)
+
+    def _apply_progress(self):
+        with self._lock:
+            progress, self._progress = self._progress, {}
+        if 'maximum' in progress:
+            self.progress_bar.config(maximum=progress['maximum'])
+        if 'value' in progress:
+            self.progress_bar.config(value=progress['value'])
+        if 'text' in progress:
+            self.progress_var.set(progress['text'])
@@ -0,0 +1,219 @@
+import argparse
+import email.utils
+import threading
+import time
+from urllib.parse import urlsplit
+
+# サーバーが混雑・制限を示すステータス（Retry-Afterが付いていれば従う）
+THROTTLE_STATUSES = (429, 503)
+
+# Retry-Afterで待つ最大秒数（これより長い指定は待たずにそのまま応答を返す）
+MAX_RETRY_AFTER = 60
+
+# 平均応答時間が最速時のこの倍率を超えたら混雑とみなす
+LATENCY_TOLERANCE = 3.0
+
+class HostLimit:
+    """ホストごとのリクエスト制限の設定
+
+    rate: 1秒あたりのリクエスト数の上限（トークンバケットの補充速度、Noneで無制限）
+    max_concurrency: 同時接続数の上限。応答が健全な間は1ずつ増やし、制限応答や
+    エラー・応答時間の悪化があれば半分に減らす（AIMD）。
+    """
+
+    def __init__(self, rate=5.0, max_concurrency=8, min_concurrency=1,
+                 initial_concurrency=2, burst=None):
+        self.rate = rate
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.initial_concurrency = max(self.min_concurrency,
+                                       min(initial_concurrency, self.max_concurrency))
+        self.burst = burst or (max(1.0, rate) if rate else None)
+
+DEFAULT_HOST_LIMITS = {
+    # 全授業コードのリクエストが集中するため控えめな上限から始める
+    'syllabus.u-hyogo.ac.jp': HostLimit(rate=4.0, max_concurrency=6),
+}
+
+def parse_host_limit(value):
+    """--host-limit の値 "ホスト=毎秒件数[:最大同時接続数]" を (ホスト, HostLimit) にする"""
+    host, _, spec = value.partition('=')
+    rate, _, concurrency = spec.partition(':')
+    try:
+        limit = HostLimit(rate=float(rate) or None,
+                          max_concurrency=int(concurrency) if concurrency else HostLimit().max_concurrency)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ホスト=毎秒件数[:最大同時接続数] の形式で指定してください: {value}")
+    if not host:
+        raise argparse.ArgumentTypeError(f"ホスト名がありません: {value}")
+    return host.strip().lower(), limit
+
+def parse_retry_after(value):
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を待ち秒数にする"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+class HostController:
+    """1つのホストに対するトークンバケット＋AIMD同時接続数制御"""
+
+    def __init__(self, host, limit):
+        self.host = host
+        self.limit = limit
+        self.rate = limit.rate
+        self.concurrency = float(limit.initial_concurrency)
+        self.tokens = limit.burst or 0.0
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.successes = 0
+        self.latency_floor = None
+        self.latency_average = None
+        self.last_decrease = 0.0
+        self._last_refill = time.monotonic()
+        self._condition = threading.Condition()
+
+        # 集計
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.waited = 0.0
+        self.peak_concurrency = int(self.concurrency)
+        self._first_started = None
+        self._last_finished = None
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.limit.burst, self.tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """送信してよくなるまで待つ（一時停止中・同時接続数の上限・トークン切れ）"""
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    timeout = self.paused_until - now
+                elif self.in_flight >= int(self.concurrency):
+                    timeout = None
+                elif self.rate and self.tokens < 1:
+                    timeout = (1 - self.tokens) / self.rate
+                else:
+                    break
+                self._condition.wait(timeout)
+
+            if self.rate:
+                self.tokens -= 1
+            self.in_flight += 1
+            self.waited += now - started
+            if self._first_started is None:
+                self._first_started = now
+
+    def release(self, latency, status_code=None, error=False, retry_after=None):
+        """応答結果を反映して同時接続数と送信速度を調整する"""
+        with self._condition:
+            now = time.monotonic()
+            self.in_flight -= 1
+            self.requests += 1
+            self._last_finished = now
+
+            if status_code in THROTTLE_STATUSES:
+                self.throttled += 1
+                if retry_after is not None:
+                    self.paused_until = max(self.paused_until, now + min(retry_after, MAX_RETRY_AFTER))
+                self._decrease(now)
+            elif error or (status_code is not None and status_code >= 500):
+                self.errors += 1
+                self._decrease(now)
+            elif self._latency_rising(latency):
+                self._decrease(now)
+            else:
+                self._increase()
+
+            self._condition.notify_all()
+
+    def _latency_rising(self, latency):
+        if self.latency_floor is None:
+            self.latency_floor = self.latency_average = latency
+            return False
+        self.latency_average += (latency - self.latency_average) * 0.2
+        # 最速値は少しずつ平均に近づけ、一時的に速かった応答に縛られないようにする
+        self.latency_floor = min(latency, self.latency_floor + (self.latency_average - self.latency_floor) * 0.01)
+        return (self.latency_average > self.latency_floor * LATENCY_TOLERANCE
+                and self.latency_average - self.latency_floor > 0.2)
+
+    def _increase(self):
+        self.successes += 1
+        # 現在の同時接続数ぶんの成功が続いたら1つ増やす
+        if self.successes >= int(self.concurrency):
+            self.successes = 0
+            self.concurrency = min(self.limit.max_concurrency, self.concurrency + 1)
+            self.peak_concurrency = max(self.peak_concurrency, int(self.concurrency))
+            if self.rate and self.limit.rate:
+                self.rate = min(self.limit.rate, self.rate + self.limit.rate * 0.1)
+
+    def _decrease(self, now):
+        self.successes = 0
+        # 同時に送っていたリクエストの失敗で何度も半減しないよう、平均応答時間に1回まで
+        if now - self.last_decrease < max(1.0, self.latency_average or 0.0):
+            return
+        self.last_decrease = now
+        self.concurrency = max(self.limit.min_concurrency, self.concurrency / 2)
+        if self.rate:
+            self.rate = max(self.limit.rate * 0.1, self.rate / 2)
+
+    def effective_rate(self):
+        """実際に処理できた1秒あたりのリクエスト数"""
+        if not self.requests or self._last_finished is None:
+            return 0.0
+        elapsed = self._last_finished - self._first_started
+        return self.requests / elapsed if elapsed > 0 else float(self.requests)
+
+    def summary(self):
+        text = (f"{self.host}: {self.effective_rate():.1f}件/秒"
+                f"（同時接続 {int(self.concurrency)}/{self.limit.max_concurrency}、"
+                f"最大 {self.peak_concurrency}、{self.requests}件")
+        if self.throttled:
+            text += f"、制限応答 {self.throttled}件"
+        if self.errors:
+            text += f"、エラー {self.errors}件"
+        if self.waited >= 0.1:
+            text += f"、待機 {self.waited:.1f}秒"
+        return text + "）"
+
+class HostRateLimiter:
+    """ホストごとのHostControllerをまとめる（SharedHTTPSessionに渡して使う）"""
+
+    def __init__(self, limits=None, default=None, throttle_retries=3):
+        self.limits = dict(DEFAULT_HOST_LIMITS)
+        self.limits.update(limits or {})
+        self.default = default or HostLimit()
+        # 429/503にRetry-Afterが付いていた場合、指定時間待ってから送り直す回数
+        self.throttle_retries = throttle_retries
+        self._controllers = {}
+        self._lock = threading.Lock()
+
+    def controller(self, url):
+        host = (urlsplit(url).hostname or '').lower()
+        with self._lock:
+            controller = self._controllers.get(host)
+            if controller is None:
+                controller = HostController(host, self.limits.get(host, self.default))
+                self._controllers[host] = controller
+            return controller
+
+    def summary(self):
+        """リクエストを送ったホストごとの実効レートを返す"""
+        with self._lock:
+            controllers = list(self._controllers.values())
+        return [controller.summary() for controller in controllers if controller.requests]
@@ -0,0 +1,329 @@
+import contextlib
+import functools
+import hashlib
+import html
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from http_session import SharedHTTPSession, parse_content_type
+from retry_policy import ERROR_NOT_FOUND, classify_error
+
+DEFAULT_MAX_CACHE_MB = 500
+
+def default_cache_dir():
+    """ユーザーごとのHTTPキャッシュの既定の保存先"""
+    base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'url_to_pdf', 'http')
+
+# 文字コードを示すBOM（あれば <meta charset> を足さない）
+BOMS = (b'\xef\xbb\xbf', b'\xff\xfe', b'\xfe\xff')
+
+def with_base_href(content, url, charset=None):
+    """相対URLが元のページ基準で解決されるよう、HTML（bytes）に<base>タグを挿入する
+
+    charset（Content-Typeヘッダーの文字コード）を指定すると、文書に <meta charset> もBOMも
+    なければ <meta charset> も挿入する。ファイルから描画するwkhtmltopdfはヘッダーを見られないため、
+    Shift_JISなどをヘッダーだけで宣言したページが文字化けしないようにする。
+    """
+    tags = b''
+    if (charset and re.fullmatch(r'[A-Za-z0-9._:-]+', charset) and not content.startswith(BOMS)
+            and not re.search(rb'<meta[^>]+charset', content, re.I)):
+        tags += b'<meta charset="' + charset.encode('ascii') + b'">'
+    if not re.search(rb'<base[\s>]', content, re.I):
+        tags += b'<base href="' + html.escape(url).encode('ascii', 'xmlcharrefreplace') + b'">'
+    if not tags:
+        return content
+    match = re.search(rb'<head(\s[^>]*)?>', content, re.I)
+    if match:
+        return content[:match.end()] + tags + content[match.end():]
+    return tags + content
+
+@contextlib.contextmanager
+def html_temp_file(content, url, directory=None, charset=None):
+    """取得済みのHTMLを<base>付きで一時ファイル（directory を指定すればその中）に書き出し、そのパスを返す"""
+    fd, path = tempfile.mkstemp(suffix='.html', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(with_base_href(content, url, charset))
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class CachedResponse:
+    """キャッシュまたはネットワークから得たレスポンス"""
+
+    def __init__(self, url, status_code, headers, content, from_cache=False, elapsed=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+        # リクエスト送信から応答ヘッダー受信まで（接続・DNSを含む）の時間
+        self.elapsed = elapsed
+
+    @functools.cached_property
+    def text(self):
+        """本文を推定した文字コードでデコードする（結果は保持して2回目以降は再判定しない）"""
+        from requests.compat import chardet
+        encoding = chardet.detect(self.content)['encoding'] or 'utf-8'
+        return self.content.decode(encoding, errors='replace')
+
+    @property
+    def content_type(self):
+        """Content-Typeヘッダー（保存したヘッダーの大文字・小文字は問わない）"""
+        return next((value for name, value in self.headers.items() if name.lower() == 'content-type'), '')
+
+    @property
+    def mime_type(self):
+        return parse_content_type(self.content_type)[0]
+
+    @property
+    def charset(self):
+        """Content-Typeヘッダーで宣言された文字コード（なければNone）"""
+        return parse_content_type(self.content_type)[1]
+
+class HTTPCache:
+    """ETag / Last-Modified で再検証するディスク上のHTTPレスポンスキャッシュ
+
+    本文・ヘッダー・検証子をURLごとに保存し、次回は If-None-Match /
+    If-Modified-Since を付けて取得する。304が返れば本文はダウンロードしない。
+    合計サイズが上限を超えたら最後に使われた時刻が古いものから削除する。
+    """
+
+    def __init__(self, cache_dir=None, max_mb=DEFAULT_MAX_CACHE_MB, http=None):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.http = http or SharedHTTPSession()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        directory = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(directory, key + '.body'), os.path.join(directory, key + '.json')
+
+    def _entries(self):
+        """(本文のパス, サイズ, 最終使用時刻) を列挙する"""
+        for root, dirs, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith('.body'):
+                    path = os.path.join(root, file)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _load(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as file:
+                meta = json.load(file)
+            with open(body_path, 'rb') as file:
+                content = file.read()
+        except (OSError, ValueError):
+            return None, None
+        return meta, content
+
+    def _store(self, url, response):
+        body_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        # 本文は展開済みで保存するので転送用のヘッダーは残さない
+        headers = {key: value for key, value in response.headers.items()
+                   if key.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        meta = {
+            'url': url,
+            'final_url': response.url,
+            'status_code': response.status_code,
+            'headers': headers,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'stored_at': time.time(),
+        }
+
+        with self._lock:
+            try:
+                previous_size = os.path.getsize(body_path)
+            except OSError:
+                previous_size = 0
+
+            self._write_atomic(body_path, response.content)
+            self._write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+            self._total_bytes += len(response.content) - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _write_atomic(self, path, data):
+        # キャッシュはGUI・CLI・描画プロセスが同時に使うため、一時ファイル名にプロセスIDも含める
+        temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def _evict(self):
+        """最後に使われた時刻が古いエントリから、上限の9割になるまで削除する"""
+        target = self.max_bytes * 0.9
+        for body_path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]):
+            if self._total_bytes <= target:
+                break
+            for path in (body_path, body_path[:-len('.body')] + '.json'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total_bytes -= size
+
+    def _touch(self, url):
+        try:
+            os.utime(self._paths(url)[0])
+        except OSError:
+            pass
+
+    def get(self, url, timeout=30):
+        """URLを取得する。キャッシュ済みで変更がなければ保存済みの本文を返す"""
+        meta, content = self._load(url)
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.http.get(url, headers=headers, timeout=timeout)
+
+        if response.status_code == 304 and meta is not None:
+            self._touch(url)
+            with self._lock:
+                self.hits += 1
+            return CachedResponse(meta['final_url'], meta['status_code'], meta['headers'],
+                                  content, from_cache=True, elapsed=response.elapsed)
+
+        response.raise_for_status()
+        with self._lock:
+            self.misses += 1
+
+        cacheable = (response.status_code == 200
+                     and (response.headers.get('ETag') or response.headers.get('Last-Modified'))
+                     and 'no-store' not in response.headers.get('Cache-Control', '').lower())
+        if cacheable:
+            self._store(url, response)
+
+        return CachedResponse(response.url, response.status_code, dict(response.headers),
+                              response.content, elapsed=response.elapsed)
+
+class MissingResourceError(OSError):
+    """存在しない（404/410）と分かっているサブリソース"""
+
+class _Missing:
+    """LRUに記憶する、存在しないサブリソースのエラーメッセージ"""
+
+    __slots__ = ('message',)
+
+    def __init__(self, message):
+        self.message = message
+
+class ResourceFetcher:
+    """バッチ全体で共有するWeasyPrint用url_fetcher
+
+    スタイルシート・画像・フォントなどのサブリソースをメモリ上のLRUに保持し、
+    同じ資源は1回の実行で1度だけ取得する。disk_cacheを指定すると、メモリにない
+    資源はHTTPCacheで再検証して未変更ならディスクの本文を使う。
+    取得の失敗は404/410だけを記憶し、タイムアウトや5xxは次の文書で取得し直す。
+    allow_local_files が False なら http(s): と data: 以外（file: など）は読み込まない。
+    """
+
+    def __init__(self, http, disk_cache=None, max_items=512, max_mb=64, allow_local_files=True):
+        self.http = http
+        self.disk_cache = disk_cache
+        self.allow_local_files = allow_local_files
+        self.max_items = max_items
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, url, timeout=10, ssl_context=None):
+        if not url.startswith(('http://', 'https://')):
+            if not self.allow_local_files and url[:5].lower() != 'data:':
+                # 信頼できないページから、サーバー上のファイルをPDFに埋め込ませない
+                raise PermissionError(f"ローカルファイルの読み込みは許可されていません: {url[:200]}")
+            # data: や file: はWeasyPrint標準のフェッチャーに任せる
+            from weasyprint import default_url_fetcher
+            return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+
+        with self._lock:
+            entry = self._items.get(url)
+            if entry is not None:
+                self._items.move_to_end(url)
+                self.memory_hits += 1
+        if entry is not None:
+            return self._result(entry)
+
+        try:
+            if self.disk_cache is not None:
+                response = self.disk_cache.get(url, timeout=timeout)
+                from_disk = response.from_cache
+            else:
+                response = self.http.get(url, timeout=timeout)
+                response.raise_for_status()
+                from_disk = False
+            mime_type, charset = parse_content_type(response.headers.get('Content-Type', ''))
+            entry = {
+                'string': response.content,
+                'mime_type': mime_type,
+                'encoding': charset,
+                'redirected_url': response.url,
+            }
+        except Exception as e:
+            with self._lock:
+                self.misses += 1
+                # 存在しない資源だけをバッチ内で記憶し、文書ごとに取得し直さない
+                if classify_error(e) == ERROR_NOT_FOUND:
+                    self._add(url, _Missing(f"{type(e).__name__}: {e}"))
+            raise
+
+        with self._lock:
+            if from_disk:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            self._add(url, entry)
+        return self._result(entry)
+
+    def _result(self, entry):
+        if isinstance(entry, _Missing):
+            # 複数のスレッドで同じ例外オブジェクトを送出しないよう、毎回作り直す
+            raise MissingResourceError(entry.message)
+        return dict(entry)
+
+    def _add(self, url, entry):
+        size = 0 if isinstance(entry, _Missing) else len(entry['string'])
+        if size > self.max_bytes:
+            return
+        old = self._items.pop(url, None)
+        if old is not None and not isinstance(old, _Missing):
+            self._bytes -= len(old['string'])
+        self._items[url] = entry
+        self._bytes += size
+        while len(self._items) > self.max_items or self._bytes > self.max_bytes:
+            _, old = self._items.popitem(last=False)
+            self._bytes -= 0 if isinstance(old, _Missing) else len(old['string'])
+
+    def summary(self):
+        """ヒット・ミスの集計を文字列で返す"""
+        return (f"メモリ {self.memory_hits}件 / ディスク(未変更) {self.disk_hits}件 / "
+                f"ダウンロード {self.misses}件")
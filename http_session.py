@@ -0,0 +1,120 @@
+import functools
+import threading
+import time
+from host_limiter import THROTTLE_STATUSES, MAX_RETRY_AFTER, parse_retry_after
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+@functools.lru_cache(maxsize=None)
+def accept_encoding():
+    """urllib3がデコードできる圧縮形式（brotliがインストールされていればbrを含む）"""
+    from urllib3.util import make_headers
+    return make_headers(accept_encoding=True)['accept-encoding']
+
+def parse_content_type(content_type):
+    """Content-Typeヘッダーから (MIMEタイプ, charset) を取り出す"""
+    mime_type, _, params = content_type.partition(';')
+    charset = None
+    for param in params.split(';'):
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset':
+            charset = value.strip().strip('"\'') or None
+    return mime_type.strip() or None, charset
+
+class SharedHTTPSession:
+    """スレッド間で接続プール（keep-alive）を共有するHTTPセッション
+
+    requests.Sessionはスレッドごとに作成し、接続プールを持つHTTPAdapterだけを
+    共有することで、同一ホストへのTCP/TLS接続を全スレッドで再利用する。
+    limiter（HostRateLimiter）を渡すと、ホストごとの送信速度と同時接続数を調整しながら送る。
+    GUIの起動を遅くしないよう、requestsは最初のセッションを作るときに読み込む。
+    """
+
+    def __init__(self, pool_size=10, max_hosts=10, headers=None, limiter=None):
+        from requests.adapters import HTTPAdapter
+        # pool_size: ホストごとの最大接続数（pool_block=Trueで上限を超える接続は待機させる）
+        self.adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size, pool_block=True)
+        self.headers = {
+            'User-Agent': DEFAULT_USER_AGENT,
+            'Accept-Encoding': accept_encoding(),
+        }
+        if headers:
+            self.headers.update(headers)
+        self.limiter = limiter
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        """呼び出し元スレッド用のrequests.Sessionを返す"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = requests.Session()
+            session.headers.update(self.headers)
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', 30)
+        if self.limiter is None:
+            return self.session.request(method, url, **kwargs)
+
+        from requests import RequestException
+        controller = self.limiter.controller(url)
+        attempt = 0
+        while True:
+            controller.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except BaseException as e:
+                # urllib3 の LocationParseError などrequests以外の例外でも、同時接続の枠を必ず返す
+                # （通信の失敗だけを送信速度を下げる理由にする）
+                controller.release(time.perf_counter() - started, error=isinstance(e, RequestException))
+                raise
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            controller.release(time.perf_counter() - started, response.status_code, retry_after=retry_after)
+
+            # 429/503でRetry-Afterが指定されていれば、ホストの一時停止が明けてから送り直す
+            if (response.status_code not in THROTTLE_STATUSES or retry_after is None
+                    or retry_after > MAX_RETRY_AFTER or attempt >= self.limiter.throttle_retries):
+                return response
+            response.close()
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def url_fetcher(self, url, timeout=10, ssl_context=None):
+        """WeasyPrintのurl_fetcherとして、サブリソースも同じ接続プールで取得する"""
+        if not url.startswith(('http://', 'https://')):
+            # data: や file: はWeasyPrint標準のフェッチャーに任せる
+            from weasyprint import default_url_fetcher
+            return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+
+        response = self.get(url, timeout=timeout)
+        response.raise_for_status()
+        mime_type, charset = parse_content_type(response.headers.get('Content-Type', ''))
+        return {
+            'string': response.content,
+            'mime_type': mime_type,
+            'encoding': charset,
+            'redirected_url': response.url,
+        }
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self.adapter.close()
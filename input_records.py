@@ -0,0 +1,300 @@
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from pdf_engines import (AUTO, ENGINE_CHOICES, OUTPUT_PRESETS, extract_course_id_from_url, sanitize_filename,
+                         syllabus_url)
+
+# 入力の形式（auto は拡張子で判定し、標準入力では先頭行が { か " で始まればJSONL）
+FORMAT_AUTO = 'auto'
+FORMAT_TEXT = 'text'
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+INPUT_FORMATS = (FORMAT_AUTO, FORMAT_TEXT, FORMAT_CSV, FORMAT_JSONL)
+
+# 標準入力から読む場合のファイル名
+STDIN = '-'
+
+# CSVの見出し・JSONLのキーとして使える列名（別名は左の列名として扱う）
+FIELD_ALIASES = {
+    'url': 'url',
+    'course_code': 'course_code',
+    'code': 'course_code',
+    '授業コード': 'course_code',
+    'year': 'year',
+    '年度': 'year',
+    'output': 'output',
+    'filename': 'output',
+    'ファイル名': 'output',
+    'engine': 'engine',
+    'preset': 'preset',
+}
+
+# 重複の判定でメモリに置くキーの上限（超えた分は一時SQLiteに置く）
+MAX_MEMORY_KEYS = 100_000
+
+# 一時SQLiteへの書き込みをまとめてコミットする件数
+SPILL_COMMIT_INTERVAL = 10_000
+
+class InputRecord:
+    """入力の1行（URLまたは授業コードと、行ごとの出力ファイル名・年度・エンジン・プリセット）
+
+    url は授業コードと年度から組み立てたものを含む。行の内容が正しくなければ error に理由が入る。
+    engine・preset は行で指定されたときだけ値が入る（Noneなら実行全体の設定を使う）。
+    """
+
+    __slots__ = ('line', 'url', 'course_code', 'year', 'output', 'engine', 'preset', 'error')
+
+    def __init__(self, line, url=None, course_code=None, year=None, output=None, engine=None, preset=None,
+                 error=None):
+        self.line = line
+        self.url = url
+        self.course_code = course_code
+        self.year = year
+        self.output = output
+        self.engine = engine
+        self.preset = preset
+        self.error = error
+
+    @property
+    def label(self):
+        """ログに表示する名前（授業コードがあれば授業コード、なければURL）"""
+        return self.course_code or self.url or f"{self.line}行目"
+
+    @property
+    def shard_key(self):
+        """--shard の担当を決めるキー（URL。URLのない誤った行は行番号）"""
+        return self.url or str(self.line)
+
+    def filename(self):
+        """出力ファイル名（行で指定されていればそれを、なければ授業コードかURLから作る）"""
+        name = self.output or f"{self.course_code or extract_course_id_from_url(self.url)}.pdf"
+        if not name.lower().endswith('.pdf'):
+            name += '.pdf'
+        return sanitize_filename(name)
+
+# http(s)のURLかどうか（1行ごとに呼ぶため urlparse は使わない）
+URL_PATTERN = re.compile(r'https?://', re.IGNORECASE)
+
+# 授業コードとして受け付ける文字
+COURSE_CODE_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+def _is_url(value):
+    return URL_PATTERN.match(value) is not None
+
+def make_record(line, fields, default_year=None):
+    """列名→値の辞書から InputRecord を作る（値の誤りは error に入れる）"""
+    values = {}
+    for key, value in fields.items():
+        name = FIELD_ALIASES.get(str(key).strip().lower() if key is not None else None)
+        if name is None or value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            values[name] = value
+
+    record = InputRecord(line, output=values.get('output'), engine=values.get('engine'),
+                         preset=values.get('preset'))
+    url = values.get('url')
+    code = values.get('course_code')
+    if url and not _is_url(url):
+        # URL欄に授業コードだけが書かれている場合は授業コードとして扱う
+        url, code = None, code or url
+    elif not url and code and _is_url(code):
+        # 授業コード欄にURLが書かれている場合はURLとして扱う
+        url, code = code, None
+    record.url = url
+    record.course_code = code
+
+    year = values.get('year', default_year)
+    if year is not None:
+        try:
+            record.year = int(year)
+        except ValueError:
+            record.error = f"年度が正しくありません: {year}"
+            return record
+
+    if record.engine is not None and record.engine not in ENGINE_CHOICES:
+        record.error = f"エンジンが正しくありません: {record.engine}（{', '.join(ENGINE_CHOICES)}）"
+    elif record.preset is not None and record.preset not in OUTPUT_PRESETS:
+        record.error = f"プリセットが正しくありません: {record.preset}（{', '.join(OUTPUT_PRESETS)}）"
+    elif record.url is None and record.course_code is None:
+        record.error = "URLも授業コードもありません"
+    elif record.url is None and not COURSE_CODE_PATTERN.fullmatch(record.course_code):
+        record.error = f"URLでも授業コードでもありません: {record.course_code}"
+    elif record.url is None:
+        if record.year is None:
+            record.error = f"授業コード {record.course_code} の年度が指定されていません"
+        else:
+            record.url = syllabus_url(record.course_code, record.year)
+    if record.engine == AUTO:
+        # 行ごとの試し変換はしないため、実行全体のエンジンを使う
+        record.engine = None
+    return record
+
+def _value_record(line, value, default_year):
+    key = 'url' if _is_url(value) else 'course_code'
+    return make_record(line, {key: value}, default_year)
+
+def _open_input(path):
+    if path == STDIN:
+        # 標準入力は行が届いた時点で読み進める（全体を読み込むまで待たない）
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline=''), False
+    return open(path, 'r', encoding='utf-8-sig', newline=''), True
+
+def detect_format(path, first_line=None):
+    """入力の形式を拡張子（標準入力では先頭行）から判定する"""
+    extension = os.path.splitext(path)[1].lower() if path != STDIN else ''
+    if extension in ('.csv', '.tsv'):
+        return FORMAT_CSV
+    if extension in ('.jsonl', '.ndjson'):
+        return FORMAT_JSONL
+    if path == STDIN and first_line is not None and first_line.lstrip()[:1] in ('{', '"'):
+        return FORMAT_JSONL
+    return FORMAT_TEXT
+
+def read_records(path, input_format=FORMAT_AUTO, default_year=None):
+    """URL・授業コードのリストを1行ずつ InputRecord にして返すジェネレーター
+
+    path が '-' なら標準入力から読む。全体を読み込まずに1行ずつ返すため、
+    巨大なリストでも先頭の行からすぐに変換を始められる。空行は飛ばす。
+
+    - text : 1行に1つのURLまたは授業コード
+    - csv  : 見出し行のある CSV（url / course_code / year / output / engine / preset）
+    - jsonl: 1行1つのJSONオブジェクト（キーはCSVの見出しと同じ）または文字列
+    """
+    file, should_close = _open_input(path)
+    try:
+        lines = iter(file)
+        if input_format == FORMAT_AUTO:
+            # 標準入力の形式を先頭行で判定する（読んだ行は戻して使う）
+            first = next(lines, None) if path == STDIN else None
+            input_format = detect_format(path, first)
+            if first is not None:
+                lines = itertools.chain([first], lines)
+
+        if input_format == FORMAT_CSV:
+            dialect = 'excel-tab' if path.lower().endswith('.tsv') else 'excel'
+            reader = csv.DictReader(lines, dialect=dialect)
+            for row in reader:
+                if not any((value or '').strip() for value in row.values() if isinstance(value, str)):
+                    continue
+                yield make_record(reader.line_num, row, default_year)
+            return
+
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if input_format != FORMAT_JSONL:
+                yield _value_record(number, line, default_year)
+                continue
+            try:
+                value = json.loads(line)
+            except ValueError as e:
+                yield InputRecord(number, error=f"JSONとして読めません: {e}")
+                continue
+            if isinstance(value, dict):
+                yield make_record(number, value, default_year)
+            elif isinstance(value, str) and value.strip():
+                yield _value_record(number, value.strip(), default_year)
+            else:
+                yield InputRecord(number, error="JSONオブジェクトか文字列ではありません")
+    finally:
+        if should_close:
+            file.close()
+
+def count_records(path, input_format=FORMAT_AUTO):
+    """進捗表示用に、空行を除いた行数を数える（CSVは見出し行を除く。内容は解釈しない）"""
+    count = 0
+    with open(path, 'rb') as file:
+        for line in file:
+            if line.strip():
+                count += 1
+    if input_format == FORMAT_AUTO:
+        input_format = detect_format(path)
+    if input_format == FORMAT_CSV and count:
+        count -= 1
+    return count
+
+def peek(iterable, count):
+    """先頭の count 件と、それを含めた全体のイテレーターを返す"""
+    iterator = iter(iterable)
+    head = list(itertools.islice(iterator, count))
+    return head, itertools.chain(head, iterator)
+
+class Deduplicator:
+    """一度見たキーを覚えて重複を除く（メモリ使用量に上限あり）
+
+    キーは16バイトのハッシュにして覚える。max_memory_keys 件まではメモリに置き、
+    それを超えた分は一時ファイルのSQLiteに置くため、数百万件のリストでも
+    メモリ使用量はほぼ一定になる。add() ではキーに値（最初の行番号など）を結び付けておける。
+    """
+
+    def __init__(self, max_memory_keys=MAX_MEMORY_KEYS):
+        self.max_memory_keys = max_memory_keys
+        self.count = 0
+        self.duplicates = 0
+        self._memory = {}
+        self._conn = None
+        self._path = None
+        self._uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix='dedupe_', suffix='.sqlite3')
+        os.close(fd)
+        self._conn = sqlite3.connect(self._path, isolation_level=None)
+        # 一時的な表なので、耐障害性より書き込みの速さを優先する
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute("CREATE TABLE seen (digest BLOB PRIMARY KEY, value) WITHOUT ROWID")
+        self._conn.execute("BEGIN")
+
+    def add(self, key, value=True):
+        """キーが初めてならvalueと一緒に覚えてNoneを、2回目以降なら最初に覚えた値を返す"""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        previous = self._memory.get(digest)
+        if previous is not None:
+            self.duplicates += 1
+            return previous
+        if len(self._memory) < self.max_memory_keys:
+            self.count += 1
+            self._memory[digest] = value
+            return None
+
+        if self._conn is None:
+            self._spill()
+        # 挿入できなければ既に覚えているキー
+        if not self._conn.execute("INSERT OR IGNORE INTO seen (digest, value) VALUES (?, ?)",
+                                  (digest, value)).rowcount:
+            self.duplicates += 1
+            return self._conn.execute("SELECT value FROM seen WHERE digest = ?", (digest,)).fetchone()[0]
+        self.count += 1
+        self._uncommitted += 1
+        if self._uncommitted >= SPILL_COMMIT_INTERVAL:
+            self._conn.execute("COMMIT")
+            self._conn.execute("BEGIN")
+            self._uncommitted = 0
+        return None
+
+    def close(self):
+        self._memory.clear()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
@@ -0,0 +1,642 @@
+import importlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+from http_cache import CachedResponse, ResourceFetcher, default_cache_dir, html_temp_file
+from http_session import SharedHTTPSession
+from stage_trace import timed
+from wkhtmltopdf_pool import WkhtmltopdfPool, hidden_startupinfo
+
+# 試し変換で最速のエンジンを選ぶ指定（--engine auto）
+AUTO = 'auto'
+
+# 試し変換に使うページ数
+CALIBRATION_SAMPLE = 3
+
+# 最も小さいPDFを出したエンジンに比べ、平均サイズがこの倍率を超えるエンジンは選ばない
+MAX_SIZE_RATIO = 2.0
+
+# これより小さいPDFは描画に失敗した（白紙など）とみなす
+MIN_PDF_BYTES = 1024
+
+# pdfkit（wkhtmltopdf）のオプション
+PDFKIT_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '0.75in',
+    'margin-right': '0.75in',
+    'margin-bottom': '0.75in',
+    'margin-left': '0.75in',
+    'encoding': "UTF-8",
+    'no-outline': None
+}
+
+# 起動済みwkhtmltopdfの共通オプション（URLと出力パス以外）
+WKHTMLTOPDF_OPTIONS = [
+    "--page-size", "A4",
+    "--orientation", "Portrait",
+    "--margin-top", "0.75in",
+    "--margin-right", "0.75in",
+    "--margin-bottom", "0.75in",
+    "--margin-left", "0.75in",
+    "--encoding", "UTF-8",
+    "--load-error-handling", "ignore",
+    "--load-media-error-handling", "ignore",
+]
+
+# 出力サイズのプリセット
+# image_dpi: 画像をこの解像度まで縮小する / jpeg_quality: 画像のJPEG品質（Noneはエンジンの既定）
+# subset_fonts: 使った文字だけのフォントを埋め込む（False は印刷所などで編集できるよう全体を埋め込む。
+# WeasyPrintのみ。wkhtmltopdfは常にサブセット）。ページ内容のストリームはどのプリセットでも圧縮する
+DEFAULT_PRESET = 'default'
+OUTPUT_PRESETS = {
+    DEFAULT_PRESET: {'image_dpi': None, 'jpeg_quality': None, 'subset_fonts': True},
+    'archive': {'image_dpi': 150, 'jpeg_quality': 80, 'subset_fonts': True},
+    'screen': {'image_dpi': 96, 'jpeg_quality': 60, 'subset_fonts': True},
+    'print': {'image_dpi': 300, 'jpeg_quality': 92, 'subset_fonts': False},
+}
+
+def wkhtmltopdf_preset_options(preset):
+    """プリセットをwkhtmltopdfの引数にする（wkhtmltopdfはフォントを常にサブセットで埋め込む）"""
+    settings = OUTPUT_PRESETS[preset or DEFAULT_PRESET]
+    options = []
+    if settings['image_dpi']:
+        options += ["--image-dpi", str(settings['image_dpi'])]
+    if settings['jpeg_quality']:
+        options += ["--image-quality", str(settings['jpeg_quality'])]
+    return options
+
+def pdfkit_preset_options(preset):
+    """プリセットを反映したpdfkitのオプション"""
+    settings = OUTPUT_PRESETS[preset or DEFAULT_PRESET]
+    options = dict(PDFKIT_OPTIONS)
+    if settings['image_dpi']:
+        options['image-dpi'] = str(settings['image_dpi'])
+    if settings['jpeg_quality']:
+        options['image-quality'] = str(settings['jpeg_quality'])
+    return options
+
+def weasyprint_preset_options(preset):
+    """プリセットをWeasyPrintの write_pdf() のオプションにする"""
+    settings = OUTPUT_PRESETS[preset or DEFAULT_PRESET]
+    options = {'full_fonts': not settings['subset_fonts']}
+    if settings['image_dpi'] or settings['jpeg_quality']:
+        options.update(optimize_images=True, dpi=settings['image_dpi'], jpeg_quality=settings['jpeg_quality'])
+    return options
+
+def sanitize_filename(filename):
+    """ファイル名から無効な文字を削除または置換する"""
+    return re.sub(r'[^a-zA-Z0-9_\-.]', '_', filename)
+
+def syllabus_url(course_code, year):
+    """授業コードと年度からシラバスURLを生成する"""
+    return f"https://syllabus.u-hyogo.ac.jp/slResult/{year}/japanese/syllabusHtml/SyllabusHtml.{year}.{course_code}.html"
+
+def extract_course_id(url):
+    """シラバス形式のURLからコースID（英数字部分）を抽出する（該当しなければNone）"""
+    match = re.search(r'SyllabusHtml\.2025\.([A-Za-z0-9]+)\.html', url)
+    return match.group(1) if match else None
+
+def extract_course_id_from_url(url):
+    """URLからコースIDを抽出する（syllabus形式でなければURLからファイル名を推測する）"""
+    course_id = extract_course_id(url)
+    if course_id:
+        return course_id
+
+    parsed_url = urlparse(url)
+    filename = os.path.basename(parsed_url.path)
+    if filename and filename.endswith('.html'):
+        return filename[:-5]  # .htmlを除去
+    elif filename:
+        return filename
+    else:
+        # パスからファイル名を生成
+        path_parts = [part for part in parsed_url.path.split('/') if part]
+        if path_parts:
+            return path_parts[-1]
+        else:
+            return parsed_url.netloc.replace('.', '_')
+
+def wkhtmltopdf_candidates():
+    """wkhtmltopdfがありそうな場所（確認する順）"""
+    return [
+        r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe",
+        r"C:\Program Files (x86)\wkhtmltopdf\bin\wkhtmltopdf.exe",
+        shutil.which("wkhtmltopdf"),  # PATH環境変数にある場合
+    ]
+
+def wkhtmltopdf_probe_cache_path():
+    """見つけたwkhtmltopdfの場所とバージョンを起動をまたいで保存するファイル"""
+    return os.path.join(os.path.dirname(default_cache_dir()), 'wkhtmltopdf.json')
+
+def _load_probe_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return cached if isinstance(cached, dict) else {}
+
+def _save_probe_cache(cache_path, cached):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(cached, file, ensure_ascii=False)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass
+
+def _wkhtmltopdf_version(path):
+    """wkhtmltopdf --version の出力（実行できなければNone）"""
+    try:
+        result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=5,
+                                startupinfo=hidden_startupinfo())
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or result.stderr.strip()
+
+def probe_wkhtmltopdf(cache_path=None):
+    """wkhtmltopdfの場所とバージョンを返す（見つからなければ (None, None)）
+
+    --version で動くことを確かめた結果は、実行ファイルの更新日時・サイズと一緒に保存する。
+    次回からは更新日時・サイズが変わっていなければ、wkhtmltopdfを起動せずに保存した結果を使う。
+    """
+    cache_path = cache_path or wkhtmltopdf_probe_cache_path()
+    cached = _load_probe_cache(cache_path)
+    for path in wkhtmltopdf_candidates():
+        if not path:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entry = cached.get(path)
+        if isinstance(entry, dict) and entry.get('mtime_ns') == stat.st_mtime_ns and entry.get('size') == stat.st_size:
+            return path, entry.get('version')
+        version = _wkhtmltopdf_version(path)
+        if version is not None:
+            cached[path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'version': version}
+            _save_probe_cache(cache_path, cached)
+            return path, version
+    return None, None
+
+def find_wkhtmltopdf():
+    """wkhtmltopdfの場所を探す（見つからなければNone）"""
+    return probe_wkhtmltopdf()[0]
+
+def fetch_page(http, url, timeout=30):
+    """HTTPキャッシュを使わずにページを取得し、CachedResponseとして返す"""
+    response = http.get(url, timeout=timeout)
+    response.raise_for_status()
+    return CachedResponse(response.url, response.status_code, dict(response.headers),
+                          response.content, elapsed=response.elapsed)
+
+def _first_line(error):
+    return str(error).splitlines()[0] if str(error) else type(error).__name__
+
+class PDFEngine:
+    """PDF変換エンジンの共通インターフェース
+
+    available() で使えるかを確かめ、open() で並列数に合わせて準備してから、
+    render_page() で取得済みのページ（HTTPCacheのCachedResponse）を、render_url() で
+    URLを直接PDFにする。失敗した場合は例外を送出する。終わったら close() を呼ぶ。
+    process_limits は描画プロセスを入れ替える (文書数, RSSの上限MB) で、描画を子プロセスで
+    行えるエンジン（WeasyPrint）だけが使う（Noneなら自プロセスで描画する）。
+    allow_local_files が False なら、ページから file: などのローカルファイルを読み込ませない
+    （信頼できないページを描画する変換サーバー用）。
+    """
+
+    name = None
+    label = None
+    # render_page() の出力先にファイルパスではなくバイナリのファイルオブジェクトも渡せるか
+    renders_to_memory = False
+
+    def __init__(self, http=None, cache=None, preset=None, process_limits=None, allow_local_files=True):
+        self.http = http
+        self.cache = cache
+        self.preset = preset or DEFAULT_PRESET
+        self.process_limits = process_limits
+        self.allow_local_files = allow_local_files
+        # ローカルファイルを読ませない場合に、wkhtmltopdfに渡す一時HTMLだけを置くディレクトリ
+        self.html_dir = None
+        self._own_http = False
+
+    def available(self):
+        """使えなければその理由を、使えればNoneを返す"""
+        return None
+
+    def open(self, concurrency=1):
+        if self.http is None:
+            self.http = SharedHTTPSession(pool_size=concurrency + 1)
+            self._own_http = True
+
+    def render_page(self, page, output_path, timer=None):
+        raise NotImplementedError
+
+    def local_file_options(self):
+        """ローカルファイルを読ませない場合のwkhtmltopdfの引数（一時HTMLのディレクトリだけを許可する）"""
+        if self.allow_local_files:
+            return []
+        if self.html_dir is None:
+            self.html_dir = tempfile.mkdtemp(prefix='url_to_pdf_html_')
+        return ["--disable-local-file-access", "--allow", self.html_dir]
+
+    def render_url(self, url, output_path, timer=None):
+        """URLを取得してPDFにする（取得もエンジンが行う場合は上書きする）"""
+        with timed(timer, 'fetch'):
+            page = fetch_page(self.http, url)
+        if timer is not None:
+            timer.response(page)
+        self.render_page(page, output_path, timer)
+
+    def summary(self):
+        """実行後に表示する集計の行"""
+        return []
+
+    def close(self):
+        if self._own_http:
+            self.http.close()
+            self.http = None
+            self._own_http = False
+        if self.html_dir is not None:
+            shutil.rmtree(self.html_dir, ignore_errors=True)
+            self.html_dir = None
+
+class PdfkitEngine(PDFEngine):
+    """pdfkit（1件ごとにwkhtmltopdfを起動する）"""
+
+    name = 'pdfkit'
+    label = 'pdfkit'
+
+    def available(self):
+        try:
+            import pdfkit
+            pdfkit.configuration()
+        except (ImportError, OSError) as e:
+            return _first_line(e)
+        return None
+
+    def open(self, concurrency=1):
+        # ページの取得もwkhtmltopdfが行うため接続プールは使わない
+        self.options = pdfkit_preset_options(self.preset)
+        local_options = self.local_file_options()
+        if local_options:
+            self.options.update({'disable-local-file-access': None, 'allow': local_options[-1]})
+
+    def render_page(self, page, output_path, timer=None):
+        import pdfkit
+        with timed(timer, 'render'):
+            with html_temp_file(page.content, page.url, self.html_dir, page.charset) as html_path:
+                pdfkit.from_file(html_path, output_path, options=self.options)
+
+    def render_url(self, url, output_path, timer=None):
+        import pdfkit
+        with timed(timer, 'render'):
+            pdfkit.from_url(url, output_path, options=self.options)
+
+class WkhtmltopdfEngine(PDFEngine):
+    """--read-args-from-stdin で起動したままのwkhtmltopdfワーカープール"""
+
+    name = 'wkhtmltopdf'
+    label = 'wkhtmltopdf（起動済みワーカー）'
+
+    def __init__(self, http=None, cache=None, preset=None, timeout=60, process_limits=None, allow_local_files=True):
+        super().__init__(http, cache, preset, process_limits, allow_local_files)
+        self.executable = None
+        self.timeout = timeout
+        self.pool = None
+
+    def available(self):
+        self.executable = find_wkhtmltopdf()
+        return None if self.executable else 'wkhtmltopdf が見つかりません'
+
+    def open(self, concurrency=1):
+        options = WKHTMLTOPDF_OPTIONS + wkhtmltopdf_preset_options(self.preset) + self.local_file_options()
+        self.pool = WkhtmltopdfPool(self.executable, concurrency, options)
+
+    def _convert(self, source, output_path):
+        if not self.pool.convert(source, output_path, timeout=self.timeout):
+            raise RuntimeError("wkhtmltopdfでPDFを作成できませんでした")
+
+    def render_page(self, page, output_path, timer=None):
+        with timed(timer, 'render'):
+            with html_temp_file(page.content, page.url, self.html_dir, page.charset) as html_path:
+                self._convert(html_path, output_path)
+
+    def render_url(self, url, output_path, timer=None):
+        with timed(timer, 'render'):
+            self._convert(url, output_path)
+
+    def summary(self):
+        if self.pool is not None and self.pool.restarts:
+            return [f"応答しなくなったwkhtmltopdfを{self.pool.restarts}回再起動しました"]
+        return []
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        super().close()
+
+class WeasyPrintEngine(PDFEngine):
+    """WeasyPrint（スレッドごとのRenderSessionでサブリソースのキャッシュを共有する）
+
+    process_limits を指定すると、描画は render_workers の子プロセスで行い、
+    指定の文書数を描画するかRSSが上限を超えた描画プロセスを入れ替える。
+    """
+
+    name = 'weasyprint'
+    label = 'WeasyPrint'
+    renders_to_memory = True
+
+    def __init__(self, http=None, cache=None, preset=None, process_limits=None, allow_local_files=True):
+        super().__init__(http, cache, preset, process_limits, allow_local_files)
+        self.pool = None
+
+    def available(self):
+        # 読み込めるかだけを確かめる（pango 等のライブラリがないと OSError になる）
+        try:
+            importlib.import_module('render_session')
+        except (ImportError, OSError) as e:
+            return _first_line(e)
+        return None
+
+    def open(self, concurrency=1):
+        super().open(concurrency)
+        if self.process_limits:
+            from render_workers import MB, RenderProcessPool
+            max_documents, max_rss_mb = self.process_limits
+            self.pool = RenderProcessPool(
+                concurrency, weasyprint_preset_options(self.preset),
+                cache_dir=self.cache.cache_dir if self.cache is not None else None,
+                cache_mb=self.cache.max_bytes / MB if self.cache is not None else None,
+                max_documents=max_documents, max_rss_mb=max_rss_mb, allow_local_files=self.allow_local_files)
+            return
+        self.fetcher = ResourceFetcher(self.http, disk_cache=self.cache, allow_local_files=self.allow_local_files)
+        self._local = threading.local()
+
+    def render_page(self, page, output_path, timer=None):
+        if self.pool is not None:
+            self.pool.render(page.text, page.url, output_path, timer)
+            return
+        from render_session import RenderSession
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = RenderSession(
+                url_fetcher=self.fetcher, pdf_options=weasyprint_preset_options(self.preset))
+        session.render(page.text, page.url, output_path, timer)
+
+    def summary(self):
+        if self.pool is not None:
+            return self.pool.summary()
+        return [f"サブリソース: {self.fetcher.summary()}"]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+        super().close()
+
+# 自動選択で同じ速さだった場合はこの順に優先する
+ENGINES = {engine.name: engine for engine in (WkhtmltopdfEngine, PdfkitEngine, WeasyPrintEngine)}
+
+ENGINE_CHOICES = [AUTO, *ENGINES]
+
+def check_pdf(path):
+    """PDFとして成り立っているか（ヘッダー・終端・最小サイズ）を確かめ、問題があれば理由を返す"""
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            head = file.read(5)
+            file.seek(max(0, size - 1024))
+            tail = file.read()
+    except OSError:
+        return "PDFが作成されていません"
+    if head != b'%PDF-' or b'%%EOF' not in tail:
+        return "PDFの形式が正しくありません"
+    if size < MIN_PDF_BYTES:
+        return f"PDFが小さすぎます（{size}バイト）"
+    return None
+
+def sample_pages(urls, fetch, size=CALIBRATION_SAMPLE):
+    """試し変換に使うページを先頭から取得する（取得できないURLは飛ばす）"""
+    pages = []
+    for tried, url in enumerate(urls):
+        if len(pages) >= size or tried >= size * 3:
+            break
+        try:
+            pages.append(fetch(url))
+        except Exception:
+            continue
+    return pages
+
+def select_engine(engines, pages, log=print, max_size_ratio=MAX_SIZE_RATIO):
+    """open() 済みの各エンジンでサンプルのページを試し変換し、使うエンジンを1つ返す
+
+    全ページを変換でき、PDFが正しく、平均サイズが最小のエンジンの max_size_ratio 倍以内の
+    エンジンのうち、1件あたりの時間が最も短いものを選ぶ。条件を満たすエンジンがなければ
+    最初のエンジンを使う。選ばなかったエンジンは close() する。
+    """
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='engine_calibration_')
+    try:
+        for engine in engines:
+            seconds = 0.0
+            sizes = []
+            problem = None
+            try:
+                # 初回だけかかる初期化（フォント探索など）は計測に含めない
+                engine.render_page(pages[0], os.path.join(work_dir, f"{engine.name}_warmup.pdf"))
+                for n, page in enumerate(pages):
+                    output_path = os.path.join(work_dir, f"{engine.name}_{n}.pdf")
+                    started = time.perf_counter()
+                    engine.render_page(page, output_path)
+                    seconds += time.perf_counter() - started
+                    problem = check_pdf(output_path)
+                    if problem:
+                        break
+                    sizes.append(os.path.getsize(output_path))
+            except Exception as e:
+                problem = _first_line(e)
+            results.append((engine, seconds / len(pages), sum(sizes) / len(sizes) if sizes else 0, problem))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    passed = [result for result in results if result[3] is None]
+    smallest = min((size for _, _, size, _ in passed), default=0)
+    chosen = None
+    for engine, seconds, size, problem in results:
+        if problem is None and smallest and size > smallest * max_size_ratio:
+            problem = f"PDFが大きすぎます（最小の{size / smallest:.1f}倍）"
+        if problem:
+            log(f"  {engine.label}: 除外（{problem}）")
+            continue
+        log(f"  {engine.label}: {seconds:.2f}秒/件、平均 {size / 1024:.0f}KB")
+        if chosen is None or seconds < chosen[1]:
+            chosen = (engine, seconds)
+
+    selected = chosen[0] if chosen else engines[0]
+    if chosen is None:
+        log(f"  試し変換に成功したエンジンがないため {selected.label} を使います")
+    for engine in engines:
+        if engine is not selected:
+            engine.close()
+    return selected
+
+def open_engine(name, concurrency=1, http=None, cache=None, sample_urls=(), fetch=None, log=print,
+                preset=None, process_limits=None, allow_local_files=True):
+    """--engine の指定に従ってエンジンを準備し、open() 済みのエンジンを返す
+
+    'auto' の場合は sample_urls の先頭から CALIBRATION_SAMPLE 件を fetch で取得し、
+    使える全エンジンで試し変換して最速のものを選ぶ（presetを反映した出力で比べる）。
+    指定のエンジンが使えなければ RuntimeError を送出する。
+    process_limits を指定すると、WeasyPrintは入れ替える描画プロセスで描画する。
+    allow_local_files が False なら、どのエンジンもページから file: などを読み込まない。
+    """
+    if name != AUTO:
+        engine = ENGINES[name](http, cache, preset, process_limits=process_limits,
+                               allow_local_files=allow_local_files)
+        reason = engine.available()
+        if reason:
+            raise RuntimeError(f"{engine.label} は使えません: {reason}")
+        engine.open(concurrency)
+        return engine
+
+    log("変換エンジンを試し変換で選択します")
+    candidates = []
+    for engine_class in ENGINES.values():
+        engine = engine_class(http, cache, preset, process_limits=process_limits,
+                              allow_local_files=allow_local_files)
+        reason = engine.available()
+        if reason:
+            log(f"  {engine.label}: 使えません（{reason}）")
+            continue
+        candidates.append(engine)
+    if not candidates:
+        raise RuntimeError("使えるPDF変換エンジンがありません")
+
+    for engine in candidates:
+        engine.open(concurrency)
+    if len(candidates) > 1:
+        sample_http = None
+        if fetch is None:
+            sample_http = http or SharedHTTPSession()
+            fetch = lambda url: fetch_page(sample_http, url)
+        try:
+            pages = sample_pages(sample_urls, fetch)
+        finally:
+            if sample_http is not None and sample_http is not http:
+                sample_http.close()
+        if pages:
+            selected = select_engine(candidates, pages, log)
+        else:
+            log("  試し変換に使えるページを取得できませんでした")
+            selected = candidates[0]
+            for engine in candidates[1:]:
+                engine.close()
+    else:
+        selected = candidates[0]
+    log(f"変換エンジン: {selected.label}")
+    return selected
+
+class PresetReference:
+    """RunManifest.size_summary() の reference：書き出したURLを同じエンジンの default プリセットで描画し直す
+
+    プリセットの削減量は、同じページを default で描画したサイズとの比で見積もる
+    （前回の出力との比較ではページの内容の変化も混ざるため）。
+    """
+
+    def __init__(self, http=None, cache=None):
+        self.http = http
+        self.cache = cache
+
+    def __call__(self, name, preset, urls):
+        if (preset or DEFAULT_PRESET) == DEFAULT_PRESET or not urls:
+            return None
+        try:
+            engine = open_engine(name, http=self.http, cache=self.cache, preset=DEFAULT_PRESET, log=lambda *args: None)
+        except RuntimeError:
+            return None
+        sizes = []
+        work_dir = tempfile.mkdtemp(prefix='preset_reference_')
+        try:
+            for n, url in enumerate(urls):
+                output_path = os.path.join(work_dir, f"{n}.pdf")
+                try:
+                    if self.cache is None:
+                        engine.render_url(url, output_path)
+                    else:
+                        engine.render_page(self.cache.get(url), output_path)
+                    sizes.append(os.path.getsize(output_path))
+                except Exception:
+                    sizes.append(None)
+        finally:
+            engine.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return sizes
+
+class EngineSet:
+    """行ごとに指定されたエンジン・プリセットの組み合わせを、最初に使うときに準備して使い回す
+
+    default は open_engine() で準備済みの実行全体のエンジン。get() でエンジン名・プリセットを
+    省略するとdefaultの設定を使う。準備できない組み合わせは RuntimeError を送出する
+    （2回目以降も同じ理由で失敗する）。
+    """
+
+    def __init__(self, default, concurrency=1, http=None, cache=None, log=print):
+        self.default = default
+        self.concurrency = concurrency
+        self.http = http
+        self.cache = cache
+        self.log = log
+        # 行ごとのエンジンもdefaultと同じく描画プロセスで描画し、ローカルファイルの扱いも合わせる
+        self.process_limits = default.process_limits
+        self.allow_local_files = default.allow_local_files
+        self._engines = {(default.name, default.preset): default}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def get(self, name=None, preset=None):
+        key = (name or self.default.name, preset or self.default.preset)
+        with self._lock:
+            engine = self._engines.get(key)
+            if engine is not None:
+                return engine
+            if key in self._errors:
+                raise RuntimeError(self._errors[key])
+            try:
+                engine = open_engine(key[0], self.concurrency, http=self.http, cache=self.cache, log=self.log,
+                                     preset=key[1], process_limits=self.process_limits,
+                                     allow_local_files=self.allow_local_files)
+            except RuntimeError as e:
+                self._errors[key] = str(e)
+                raise
+            self.log(f"変換エンジンを追加しました: {engine.label}（{key[1]}）")
+            self._engines[key] = engine
+            return engine
+
+    def summary(self):
+        """各エンジンの集計の行（複数使った場合はエンジン名・プリセットを付ける）"""
+        with self._lock:
+            engines = list(self._engines.items())
+        if len(engines) == 1:
+            return engines[0][1].summary()
+        lines = []
+        for (name, preset), engine in engines:
+            lines.extend(f"[{name}/{preset}] {line}" for line in engine.summary())
+        return lines
+
+    def close(self):
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines.clear()
+        for engine in engines:
+            engine.close()
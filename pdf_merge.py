@@ -0,0 +1,234 @@
+import io
+import os
+import threading
+
+try:
+    from pypdf import PdfReader
+    from pypdf.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject,
+                               StreamObject, TextStringObject)
+except ImportError:
+    PdfReader = None
+
+# 親のページツリーから継承される属性（ページ自身になければ書き写す）
+INHERITED_PAGE_KEYS = ('/Resources', '/MediaBox', '/CropBox', '/Rotate')
+
+# 結合PDFの先頭で予約するオブジェクト番号
+CATALOG_ID = 1
+PAGES_ID = 2
+
+def merge_available():
+    """PDFの結合に使えなければその理由を、使えればNoneを返す"""
+    if PdfReader is None:
+        return "PDFの結合には pypdf が必要です（pip install pypdf）"
+    return None
+
+def _inherited(page, key):
+    """ページまたは親のページツリーにある属性を参照を解決せずに返す（なければNone）"""
+    node = page
+    while node is not None:
+        if key in node:
+            return node.raw_get(key)
+        node = node['/Parent'] if '/Parent' in node else None
+    return None
+
+class StreamingPDFMerger:
+    """完成したPDFを1件ずつ結合PDFの末尾に書き足し、追加したPDFごとにしおりを付ける
+
+    追加されたPDFは、各ページから参照されるオブジェクトを番号だけ付け替えてその場で
+    一時ファイルに書き出す。手元に残すのはオブジェクトの位置・ページ番号・しおりだけなので、
+    何件結合してもメモリ使用量はほとんど増えない。close() でページツリー・しおり・
+    相互参照表を書き足し、出力パスに置き換える（途中で中断しても出力パスは壊れない）。
+    """
+
+    def __init__(self, output_path):
+        reason = merge_available()
+        if reason:
+            raise RuntimeError(reason)
+        self.output_path = output_path
+        self.temp_path = os.path.join(os.path.dirname(output_path) or '.',
+                                      f".{os.path.basename(output_path)}.{os.getpid()}.part.pdf")
+        self.titles = set()
+        self.page_count = 0
+        self._pages = []
+        self._bookmarks = []
+        self._offsets = {}
+        self._next_id = PAGES_ID + 1
+        self._lock = threading.Lock()
+        self._file = open(self.temp_path, 'wb')
+        self._file.write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _allocate(self):
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    def append(self, title, source):
+        """PDF（パスまたはbytes）の全ページを末尾に追加し、先頭ページに title のしおりを付ける
+
+        追加したページ数を返す。同じ title は2回目以降を追加せず0を返す。
+        """
+        with self._lock:
+            if title in self.titles:
+                return 0
+            stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, 'rb')
+            with stream:
+                reader = PdfReader(stream)
+                added = self._copy_pages(reader)
+            if added:
+                self.titles.add(title)
+                self._bookmarks.append((title, self._pages[-added]))
+                self.page_count += added
+            return added
+
+    def _copy_pages(self, reader):
+        ids = {}
+        pending = []
+
+        def reference(indirect):
+            key = (indirect.idnum, indirect.generation)
+            if key not in ids:
+                ids[key] = self._allocate()
+                pending.append(indirect)
+            return ids[key]
+
+        # 他のページへのリンクが元のページツリーごと複製されないよう、ページの番号を先に決めておく
+        pages = list(reader.pages)
+        page_ids = []
+        for page in pages:
+            indirect = page.indirect_reference
+            page_ids.append(ids.setdefault((indirect.idnum, indirect.generation), self._allocate()))
+
+        for page, page_id in zip(pages, page_ids):
+            copied = DictionaryObject()
+            for key in page:
+                if key != '/Parent':
+                    copied[NameObject(key)] = page.raw_get(key)
+            for key in INHERITED_PAGE_KEYS:
+                if key not in copied:
+                    value = _inherited(page, key)
+                    if value is not None:
+                        copied[NameObject(key)] = value
+            copied[NameObject('/Parent')] = IndirectObject(PAGES_ID, 0, None)
+            self._write_object(page_id, copied, reference, keep=(PAGES_ID,))
+
+        while pending:
+            indirect = pending.pop()
+            self._write_object(ids[(indirect.idnum, indirect.generation)], indirect.get_object(), reference)
+
+        self._pages.extend(page_ids)
+        return len(page_ids)
+
+    def _write_object(self, object_id, obj, reference, keep=()):
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode())
+        self._serialize(obj, reference, keep)
+        self._file.write(b"\nendobj\n")
+
+    def _serialize(self, obj, reference, keep=()):
+        """オブジェクトを書き出す（元のPDFへの参照は結合PDFの番号に付け替える）"""
+        write = self._file.write
+        if obj is None:
+            write(b"null")
+        elif isinstance(obj, IndirectObject):
+            object_id = obj.idnum if obj.idnum in keep and obj.pdf is None else reference(obj)
+            write(f"{object_id} 0 R".encode())
+        elif isinstance(obj, StreamObject):
+            header = DictionaryObject({key: value for key, value in obj.items() if key != '/Length'})
+            header[NameObject('/Length')] = NumberObject(len(obj._data))
+            self._serialize(header, reference)
+            write(b"\nstream\n")
+            write(obj._data)
+            write(b"\nendstream")
+        elif isinstance(obj, DictionaryObject):
+            write(b"<<")
+            for key, value in obj.items():
+                write(b"\n")
+                NameObject(key).write_to_stream(self._file)
+                write(b" ")
+                self._serialize(value, reference, keep)
+            write(b"\n>>")
+        elif isinstance(obj, ArrayObject):
+            write(b"[")
+            for value in obj:
+                write(b" ")
+                self._serialize(value, reference, keep)
+            write(b" ]")
+        else:
+            obj.write_to_stream(self._file)
+
+    def _write_raw(self, object_id, body):
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def _write_outline(self):
+        """しおり（追加したPDFごとに先頭ページへのリンク）を書き出し、そのオブジェクト番号を返す"""
+        outline_id = self._allocate()
+        item_ids = [self._allocate() for _ in self._bookmarks]
+        for n, ((title, page_id), item_id) in enumerate(zip(self._bookmarks, item_ids)):
+            title_bytes = io.BytesIO()
+            TextStringObject(title).write_to_stream(title_bytes)
+            body = b"<< /Title " + title_bytes.getvalue() + f" /Parent {outline_id} 0 R".encode()
+            if n > 0:
+                body += f" /Prev {item_ids[n - 1]} 0 R".encode()
+            if n + 1 < len(item_ids):
+                body += f" /Next {item_ids[n + 1]} 0 R".encode()
+            body += f" /Dest [{page_id} 0 R /Fit] >>".encode()
+            self._write_raw(item_id, body)
+        self._write_raw(outline_id, f"<< /Type /Outlines /First {item_ids[0]} 0 R /Last {item_ids[-1]} 0 R "
+                                    f"/Count {len(item_ids)} >>".encode())
+        return outline_id
+
+    def close(self):
+        """ページツリー・しおり・相互参照表を書き出して出力パスに置き換える
+
+        1ページも追加されなかった場合は何も作らずFalseを返す。
+        """
+        with self._lock:
+            if self._file is None:
+                return False
+            if not self._pages:
+                self._discard()
+                return False
+
+            kids = " ".join(f"{page_id} 0 R" for page_id in self._pages)
+            self._write_raw(PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode())
+            catalog = f"<< /Type /Catalog /Pages {PAGES_ID} 0 R"
+            if self._bookmarks:
+                catalog += f" /Outlines {self._write_outline()} 0 R /PageMode /UseOutlines"
+            self._write_raw(CATALOG_ID, (catalog + " >>").encode())
+
+            xref_offset = self._file.tell()
+            lines = [f"xref\n0 {self._next_id}\n", "0000000000 65535 f \n"]
+            for object_id in range(1, self._next_id):
+                offset = self._offsets.get(object_id)
+                lines.append(f"{offset:010d} 00000 n \n" if offset is not None else "0000000000 00000 f \n")
+            lines.append(f"trailer\n<< /Size {self._next_id} /Root {CATALOG_ID} 0 R >>\n"
+                         f"startxref\n{xref_offset}\n%%EOF\n")
+            self._file.write("".join(lines).encode())
+            self._file.close()
+            self._file = None
+            os.replace(self.temp_path, self.output_path)
+            return True
+
+    def abort(self):
+        """書きかけの結合PDFを破棄する"""
+        with self._lock:
+            if self._file is not None:
+                self._discard()
+
+    def _discard(self):
+        self._file.close()
+        self._file = None
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
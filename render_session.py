@@ -0,0 +1,67 @@
+from weasyprint import HTML, CSS, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+from stage_trace import timed
+
+# CSS for better PDF formatting
+DEFAULT_STYLESHEET = """
+    @page {
+        size: A4;
+        margin: 2cm;
+    }
+    body {
+        font-family: "Helvetica", "Arial", sans-serif;
+        font-size: 12pt;
+        line-height: 1.4;
+    }
+    table {
+        border-collapse: collapse;
+        width: 100%;
+    }
+    th, td {
+        border: 1px solid #ddd;
+        padding: 8px;
+        text-align: left;
+    }
+    th {
+        background-color: #f2f2f2;
+    }
+"""
+
+class RenderSession:
+    """バッチ全体で使い回すWeasyPrintの描画セッション
+
+    スタイルシートの解析結果、フォント設定（FontConfiguration）、
+    デコード済み画像のキャッシュ、サブリソース用のurl_fetcherを保持し、
+    バッチ内の全文書をこのセッション経由で描画する。
+    """
+
+    def __init__(self, url_fetcher=None, stylesheet=DEFAULT_STYLESHEET, max_cached_images=256,
+                 pdf_options=None):
+        self.url_fetcher = url_fetcher or default_url_fetcher
+        # write_pdf() に渡すオプション（画像の縮小・JPEG品質・フォントのサブセット化）
+        self.pdf_options = pdf_options or {}
+        # フォントの探索は生成時の1回だけ行い、以後の文書で共有する
+        self.font_config = FontConfiguration()
+        self.stylesheets = [CSS(string=stylesheet, font_config=self.font_config)]
+        self.image_cache = {}
+        self.max_cached_images = max_cached_images
+        self.documents = 0
+
+    def render(self, html, base_url, target, timer=None):
+        """HTML文字列をPDFに描画する（targetはパスまたはファイルオブジェクト）
+
+        timer（stage_trace.StageTimer）を渡すと、HTML解析・レイアウト（サブリソースの
+        取得を含む）・PDF生成をそれぞれ 'parse'・'layout'・'pdf' 段階として記録する。
+        """
+        # 画像キャッシュが際限なく大きくならないよう上限で破棄する
+        if len(self.image_cache) > self.max_cached_images:
+            self.image_cache.clear()
+
+        with timed(timer, 'parse'):
+            html_doc = HTML(string=html, base_url=base_url, url_fetcher=self.url_fetcher)
+        with timed(timer, 'layout'):
+            document = html_doc.render(font_config=self.font_config, stylesheets=self.stylesheets,
+                                       cache=self.image_cache)
+        with timed(timer, 'pdf'):
+            document.write_pdf(target, **self.pdf_options)
+        self.documents += 1
@@ -0,0 +1,322 @@
+import io
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+
+# 描画プロセスを入れ替えるまでに描画する文書数と、入れ替えるRSSの上限（MB）の既定値
+DEFAULT_RECYCLE_DOCUMENTS = 500
+DEFAULT_MAX_RSS_MB = 1024
+
+# 1件の描画を待つ秒数（超えたら描画プロセスを止めて入れ替える）
+DEFAULT_RENDER_TIMEOUT = 300
+
+# 描画プロセスの起動（WeasyPrintの読み込み・フォントの探索）を待つ秒数
+STARTUP_TIMEOUT = 120
+
+MB = 1024 * 1024
+
+# RenderWorker.render() の戻り値：描画プロセスが異常終了した / 時間内に応答しなかった
+DIED = 'died'
+TIMED_OUT = 'timed_out'
+
+def process_limits(recycle_after, max_rss_mb):
+    """--recycle-after / --max-worker-rss-mb の指定を open_engine() の process_limits にする
+
+    どちらも0なら描画プロセスを使わず、自プロセスで描画する（None を返す）。
+    """
+    if not recycle_after and not max_rss_mb:
+        return None
+    return recycle_after, max_rss_mb
+
+def memory_usage():
+    """自プロセスの (現在のRSS, これまでの最大RSS) をバイトで返す（測れなければ None）
+
+    psutil があれば使い、なければ Windows は GetProcessMemoryInfo、
+    Linux は /proc/self/statm と getrusage で測る。
+    """
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return info.rss, getattr(info, 'peak_wset', None) or _peak_rss() or info.rss
+    except ImportError:
+        pass
+
+    if os.name == 'nt':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize, counters.PeakWorkingSetSize
+
+    try:
+        with open('/proc/self/statm') as file:
+            rss = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+    return rss, max(rss, _peak_rss() or 0)
+
+def _peak_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux はKB、macOS はバイト単位
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def _worker_main(connection, pdf_options, cache_dir, cache_mb, allow_local_files=True):
+    """描画プロセスの本体：(HTML, ベースURL, 出力パス) を受け取って描画し、結果を返す
+
+    出力パスが None ならPDFのバイト列を返す。None を受け取るか親との接続が切れたら終了する。
+    """
+    # WeasyPrintの読み込みとフォントの探索は描画プロセスの起動時に1回だけ行う
+    from http_cache import HTTPCache, ResourceFetcher
+    from http_session import SharedHTTPSession
+    from render_session import RenderSession
+    from stage_trace import StageTimer
+
+    http = SharedHTTPSession(pool_size=2)
+    disk_cache = HTTPCache(cache_dir, cache_mb, http=http) if cache_dir else None
+    fetcher = ResourceFetcher(http, disk_cache=disk_cache, allow_local_files=allow_local_files)
+    session = RenderSession(url_fetcher=fetcher, pdf_options=pdf_options)
+    connection.send('ready')
+    try:
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                return
+            if request is None:
+                return
+            html, base_url, output_path = request
+            timer = StageTimer(base_url)
+            try:
+                target = io.BytesIO() if output_path is None else output_path
+                session.render(html, base_url, target, timer)
+                data = target.getvalue() if output_path is None else None
+                connection.send(('ok', data, timer.stages, memory_usage()))
+            except Exception as e:
+                connection.send(('error', f"{type(e).__name__}: {e}", timer.stages, memory_usage()))
+    finally:
+        http.close()
+
+class WorkerStats:
+    """1つの描画ワーカー（入れ替えた描画プロセスを含む）の件数とRSSの集計"""
+
+    def __init__(self, index):
+        self.index = index
+        self.documents = 0
+        self.processes = 0
+        self.recycled = {}
+        self.peak_rss = 0
+        self.rss_total = 0
+        self.rss_samples = 0
+
+    def sample(self, usage):
+        if usage is None:
+            return
+        rss, peak = usage
+        self.peak_rss = max(self.peak_rss, peak, rss)
+        self.rss_total += rss
+        self.rss_samples += 1
+
+    def summary(self):
+        line = f"描画プロセス{self.index + 1}: {self.documents}件"
+        if self.recycled:
+            reasons = '、'.join(f"{reason} {count}回" for reason, count in self.recycled.items())
+            line += f"（入れ替え: {reasons}）"
+        if self.rss_samples:
+            line += (f" / RSS ピーク {self.peak_rss / MB:.0f}MB・"
+                     f"平均 {self.rss_total / self.rss_samples / MB:.0f}MB")
+        return line
+
+class RenderWorker:
+    """WeasyPrintで描画する子プロセス1つ（max_documents 件・max_rss_mb を超えたら入れ替える）"""
+
+    def __init__(self, index, pool):
+        self.pool = pool
+        self.stats = WorkerStats(index)
+        self.process = None
+        self.connection = None
+        self.ready = False
+        self.documents = 0
+
+    def start(self):
+        parent, child = self.pool.context.Pipe()
+        self.process = self.pool.context.Process(
+            target=_worker_main, args=(child, self.pool.pdf_options, self.pool.cache_dir, self.pool.cache_mb,
+                                       self.pool.allow_local_files),
+            daemon=True)
+        self.process.start()
+        child.close()
+        self.connection = parent
+        self.ready = False
+        self.documents = 0
+        self.stats.processes += 1
+
+    def stop(self, kill=False):
+        if self.process is None:
+            return
+        try:
+            if not kill:
+                self.connection.send(None)
+                self.process.join(5)
+        except (OSError, EOFError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+        self.process = None
+        self.connection = None
+
+    def recycle(self, reason):
+        """次の描画プロセスを起動してから、今の描画プロセスを終了させる"""
+        self.stats.recycled[reason] = self.stats.recycled.get(reason, 0) + 1
+        old_process, old_connection = self.process, self.connection
+        self.start()
+        try:
+            old_connection.send(None)
+        except OSError:
+            pass
+        # 終了を待たずに次の描画へ進み、終わったプロセスは後で回収する
+        self.pool.retire(old_process, old_connection)
+
+    def render(self, html, base_url, output_path, timeout):
+        """1件描画し、('ok' か 'error', PDFのバイト列, 段階ごとの秒数) を返す
+
+        描画プロセスが異常終了したら DIED を、timeout 秒以内に応答しなければ TIMED_OUT を返す。
+        """
+        if self.process is None:
+            self.start()
+        try:
+            self.connection.send((html, base_url, output_path))
+            # 起動直後の描画プロセスは、準備ができてから描画の時間を計り始める
+            if not self.ready:
+                if not self.connection.poll(STARTUP_TIMEOUT) or self.connection.recv() != 'ready':
+                    return DIED
+                self.ready = True
+            if not self.connection.poll(timeout):
+                return TIMED_OUT
+            status, data, stages, usage = self.connection.recv()
+        except (EOFError, OSError):
+            return DIED
+        self.documents += 1
+        self.stats.documents += 1
+        self.stats.sample(usage)
+
+        pool = self.pool
+        if pool.max_rss_mb and usage is not None and usage[0] > pool.max_rss_mb * MB:
+            self.recycle("RSS上限")
+        elif pool.max_documents and self.documents >= pool.max_documents:
+            self.recycle("件数")
+        return status, data, stages
+
+class RenderProcessPool:
+    """WeasyPrintの描画をN個の子プロセスで行うプール
+
+    長い表のレイアウトなどで描画プロセスのメモリが増えていくため、max_documents 件描画するか
+    RSS が max_rss_mb を超えたら、次の描画プロセスを起動してから古いものを終了させる。
+    描画中に描画プロセスが異常終了した文書は、新しい描画プロセスで1回だけ描画し直す。
+    サブリソースは描画プロセスごとに取得する（cache_dir を指定するとディスクのHTTPキャッシュを共有する）。
+    allow_local_files が False なら、描画プロセスは file: などのローカルファイルを読み込まない。
+    """
+
+    def __init__(self, size, pdf_options=None, cache_dir=None, cache_mb=None, max_documents=DEFAULT_RECYCLE_DOCUMENTS,
+                 max_rss_mb=DEFAULT_MAX_RSS_MB, timeout=DEFAULT_RENDER_TIMEOUT, allow_local_files=True):
+        # GUIのスレッドがある親プロセスを fork しないよう、どのOSでも spawn で起動する
+        self.context = multiprocessing.get_context('spawn')
+        self.pdf_options = pdf_options or {}
+        self.cache_dir = cache_dir
+        self.cache_mb = cache_mb
+        self.max_documents = max_documents
+        self.max_rss_mb = max_rss_mb
+        self.timeout = timeout
+        self.allow_local_files = allow_local_files
+        self.restarts = 0
+        self.retired = []
+        self._lock = threading.Lock()
+        self.workers = [RenderWorker(index, self) for index in range(max(1, size))]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            worker.start()
+            self._idle.put(worker)
+
+    def render(self, html, base_url, target, timer=None):
+        """HTMLを描画して target（パスまたはバイナリのファイルオブジェクト）に書き出す"""
+        output_path = target if isinstance(target, (str, os.PathLike)) else None
+        worker = self._idle.get()
+        try:
+            for _ in range(2):
+                result = worker.render(html, base_url, output_path, self.timeout)
+                if result not in (DIED, TIMED_OUT):
+                    break
+                # 異常終了・無応答の描画プロセスは破棄し、新しい描画プロセスに引き継ぐ
+                reason = "無応答" if result == TIMED_OUT else "異常終了"
+                worker.stop(kill=True)
+                worker.stats.recycled[reason] = worker.stats.recycled.get(reason, 0) + 1
+                with self._lock:
+                    self.restarts += 1
+                worker.start()
+                if result == TIMED_OUT:
+                    # 無応答はこの文書が原因の可能性が高いため、描画し直さない
+                    raise RuntimeError(f"描画が{self.timeout}秒以内に終わりませんでした")
+            else:
+                raise RuntimeError("描画プロセスが異常終了しました")
+        finally:
+            self._idle.put(worker)
+            self._reap()
+
+        status, data, stages = result
+        if timer is not None:
+            for name, seconds in stages.items():
+                timer.stages[name] = timer.stages.get(name, 0.0) + seconds
+        if status != 'ok':
+            raise RuntimeError(data)
+        if output_path is None:
+            target.write(data)
+
+    def retire(self, process, connection):
+        with self._lock:
+            self.retired.append((process, connection))
+
+    def _reap(self):
+        """入れ替えで終了させた描画プロセスのうち、終わったものを回収する"""
+        with self._lock:
+            retired, self.retired = self.retired, []
+        for process, connection in retired:
+            if process.is_alive():
+                with self._lock:
+                    self.retired.append((process, connection))
+                continue
+            process.join()
+            connection.close()
+
+    def summary(self):
+        """描画プロセスごとの件数・入れ替え回数・RSSのピークと平均"""
+        return [worker.stats.summary() for worker in self.workers]
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+        with self._lock:
+            retired, self.retired = self.retired, []
+        for process, connection in retired:
+            process.join(5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            connection.close()
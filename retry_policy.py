@@ -0,0 +1,182 @@
+import collections
+import heapq
+import random
+import socket
+import subprocess
+import threading
+import time
+
+# 失敗の分類
+ERROR_TRANSIENT = 'transient'    # タイムアウト・接続リセットなどの一時的な通信エラー
+ERROR_SERVER = 'server'          # 5xx
+ERROR_NOT_FOUND = 'not_found'    # 404/410（再試行しても変わらない）
+ERROR_RENDERER = 'renderer'      # wkhtmltopdf・WeasyPrintの異常終了
+ERROR_OTHER = 'other'            # 上記以外（再試行しない）
+
+ERROR_LABELS = {
+    ERROR_TRANSIENT: '一時的な通信エラー',
+    ERROR_SERVER: 'サーバーエラー(5xx)',
+    ERROR_NOT_FOUND: 'ページが存在しない(404)',
+    ERROR_RENDERER: 'PDF変換エンジンの異常終了',
+    ERROR_OTHER: 'その他のエラー',
+}
+
+RETRYABLE_ERRORS = frozenset((ERROR_TRANSIENT, ERROR_SERVER, ERROR_RENDERER))
+
+# wkhtmltopdfのエラー出力に現れるQtのネットワークエラー名など
+_MESSAGE_MARKERS = (
+    (ERROR_NOT_FOUND, ('ContentNotFoundError', 'ContentGoneError', '404 Not Found')),
+    (ERROR_SERVER, ('InternalServerError', 'ServiceUnavailableError', 'UnknownServerError')),
+    (ERROR_TRANSIENT, ('TimeoutError', 'HostNotFoundError', 'ConnectionRefusedError',
+                       'RemoteHostClosedError', 'TemporaryNetworkFailureError',
+                       'NetworkSessionFailedError', 'UnknownNetworkError',
+                       'timed out', 'Connection reset')),
+    (ERROR_RENDERER, ('wkhtmltopdf', 'Segmentation fault', 'Exit with code')),
+)
+
+def classify_status(status_code):
+    """HTTPステータスコードを失敗の分類にする"""
+    if status_code in (404, 410):
+        return ERROR_NOT_FOUND
+    if status_code in (408, 429):
+        return ERROR_TRANSIENT
+    if status_code >= 500:
+        return ERROR_SERVER
+    return ERROR_OTHER
+
+def classify_error(error, default=ERROR_OTHER):
+    """例外またはエラーメッセージを失敗の分類にする
+
+    描画中の例外のように原因が分かっている場合は default で分類を指定する。
+    """
+    import requests
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return classify_status(error.response.status_code)
+    if isinstance(error, (requests.Timeout, requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                          ConnectionError, TimeoutError, socket.timeout)):
+        return ERROR_TRANSIENT
+    if isinstance(error, subprocess.TimeoutExpired):
+        return ERROR_RENDERER
+
+    message = str(error)
+    for error_class, markers in _MESSAGE_MARKERS:
+        if any(marker in message for marker in markers):
+            return error_class
+    return default
+
+def summarize_failures(error_classes):
+    """最終的に失敗した件数を分類ごとに数え、表示用の行を返す"""
+    counts = collections.Counter(error_classes)
+    return [f"{ERROR_LABELS[error_class]}: {counts[error_class]}件"
+            for error_class in ERROR_LABELS if counts[error_class]]
+
+class RetryPolicy:
+    """分類に応じた再試行の判断と、実行全体で共有する再試行回数の予算
+
+    待ち時間は指数バックオフの半分を固定、残り半分をランダムにする（同時に失敗した
+    リクエストが一斉に送り直されないようにする）。
+    """
+
+    def __init__(self, max_attempts=3, budget=50, base_delay=2.0, max_delay=60.0):
+        self.max_attempts = max(1, max_attempts)
+        self.budget = max(0, budget)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.budget_exhausted = 0
+        self._lock = threading.Lock()
+
+    def next_delay(self, error_class, attempt):
+        """attempt回目の試行が失敗した後、再試行するなら待ち秒数を、しないならNoneを返す"""
+        if error_class not in RETRYABLE_ERRORS or attempt >= self.max_attempts:
+            return None
+        with self._lock:
+            if self.retries >= self.budget:
+                self.budget_exhausted += 1
+                return None
+            self.retries += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+class RetryQueue:
+    """再試行を待ち時間付きで末尾に戻せる作業キュー
+
+    get() で取り出した項目は、task_done() で完了するか retry() で再投入するまで
+    処理中として数える。未処理・待機中・処理中の項目がすべてなくなるか、close()
+    されると get() は None を返す。待機中の項目がある間も、他の項目は取り出せる。
+    入力を読みながら put() する場合は more_input=True で作り、読み終えたら end_input() を呼ぶ
+    （それまでは項目がなくなっても get() は次の項目を待つ）。
+    """
+
+    def __init__(self, items=(), more_input=False):
+        self._ready = collections.deque(items)
+        self._delayed = []
+        self._sequence = 0
+        self._in_progress = 0
+        self._more_input = more_input
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, item, delay=None):
+        """項目を末尾に追加する（delayを指定するとその秒数が経ってから取り出せる）"""
+        with self._condition:
+            if delay:
+                self._sequence += 1
+                heapq.heappush(self._delayed, (time.monotonic() + delay, self._sequence, item))
+            else:
+                self._ready.append(item)
+            self._condition.notify_all()
+
+    def retry(self, item, delay):
+        """処理中の項目を完了扱いにし、delay秒後に末尾へ戻す"""
+        self.put(item, delay)
+        self.task_done()
+
+    def task_done(self):
+        with self._condition:
+            self._in_progress -= 1
+            self._condition.notify_all()
+
+    def end_input(self):
+        """これ以上 put() しないことを知らせる（残りの項目がなくなれば get() は None を返す）"""
+        with self._condition:
+            self._more_input = False
+            self._condition.notify_all()
+
+    def wait_for_room(self, limit):
+        """未処理・待機中・処理中の項目数の合計が limit 未満になるまで待つ（close() されたらFalseを返す）
+
+        入力を読みながら put() する側が、先読みしすぎないように呼ぶ。
+        """
+        with self._condition:
+            while not self._closed and len(self._ready) + len(self._delayed) + self._in_progress >= limit:
+                self._condition.wait()
+            return not self._closed
+
+    def close(self):
+        """残りの項目を破棄し、待機中の get() を終了させる"""
+        with self._condition:
+            self._closed = True
+            self._ready.clear()
+            self._delayed.clear()
+            self._condition.notify_all()
+
+    def get(self):
+        with self._condition:
+            while not self._closed:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    self._ready.append(heapq.heappop(self._delayed)[2])
+                if self._ready:
+                    self._in_progress += 1
+                    return self._ready.popleft()
+                if not self._delayed and not self._in_progress and not self._more_input:
+                    return None
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._condition.wait(timeout)
+            return None
+
+    def waiting(self):
+        """再試行の待ち時間中の項目数"""
+        with self._condition:
+            return len(self._delayed)
@@ -0,0 +1,368 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# 出力ディレクトリに置くマニフェストのファイル名
+MANIFEST_FILENAME = ".conversion_manifest.sqlite3"
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# 他のノードの確保をこの秒数で期限切れとみなす（確保したまま停止したPCの分を引き継ぐ）
+CLAIM_STALE_SECONDS = 30 * 60
+
+# プリセットの削減量を見積もるため、default プリセットでも描画し直す件数（エンジン・プリセットごと）
+PRESET_REFERENCE_SAMPLE = 3
+
+def file_sha256(path):
+    """ファイルのSHA-256を計算する"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def measure_write_speed(directory, size=4 * 1024 * 1024):
+    """ディレクトリへの書き込み速度（バイト/秒）をfsync込みで測る（測れなければNone）"""
+    path = os.path.join(directory, f".write_speed.{os.getpid()}.tmp")
+    chunk = os.urandom(1024 * 1024)
+    try:
+        started = time.perf_counter()
+        with open(path, 'wb') as file:
+            for _ in range(max(1, size // len(chunk))):
+                file.write(chunk)
+            file.flush()
+            os.fsync(file.fileno())
+        elapsed = time.perf_counter() - started
+    except OSError:
+        return None
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return max(1, size // len(chunk)) * len(chunk) / elapsed if elapsed > 0 else None
+
+def rendered_with(engine):
+    """描画に使った変換エンジンとプリセットを、マニフェストに記録する文字列にする（不明ならNone）"""
+    if engine is None:
+        return None
+    return f"{engine.name}/{engine.preset}"
+
+@contextlib.contextmanager
+def temporary_output(output_path):
+    """出力先と同じディレクトリの一時ファイルパスを返し、終了時に残っていれば削除する
+
+    変換が成功したときだけ呼び出し側で os.replace して出力パスに置き換えるため、
+    途中で中断しても壊れたPDFが出力パスに残らない。
+    """
+    directory, filename = os.path.split(output_path)
+    temp_path = os.path.join(directory, f".{filename}.{os.getpid()}-{threading.get_ident()}.part.pdf")
+    try:
+        yield temp_path
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+class RunManifest:
+    """変換対象ごとの状態をSQLiteに記録し、スキップ・再開の判定に使うマニフェスト
+
+    出力パス（マニフェストからの相対パス）をキーに、URL・授業コード・状態・試行回数・
+    所要時間・出力サイズ・SHA-256を保存する。スキップ判定は statuses() でまとめて
+    取得した状態か、大きな入力では対象ごとの status() を使う。完了済みの対象は
+    should_convert() が出力ファイルの有無を os.path.exists で確かめ、消えていれば変換し直す。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        self._lock = threading.Lock()
+        # ネットワーク共有上でも使えるよう、WALではなく既定のジャーナルモードを使う
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # 今回書き出したPDFの件数・合計サイズと、(エンジン名, プリセット) ごとの
+        # [件数, 合計サイズ, 先頭 PRESET_REFERENCE_SAMPLE 件の (URL, サイズ)]
+        self.written_count = 0
+        self.written_bytes = 0
+        self.written_by_preset = {}
+        # 複数のPCで分担する場合のノード名（start() で記録し、確保に使う）
+        self.node = None
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    output_path TEXT PRIMARY KEY,
+                    url TEXT,
+                    course_code TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    duration REAL,
+                    output_size INTEGER,
+                    sha256 TEXT,
+                    error TEXT,
+                    updated_at REAL,
+                    content_hash TEXT,
+                    error_class TEXT,
+                    node TEXT,
+                    rendered_with TEXT
+                )""")
+            # 以前のバージョンで作成したマニフェストに列を追加する
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(items)")]
+            for column in ('content_hash', 'error_class', 'node', 'rendered_with'):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE items ADD COLUMN {column} TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS items_content_hash ON items (content_hash)")
+            # 存在しないと確認したURL（次回以降は有効期限内なら取得・描画せずにスキップする）
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS missing (
+                    url TEXT PRIMARY KEY,
+                    status_code INTEGER,
+                    checked_at REAL NOT NULL
+                )""")
+            # 複数のPCで分担する場合に、変換中の出力先を確保したノード
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS claims (
+                    output_path TEXT PRIMARY KEY,
+                    node TEXT NOT NULL,
+                    claimed_at REAL NOT NULL
+                )""")
+
+    @classmethod
+    def for_directory(cls, directory):
+        """ディレクトリ直下のマニフェストを開く（なければ作成する）"""
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, MANIFEST_FILENAME))
+
+    def key(self, output_path):
+        return os.path.relpath(os.path.abspath(output_path), self.base_dir).replace(os.sep, '/')
+
+    def statuses(self):
+        """全対象の {キー: 状態} を1回のクエリで取得する"""
+        with self._lock:
+            return dict(self.conn.execute("SELECT output_path, status FROM items"))
+
+    def status(self, output_path):
+        """1件の状態を返す（記録がなければNone）
+
+        巨大な入力を1行ずつ処理する場合に、statuses() で全件を読み込まずに使う。
+        """
+        return self.state(output_path)[0]
+
+    def state(self, output_path):
+        """1件の (状態, 失敗の分類) を返す（記録がなければ (None, None)）"""
+        with self._lock:
+            row = self.conn.execute("SELECT status, error_class FROM items WHERE output_path = ?",
+                                    (self.key(output_path),)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def content_hashes(self):
+        """全対象の {キー: 前回描画したHTMLの内容ハッシュ} を1回のクエリで取得する"""
+        with self._lock:
+            return dict(self.conn.execute(
+                "SELECT output_path, content_hash FROM items WHERE content_hash IS NOT NULL"))
+
+    def content_hash(self, output_path, engine=None):
+        """1件の前回描画したHTMLの内容ハッシュを返す（なければNone）
+
+        前回と変換エンジン・プリセットが違う場合も、描画し直すためNoneを返す。
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT content_hash FROM items WHERE output_path = ? AND rendered_with IS ?",
+                                    (self.key(output_path), rendered_with(engine))).fetchone()
+        return row[0] if row else None
+
+    def find_by_content_hash(self, content_hash, engine=None):
+        """同じ内容ハッシュを同じ変換エンジン・プリセットで描画済みの出力ファイルのパスを返す（なければNone）"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT output_path FROM items WHERE content_hash = ? AND rendered_with IS ? AND status = ? LIMIT 1",
+                (content_hash, rendered_with(engine), STATUS_DONE)).fetchone()
+        return os.path.join(self.base_dir, row[0]) if row else None
+
+    def missing_urls(self, ttl):
+        """存在しないと確認してからttl秒以内のURLの {URL: 確認時刻} を返す"""
+        with self._lock:
+            return dict(self.conn.execute(
+                "SELECT url, checked_at FROM missing WHERE checked_at >= ?", (time.time() - ttl,)))
+
+    def mark_missing(self, url, status_code):
+        """URLが存在しない（404など）ことを記録する"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO missing (url, status_code, checked_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET status_code = excluded.status_code, "
+                "checked_at = excluded.checked_at",
+                (url, status_code, time.time()))
+
+    def should_convert(self, status, resume=False, retry_failed=False, output_path=None):
+        """マニフェスト上の状態から、今回変換するかどうかを判定する
+
+        - 既定: 完了済み以外を変換する
+        - resume: 未着手・中断したものだけを変換し、失敗済みは飛ばす
+        - retry_failed: 失敗したもの（中断したものを含む）だけを変換する
+
+        output_path を渡すと、完了済みでも出力ファイルが削除されていれば未着手として扱う
+        （できの悪いPDFを削除して変換し直せるように）。
+        """
+        if status == STATUS_DONE:
+            if output_path is None or os.path.exists(output_path):
+                return False
+            status = None
+        if retry_failed:
+            return status in (STATUS_FAILED, STATUS_RUNNING)
+        if resume:
+            return status != STATUS_FAILED
+        return True
+
+    def _upsert(self, output_path, url, course_code, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(fields)
+        placeholders = ', '.join('?' for _ in fields)
+        updates = ', '.join(f"{column} = excluded.{column}" for column in fields)
+        with self._lock, self.conn:
+            self.conn.execute(
+                f"INSERT INTO items (output_path, url, course_code, {columns}) VALUES (?, ?, ?, {placeholders}) "
+                f"ON CONFLICT (output_path) DO UPDATE SET url = excluded.url, "
+                f"course_code = COALESCE(excluded.course_code, course_code), {updates}",
+                (self.key(output_path), url, course_code, *fields.values()))
+
+    def mark_existing(self, output_path, url=None, course_code=None):
+        """マニフェスト導入前に作られた出力ファイルを完了済みとして登録する"""
+        self._upsert(output_path, url, course_code, status=STATUS_DONE,
+                     output_size=os.path.getsize(output_path))
+
+    def start(self, output_path, url=None, course_code=None):
+        """変換開始を記録する（試行回数を1増やす）"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO items (output_path, url, course_code, status, attempts, updated_at, node) "
+                "VALUES (?, ?, ?, ?, 1, ?, ?) "
+                "ON CONFLICT (output_path) DO UPDATE SET status = excluded.status, "
+                "attempts = attempts + 1, url = excluded.url, "
+                "course_code = COALESCE(excluded.course_code, course_code), updated_at = excluded.updated_at, "
+                "node = excluded.node",
+                (self.key(output_path), url, course_code, STATUS_RUNNING, time.time(), self.node))
+
+    def claim(self, output_path, since=None):
+        """複数のPCで分担する場合に、変換を始める前に出力先を確保する
+
+        他のノードが確保中か、since（この実行の開始時刻）以降に他のノードが
+        変換・記録した出力先は確保せずにFalseを返す。CLAIM_STALE_SECONDS より前の
+        確保は停止したノードのものとみなして引き継ぐ。変換が終わったら release() を呼ぶ。
+        """
+        key = self.key(output_path)
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM claims WHERE output_path = ? AND claimed_at < ?",
+                              (key, now - CLAIM_STALE_SECONDS))
+            if not self.conn.execute("INSERT OR IGNORE INTO claims (output_path, node, claimed_at) VALUES (?, ?, ?)",
+                                     (key, self.node, now)).rowcount:
+                return False
+            row = self.conn.execute("SELECT updated_at, node FROM items WHERE output_path = ?", (key,)).fetchone()
+            if since is not None and row is not None and row[0] and row[0] >= since and row[1] != self.node:
+                self.conn.execute("DELETE FROM claims WHERE output_path = ?", (key,))
+                return False
+        return True
+
+    def release(self, output_path):
+        """claim() で確保した出力先を解放する"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM claims WHERE output_path = ? AND node = ?",
+                              (self.key(output_path), self.node))
+
+    def finish(self, output_path, duration, url=None, course_code=None, content_hash=None, engine=None):
+        """変換成功を記録する（出力サイズとSHA-256、描画したHTMLの内容ハッシュを含む）
+
+        engine を渡すと、size_summary() でプリセットの削減量を見積もるためにエンジン・プリセットごとに集計する。
+        """
+        size = os.path.getsize(output_path)
+        self._upsert(output_path, url, course_code, status=STATUS_DONE, duration=duration,
+                     output_size=size, sha256=file_sha256(output_path),
+                     error=None, error_class=None, content_hash=content_hash, rendered_with=rendered_with(engine))
+        with self._lock:
+            self.written_count += 1
+            self.written_bytes += size
+            if engine is not None:
+                written = self.written_by_preset.setdefault((engine.name, engine.preset), [0, 0, []])
+                written[0] += 1
+                written[1] += size
+                if url and len(written[2]) < PRESET_REFERENCE_SAMPLE:
+                    written[2].append((url, size))
+        if url:
+            with self._lock, self.conn:
+                self.conn.execute("DELETE FROM missing WHERE url = ?", (url,))
+
+    def mark_unchanged(self, output_path, url=None, course_code=None):
+        """内容に変更がなく再描画しなかったことを記録する"""
+        self._upsert(output_path, url, course_code, status=STATUS_DONE, error=None, error_class=None)
+
+    def fail(self, output_path, duration, error=None, url=None, course_code=None, error_class=None):
+        """変換失敗を記録する（error_classは retry_policy の失敗の分類）"""
+        self._upsert(output_path, url, course_code, status=STATUS_FAILED, duration=duration,
+                     error=error, error_class=error_class)
+
+    def size_summary(self, reference=None):
+        """今回書き出したPDFの合計サイズと、プリセットで減ったサイズの見積もりを表示用の行で返す
+
+        削減量の基準は「同じページを同じエンジンの default プリセットで描画したサイズ」。
+        reference(エンジン名, プリセット, URLのリスト) は、そのURLを default プリセットで描画した
+        サイズのリスト（描画できなかったURLはNone。default プリセットならリスト自体がNone）を返す。
+        エンジン・プリセットごとに先頭 PRESET_REFERENCE_SAMPLE 件を描画し直したサイズの比を、
+        今回そのプリセットで書き出した合計サイズに掛けて見積もる。小さくなった場合は
+        出力ディレクトリの書き込み速度を測って書き込み時間の短縮も見積もる。
+        """
+        if not self.written_count:
+            return []
+        mb = 1024 * 1024
+        lines = [f"出力サイズ: {self.written_count}件 / {self.written_bytes / mb:.1f}MB"]
+        saved = 0
+        for (name, preset), (count, size, samples) in self.written_by_preset.items():
+            reference_sizes = reference(name, preset, [url for url, _ in samples]) if reference else None
+            if not reference_sizes:
+                continue
+            pairs = [(sample[1], reference_size) for sample, reference_size in zip(samples, reference_sizes)
+                     if reference_size]
+            if not pairs:
+                continue
+            estimated = (size * sum(reference_size for _, reference_size in pairs)
+                         / sum(sample_size for sample_size, _ in pairs))
+            saved += estimated - size
+            lines.append(f"プリセット {preset}（{name}）: {count}件 {size / mb:.1f}MB / default で描画した場合の推定 "
+                         f"{estimated / mb:.1f}MB（{(size / estimated - 1) * 100:+.0f}%。"
+                         f"{len(pairs)}件を default で描画し直して比較）")
+        speed = measure_write_speed(self.base_dir) if saved > 0 else None
+        if speed:
+            lines.append(f"書き込み時間の短縮（推定）: {saved / speed:.1f}秒"
+                         f"（出力先の書き込み速度 {speed / mb:.1f}MB/秒）")
+        return lines
+
+    def release_all(self):
+        """このノードが確保したままの出力先をすべて解放する（停止・終了時に呼ぶ）"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM claims WHERE node = ?", (self.node,))
+
+    def items(self, *columns):
+        """全対象の指定した列を1行ずつ返す（集計用。件数が多くても全件を読み込まない）"""
+        with self._lock:
+            cursor = self.conn.execute(f"SELECT {', '.join(columns)} FROM items")
+        yield from cursor
+
+    def claims(self):
+        """確保中の出力先の (キー, ノード, 確保した時刻) のリスト"""
+        with self._lock:
+            return self.conn.execute("SELECT output_path, node, claimed_at FROM claims ORDER BY claimed_at").fetchall()
+
+    def counts(self):
+        """状態ごとの件数を返す"""
+        with self._lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status"))
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,106 @@
+"""複数のPCで分担した変換の状況を、共有の出力ディレクトリのマニフェストからまとめて表示する
+
+    python shard_report.py 出力ディレクトリ [--input URLリスト [--year 2025]]
+
+ノード（--shard の担当とPC名）ごとの完了・失敗・変換中の件数と、他のノードの担当分を
+引き受けた件数、確保中の出力先（期限切れを含む）、失敗の内訳を表示する。
+--input を指定すると、リストの担当ごとに未処理の件数も表示する。
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+from input_records import FORMAT_AUTO, INPUT_FORMATS, read_records
+from retry_policy import summarize_failures
+from run_manifest import (CLAIM_STALE_SECONDS, MANIFEST_FILENAME, STATUS_DONE, STATUS_FAILED, STATUS_RUNNING,
+                          RunManifest)
+from sharding import node_shard, shard_of
+
+# マニフェストにノードの記録がない行（分担せずに変換した分・既存ファイル）の表示名
+NO_NODE = "（分担なし）"
+
+def node_report(manifest):
+    """ノードごとの {状態: 件数}・引き受けた件数と、全体の {状態: 件数}・失敗の分類のリストを返す"""
+    by_node = collections.defaultdict(collections.Counter)
+    stolen = collections.Counter()
+    totals = collections.Counter()
+    failure_classes = []
+    for url, status, node, error_class in manifest.items('url', 'status', 'node', 'error_class'):
+        by_node[node or NO_NODE][status] += 1
+        totals[status] += 1
+        if status == STATUS_FAILED:
+            failure_classes.append(error_class)
+        shard = node_shard(node)
+        if shard is not None and url and shard_of(url, shard[1]) != shard[0]:
+            stolen[node] += 1
+    return by_node, stolen, totals, failure_classes
+
+def input_report(manifest, output_dir, input_path, input_format, year, count):
+    """入力リストの担当（count台で分担）ごとの {状態: 件数}（マニフェストにない行は未処理）"""
+    by_shard = collections.defaultdict(collections.Counter)
+    for record in read_records(input_path, input_format, year):
+        if record.error:
+            continue
+        status = manifest.status(os.path.join(output_dir, record.filename()))
+        by_shard[shard_of(record.url, count)][status if status in (STATUS_DONE, STATUS_FAILED) else None] += 1
+    return by_shard
+
+def main():
+    parser = argparse.ArgumentParser(description="複数のPCで分担した変換の状況をまとめて表示します")
+    parser.add_argument("output_dir", help="共有の出力ディレクトリ（syllabus_converter では検索ディレクトリ）")
+    parser.add_argument("--input", help="分担したURLリスト（指定すると担当ごとの未処理の件数も表示する）")
+    parser.add_argument("--input-format", choices=INPUT_FORMATS, default=FORMAT_AUTO,
+                        help="入力の形式（デフォルト: auto）")
+    parser.add_argument("--year", type=int, help="入力に授業コードだけが書かれた行のシラバスの年度")
+    parser.add_argument("--shards", type=int,
+                        help="分担した台数（省略時はマニフェストに記録されたノードから判定）")
+    args = parser.parse_args()
+
+    path = os.path.join(args.output_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        print(f"マニフェストが見つかりません: {path}")
+        sys.exit(1)
+
+    manifest = RunManifest(path)
+    try:
+        by_node, stolen, totals, failure_classes = node_report(manifest)
+        print(f"マニフェスト: {path}\n")
+        # 全角の見出しは2文字分の幅で表示されるため、その分だけ詰める
+        print(f"{'ノード':<27}{'完了':>6}{'失敗':>6}{'変換中':>5}{'引き受け':>6}")
+        for node in sorted(by_node):
+            counts = by_node[node]
+            print(f"{node:<30}{counts[STATUS_DONE]:>8}{counts[STATUS_FAILED]:>8}{counts[STATUS_RUNNING]:>8}"
+                  f"{stolen[node]:>10}")
+        print(f"\n合計: 完了 {totals[STATUS_DONE]}件 / 失敗 {totals[STATUS_FAILED]}件 / "
+              f"変換中・中断 {totals[STATUS_RUNNING]}件")
+
+        claims = manifest.claims()
+        if claims:
+            now = time.time()
+            stale = sum(1 for _, _, claimed_at in claims if claimed_at < now - CLAIM_STALE_SECONDS)
+            print(f"確保中: {len(claims)}件（うち期限切れ {stale}件。期限切れの分は他のノードが引き継ぎます）")
+            for key, node, claimed_at in claims[:10]:
+                print(f"    {key}  {node}（{(now - claimed_at) / 60:.0f}分前）")
+
+        if failure_classes:
+            print(f"\n失敗の内訳（{len(failure_classes)}件）:")
+            for line in summarize_failures(failure_classes):
+                print(f"  {line}")
+
+        if args.input:
+            count = args.shards or max((shard[1] for shard in map(node_shard, by_node) if shard), default=None)
+            if not count:
+                print("\n分担した台数が分からないため、--shards で指定してください")
+                return
+            by_shard = input_report(manifest, args.output_dir, args.input, args.input_format, args.year, count)
+            print(f"\n{'担当':<6}{'行数':>6}{'完了':>6}{'失敗':>6}{'未処理':>5}")
+            for index in range(count):
+                counts = by_shard[index]
+                print(f"{index + 1}/{count:<6}{sum(counts.values()):>8}{counts[STATUS_DONE]:>8}"
+                      f"{counts[STATUS_FAILED]:>8}{counts[None]:>8}")
+    finally:
+        manifest.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import hashlib
+import socket
+
+def shard_of(key, count):
+    """キーを担当する分担番号（0〜count-1）
+
+    Pythonの hash() と違い、実行やPCが変わっても同じキーは同じ番号になる。
+    """
+    digest = hashlib.blake2b(key.strip().encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+class Shard:
+    """--shard i/N で指定された、複数のPCで1つのリストを分担するときの担当分
+
+    担当はURL（授業コードの行は年度から組み立てたURL）のハッシュで決めるため、
+    どの入口（コマンドライン・GUI・HTML走査）で同じリストを処理しても同じ分け方になる。
+    """
+
+    def __init__(self, index, count, host=None):
+        self.index = index
+        self.count = count
+        # マニフェストの確保・記録に使うノード名（分担番号が違えば同じPCでも別のノード）
+        self.node = f"{self.label}@{host or socket.gethostname()}"
+
+    @property
+    def label(self):
+        return f"{self.index + 1}/{self.count}"
+
+    def owns(self, key):
+        """キー（URL）がこの分担の担当かどうか"""
+        return shard_of(key, self.count) == self.index
+
+def parse_shard(value):
+    """--shard の値 "i/N"（1始まり）を Shard にする"""
+    index, _, count = value.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"番号/台数 の形式で指定してください（例: 1/3）: {value}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"番号は1から台数までで指定してください: {value}")
+    return Shard(index - 1, count)
+
+def node_shard(node):
+    """ノード名 "i/N@ホスト" から (分担番号0始まり, 台数) を取り出す（分担していなければNone）"""
+    label, _, _ = (node or '').partition('@')
+    index, _, count = label.partition('/')
+    if not (index.isdigit() and count.isdigit()):
+        return None
+    return int(index) - 1, int(count)
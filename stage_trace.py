@@ -0,0 +1,193 @@
+import contextlib
+import cProfile
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+
+# 集計に並べる段階の順序と表示名（記録されなかった段階は表示しない）
+STAGE_LABELS = {
+    'fetch': 'ページ取得',
+    'connect': '  うち接続〜応答ヘッダー',
+    'transfer': '  うち本文受信・送信待ち',
+    'decode': '文字コード判定',
+    'parse': 'HTML解析',
+    'layout': 'レイアウト',
+    'pdf': 'PDF生成',
+    'render': 'wkhtmltopdf',
+    'write': '出力ファイルの保存',
+    'merge': '結合PDFへの追加',
+    'manifest': 'マニフェスト記録',
+    'total': '合計',
+}
+
+def percentile(values, fraction):
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def timed(timer, name):
+    """timerがNoneなら何もしない段階の計測"""
+    return timer.stage(name) if timer is not None else contextlib.nullcontext()
+
+class StageTimer:
+    """1件のURLの変換にかかった時間を段階ごとに記録する"""
+
+    def __init__(self, url, attempt=1):
+        self.url = url
+        self.attempt = attempt
+        self.started_at = time.time()
+        self.stages = {}
+        self.status_code = None
+        self.bytes_in = None
+        self.error = None
+        # 'unchanged'（内容に変更なし）や 'linked'（同じ内容のPDFをリンク）など。Noneなら成否で決める
+        self.result = None
+        self.profiler = None
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def response(self, response):
+        """取得したページのステータス・バイト数・応答ヘッダーまでの時間を記録する"""
+        self.status_code = response.status_code
+        self.bytes_in = len(response.content)
+        elapsed = getattr(response, 'elapsed', None)
+        if elapsed is not None:
+            self.stages['connect'] = self.stages.get('connect', 0.0) + elapsed.total_seconds()
+
+    def fail(self, error):
+        """失敗の原因を記録する（HTTPエラーならステータスも）"""
+        response = getattr(error, 'response', None)
+        if response is not None and self.status_code is None:
+            self.status_code = response.status_code
+        self.error = str(error)[:500]
+
+    def start_profile(self):
+        """呼び出し元スレッドでcProfileによる計測を始める（記録時に止める）"""
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+class TraceRecorder:
+    """変換1件ごとの段階別の所要時間をJSONLに書き出し、実行の最後に集計する
+
+    path を指定すると1件1行のJSONL（URL・試行回数・段階ごとの秒数・受信/出力バイト数・
+    ステータス・結果・ワーカー）を追記する。profile_top が1以上なら各件をcProfileで計測し、
+    合計時間が長い順にその件数分を profile_dir に .prof として保存する。
+    """
+
+    def __init__(self, path=None, profile_top=0, profile_dir=None):
+        self.path = path
+        self.profile_top = max(0, profile_top)
+        self.profile_dir = profile_dir or 'profiles'
+        self.count = 0
+        self.durations = {}
+        self._slowest = []
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8', buffering=1) if path else None
+
+    def timer(self, url, attempt=1, profile=True):
+        """1件分のStageTimerを作る（profile=Falseなら後で start_profile() を呼ぶ）"""
+        timer = StageTimer(url, attempt)
+        if profile and self.profile_top:
+            timer.start_profile()
+        return timer
+
+    def record(self, timer, error_class=None, output_path=None):
+        """1件分の計測結果を書き出して集計に加える"""
+        total = timer.elapsed()
+        profiler, timer.profiler = timer.profiler, None
+        if profiler is not None:
+            profiler.disable()
+
+        stages = dict(timer.stages)
+        if 'fetch' in stages and 'connect' in stages:
+            stages['transfer'] = max(0.0, stages['fetch'] - stages['connect'])
+        bytes_out = None
+        if output_path and error_class is None:
+            try:
+                bytes_out = os.path.getsize(output_path)
+            except OSError:
+                pass
+
+        entry = {
+            'url': timer.url,
+            'attempt': timer.attempt,
+            'started': round(timer.started_at, 3),
+            'total': round(total, 4),
+            'stages': {name: round(seconds, 4) for name, seconds in stages.items()},
+            'bytes_in': timer.bytes_in,
+            'bytes_out': bytes_out,
+            'status_code': timer.status_code,
+            'result': timer.result or ('success' if error_class is None else 'failed'),
+            'error_class': error_class,
+            'error': timer.error,
+            'worker': threading.current_thread().name,
+        }
+
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.count += 1
+            stages['total'] = total
+            for name, seconds in stages.items():
+                self.durations.setdefault(name, []).append(seconds)
+
+            if profiler is not None:
+                # 所要時間が長い上位profile_top件のプロファイルだけを保持する
+                self._sequence += 1
+                item = (total, self._sequence, timer.url, profiler)
+                if len(self._slowest) < self.profile_top:
+                    heapq.heappush(self._slowest, item)
+                elif total > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, item)
+
+    def summary(self):
+        """段階ごとの p50/p95/p99/最大（秒）を表示用の行で返す"""
+        with self._lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+        if not self.count:
+            return []
+        lines = [f"段階別の所要時間（{self.count}件、秒）:     p50     p95     p99    最大"]
+        for name in list(STAGE_LABELS) + sorted(set(durations) - set(STAGE_LABELS)):
+            values = durations.get(name)
+            if not values:
+                continue
+            label = STAGE_LABELS.get(name, name)
+            lines.append(f"  {percentile(values, 0.50):7.2f} {percentile(values, 0.95):7.2f} "
+                         f"{percentile(values, 0.99):7.2f} {max(values):7.2f}  {label}（{len(values)}件）")
+        return lines
+
+    def close(self):
+        """JSONLを閉じ、遅かった文書のプロファイルを保存して (パス, 秒数, URL) の一覧を返す"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            slowest, self._slowest = sorted(self._slowest, reverse=True), []
+
+        saved = []
+        if slowest:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        for rank, (total, _, url, profiler) in enumerate(slowest, 1):
+            name = re.sub(r'[^A-Za-z0-9_\-.]', '_', url.rstrip('/').rsplit('/', 1)[-1])[:80] or 'index'
+            path = os.path.join(self.profile_dir, f"{rank:02d}_{name}.prof")
+            profiler.dump_stats(path)
+            saved.append((path, total, url))
+        return saved
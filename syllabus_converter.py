@@ -1,116 +1,554 @@
-import pdfkit
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import queue
 import re
-from urllib.parse import urlparse
-from bs4 import BeautifulSoup
+import time
 import glob
+from http_cache import HTTPCache, DEFAULT_MAX_CACHE_MB
+from http_session import SharedHTTPSession
+from host_limiter import HostRateLimiter, parse_host_limit
+from run_manifest import RunManifest, STATUS_DONE, STATUS_FAILED, temporary_output
+from retry_policy import RetryPolicy, RetryQueue, ERROR_LABELS, classify_error, summarize_failures
+from stage_trace import TraceRecorder, timed
+from pdf_engines import (ENGINE_CHOICES, DEFAULT_PRESET, OUTPUT_PRESETS, PdfkitEngine, extract_course_id,
+                         PresetReference, open_engine)
+from render_workers import DEFAULT_MAX_RSS_MB, DEFAULT_RECYCLE_DOCUMENTS, process_limits
+from sharding import parse_shard
 
-def sanitize_filename(filename):
-    """ファイル名から無効な文字を削除または置換する"""
-    return re.sub(r'[^a-zA-Z0-9_\-]', '_', filename)
+# https://△△/・・・・/SyllabusHtml.2025.dddddd.html の形式（英数字対応）
+# href・src・本文のどこに書かれていても1回の走査で拾えるよう、バイト列のまま照合する
+SYLLABUS_URL_PATTERN = re.compile(rb'https://[^"\'\s<>]+/SyllabusHtml\.2025\.[A-Za-z0-9]+\.html')
 
-def extract_syllabus_urls(html_file_path):
-    """HTMLファイルからシラバスURLを抽出する"""
-    urls = []
+# ファイルは一定サイズずつ読み、チャンク境界をまたぐURLのために末尾を次のチャンクへ持ち越す
+SCAN_CHUNK_SIZE = 1024 * 1024
+SCAN_OVERLAP = 4096
+
+# 前回の走査結果（ファイルごとのサイズ・更新時刻・内容ハッシュ・URL）を保存するファイル
+SCAN_INDEX_FILENAME = ".syllabus_scan_index.json"
+
+def scan_html_file(html_file_path):
+    """HTMLファイルを1パスで走査し、(パス, シラバスURL, 内容のSHA-256) を返す
+
+    ファイル全体は読み込まず、チャンクごとにURLの照合とハッシュ計算を行う。
+    プロセスプールのワーカーから呼ばれる。
+    """
+    urls = set()
+    digest = hashlib.sha256()
     try:
-        with open(html_file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            soup = BeautifulSoup(content, 'html.parser')
-
-            # href属性からシラバスURLのパターンを検索
-            links = soup.find_all('a', href=True)
-            for link in links:
-                href = link['href']
-                # https://△△/・・・・/SyllabusHtml.2025.dddddd.html の形式をチェック（英数字対応）
-                if re.search(r'https://[^/]+/.*?/SyllabusHtml\.2025\.[A-Za-z0-9]+\.html', href):
-                    urls.append(href)
-
-            # srcやその他の属性からもURLを検索（念のため）
-            pattern = r'https://[^"\s]+/SyllabusHtml\.2025\.[A-Za-z0-9]+\.html'
-            matches = re.findall(pattern, content)
-            urls.extend(matches)
+        with open(html_file_path, 'rb') as file:
+            tail = b''
+            while True:
+                chunk = file.read(SCAN_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                data = tail + chunk
+                urls.update(match.decode('ascii') for match in SYLLABUS_URL_PATTERN.findall(data))
+                tail = data[-SCAN_OVERLAP:]
 
     except Exception as e:
         print(f"HTMLファイルの読み込みエラー ({html_file_path}): {e}")
+        return html_file_path, [], None
+
+    return html_file_path, list(urls), digest.hexdigest()  # 重複を除去
+
+def extract_syllabus_urls(html_file_path):
+    """HTMLファイルからシラバスURLを抽出する（ファイル全体は読み込まずに1パスで走査）"""
+    return scan_html_file(html_file_path)[1]
+
+def iter_html_files(search_dir):
+    """全てのサブディレクトリからHTMLファイルを順に列挙する"""
+    for root, dirs, files in os.walk(search_dir):
+        for file in files:
+            if file.endswith('.html'):
+                yield os.path.join(root, file)
+
+class ScanIndex:
+    """HTMLファイルごとの走査結果を保存し、変更のないファイルの再走査を省く"""
+
+    def __init__(self, search_dir):
+        self.path = os.path.join(search_dir, SCAN_INDEX_FILENAME)
+        self.search_dir = search_dir
+        self.entries = {}
+        self.updated = {}
+        self.scanned = 0
+        self.reused = 0
+        # scan() がディレクトリを最後まで列挙したか（途中で止まった場合は未到達の結果を残す）
+        self.complete = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _key(self, html_file):
+        return os.path.relpath(html_file, self.search_dir).replace(os.sep, '/')
+
+    def lookup(self, html_file, stat):
+        """サイズと更新時刻が前回と同じなら保存済みのURLを返す（変更があればNone）"""
+        entry = self.entries.get(self._key(html_file))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            self.updated[self._key(html_file)] = entry
+            return entry['urls']
+        return None
+
+    def record(self, html_file, stat, urls, digest):
+        """走査結果を記録する（読み込みに失敗したファイルは記録せず、次回も走査する）"""
+        if digest is None:
+            return
+        self.updated[self._key(html_file)] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': digest,
+            'urls': sorted(urls),
+        }
+
+    def scan(self, pool):
+        """ディレクトリを走査しながら、(HTMLファイル, シラバスURL) を用意できた順に返す
+
+        変更のないファイルは保存済みのURLをその場で返し、新規・変更ファイルは
+        プロセスプールで走査して、終わったものから返す。全ファイルの列挙を待たないため、
+        大きなディレクトリでも最初の変換がすぐに始まる。
+        """
+        done = queue.Queue()
+        pending = 0
 
-    return list(set(urls))  # 重複を除去
+        def scanned():
+            result, stat = done.get()
+            html_file, urls, digest = result
+            self.record(html_file, stat, urls, digest)
+            return html_file, urls
 
-def extract_course_id(url):
-    """URLからコースID（英数字部分）を抽出する"""
-    match = re.search(r'SyllabusHtml\.2025\.([A-Za-z0-9]+)\.html', url)
-    return match.group(1) if match else None
+        for html_file in iter_html_files(self.search_dir):
+            try:
+                stat = os.stat(html_file)
+            except OSError:
+                continue
+            urls = self.lookup(html_file, stat)
+            if urls is None:
+                self.scanned += 1
+                pending += 1
+                pool.apply_async(scan_html_file, (html_file,),
+                                 callback=lambda result, stat=stat: done.put((result, stat)),
+                                 error_callback=lambda e, html_file=html_file, stat=stat:
+                                     done.put(((html_file, [], None), stat)))
+            else:
+                self.reused += 1
+                yield html_file, urls
+
+            # 走査の終わったファイルは列挙の途中でも先に返す
+            while pending and not done.empty():
+                pending -= 1
+                yield scanned()
+
+        while pending:
+            pending -= 1
+            yield scanned()
+        self.complete = True
+
+    def save(self):
+        """走査結果を書き出す
+
+        最後まで列挙した場合は今回見つかったファイルの分だけを書き出し、削除されたファイルを消す。
+        中断した場合は、まだ到達していないファイルの前回の結果も残し、次回の再走査を避ける。
+        """
+        entries = self.updated
+        if not self.complete:
+            entries = dict(self.entries)
+            entries.update(self.updated)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(entries, file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
 
-def convert_url_to_pdf(url, output_path):
-    """URLをPDFに変換する（既存のprint_pdf.pyのロジックを使用）"""
+def convert_url_to_pdf(url, output_path, cache=None, timer=None, engine=None):
+    """URLをPDFに変換する（engineを省略するとpdfkitを使う）
+
+    成功したらNone、失敗したら失敗の分類（retry_policy.ERROR_*）を返す。
+    """
+    if engine is None:
+        engine = PdfkitEngine()
     try:
-        pdfkit.from_url(url, output_path)
-        return True
+        if cache is None:
+            engine.render_url(url, output_path, timer)
+        else:
+            with timed(timer, 'fetch'):
+                page = cache.get(url)
+            if timer is not None:
+                timer.response(page)
+            engine.render_page(page, output_path, timer)
+        return None
     except Exception as e:
         print(f'PDF変換失敗 {url}: {e}')
-        return False
+        if timer is not None:
+            timer.fail(e)
+        return classify_error(e)
+
+def add_to_merged_pdf(merger, course_id, source):
+    """結合PDFに1件追加する（追加できなくても個別のPDFの変換は成功として扱う）"""
+    try:
+        merger.append(course_id, source)
+    except Exception as e:
+        print(f"    結合PDFに追加できませんでした: {course_id}（{e}）")
+
+def convert_syllabus_url(url, course_id, output_path, manifest, statuses, cache, retry_queue, policy,
+                         failures, trace=None, attempt=1, engine=None, mergers=None):
+    """1件のシラバスURLを変換し、結果をマニフェストに記録する
+
+    再試行できる失敗は待ち時間を付けて retry_queue の末尾に回し、最終的な失敗は
+    failures に (URL, 失敗の分類) として追加する。traceを指定すると段階ごとの所要時間を記録する。
+    mergersを指定すると、成功したPDFを出力ディレクトリの結合PDFに追加する。
+    """
+    pdf_filename = os.path.basename(output_path)
+    print(f"    変換中: {url} -> {pdf_filename}")
+    merger = mergers.get(os.path.dirname(output_path)) if mergers is not None else None
+
+    # WeasyPrintは描画結果をメモリに書き出し、保存と結合PDFへの追加に同じバイト列を使う
+    buffer = None
+    if merger is not None and engine is not None and engine.renders_to_memory:
+        buffer = io.BytesIO()
+
+    # 一時ファイルに書き出し、完成してから出力パスに置き換える
+    timer = trace.timer(url, attempt) if trace is not None else None
+    started = time.perf_counter()
+    manifest.start(output_path, url, course_id)
+    with temporary_output(output_path) as temp_path:
+        error_class = convert_url_to_pdf(url, temp_path if buffer is None else buffer, cache, timer, engine)
+        if error_class is None:
+            with timed(timer, 'write'):
+                if buffer is not None:
+                    with open(temp_path, 'wb') as file:
+                        file.write(buffer.getbuffer())
+                os.replace(temp_path, output_path)
+
+    with timed(timer, 'manifest'):
+        if error_class is None:
+            manifest.finish(output_path, time.perf_counter() - started, url, course_id, engine=engine)
+        else:
+            manifest.fail(output_path, time.perf_counter() - started, "PDF変換失敗", url, course_id,
+                          error_class=error_class)
+    if error_class is None and merger is not None:
+        with timed(timer, 'merge'):
+            add_to_merged_pdf(merger, course_id, output_path if buffer is None else buffer.getvalue())
+    if trace is not None:
+        trace.record(timer, error_class, output_path)
+
+    if error_class is None:
+        statuses[manifest.key(output_path)] = STATUS_DONE
+        print(f"    成功: {pdf_filename}")
+        if manifest.node is not None:
+            manifest.release(output_path)
+        return
+
+    delay = policy.next_delay(error_class, attempt)
+    if delay is not None:
+        # 分担する場合、再試行待ちの間も出力先は確保したままにする
+        print(f"    再試行予定（{ERROR_LABELS[error_class]}、{delay:.1f}秒後）: {pdf_filename}")
+        retry_queue.put((url, course_id, output_path, attempt + 1), delay)
+    else:
+        print(f"    失敗: {pdf_filename}")
+        failures.append((url, error_class))
+        if manifest.node is not None:
+            manifest.release(output_path)
+
+def convert_html_file_urls(search_dir, html_file, urls, manifest, statuses, args, cache, retry_queue, policy,
+                           failures, trace=None, engine=None, mergers=None, since=None, stolen=False):
+    """1つのHTMLファイルから見つかったシラバスURLをPDFに変換する
+
+    mergersを指定すると、クラスのディレクトリごとの結合PDF（出力ディレクトリ名.pdf）に
+    変換済み・変換したPDFを順に追加する。
+    --shard の場合は担当のURLだけを、stolen=True なら他の担当のURLのうち未着手のものだけを
+    （スキップしたURLはログに出さずに）変換する。sinceを指定すると変換前に出力先を確保する。
+    (他のノードが確保中・変換済みだったURL数, 変換したURL数) を返す。
+    """
+    found = len(urls)
+    if args.shard is not None:
+        urls = [url for url in urls if args.shard.owns(url) != stolen]
+    if stolen and not urls:
+        return 0, 0
+
+    print(f"\n処理中: {html_file}{'（他の担当分を引き受け）' if stolen else ''}")
+
+    # HTMLファイルからディレクトリ名を取得（1-2, 4-3などの形式）
+    dir_name = os.path.basename(os.path.dirname(html_file))
+
+    if not found:
+        print(f"  シラバスURLが見つかりませんでした")
+        return 0, 0
+
+    if args.shard is None:
+        print(f"  見つかったURL数: {found}")
+    else:
+        print(f"  見つかったURL数: {found}（{'引き受け候補' if stolen else '担当'} {len(urls)}件）")
+
+    # 出力ディレクトリを作成（HTMLファイルと同じディレクトリ名）
+    output_dir = os.path.join(search_dir, dir_name)
+    os.makedirs(output_dir, exist_ok=True)
+    if mergers is not None and output_dir not in mergers:
+        from pdf_merge import StreamingPDFMerger
+        mergers[output_dir] = StreamingPDFMerger(f"{output_dir}.pdf")
+
+    # 各URLをPDFに変換
+    elsewhere = converted = 0
+    for url in urls:
+        course_id = extract_course_id(url)
+        if course_id:
+            pdf_filename = f"{course_id}.pdf"
+            output_path = os.path.join(output_dir, pdf_filename)
+
+            # マニフェストで変換済みならスキップ（マニフェスト導入前の既存ファイルは完了済みとして登録）
+            # 他の担当分を引き受ける場合は、開始時の状態ではなく他のノードの変換結果を含む現在の状態で判定する
+            start_status = statuses.get(manifest.key(output_path))
+            status = manifest.status(output_path) if since is not None else start_status
+            if status is None and os.path.exists(output_path):
+                manifest.mark_existing(output_path, url, course_id)
+                status = statuses[manifest.key(output_path)] = STATUS_DONE
+
+            if not manifest.should_convert(status, args.resume, args.retry_failed, output_path):
+                if stolen:
+                    continue
+                if status != start_status:
+                    print(f"    スキップ（他のノードが変換済み）: {pdf_filename}")
+                    elsewhere += 1
+                    continue
+                reason = {STATUS_DONE: "既に存在", STATUS_FAILED: "前回失敗"}.get(status, "再試行の対象外")
+                print(f"    スキップ（{reason}）: {pdf_filename}")
+                if status == STATUS_DONE and mergers is not None:
+                    add_to_merged_pdf(mergers[output_dir], course_id, output_path)
+                continue
+
+            # 分担する場合は変換前に出力先を確保する（他のノードが確保中・変換済みならスキップ）
+            if since is not None and not manifest.claim(output_path, since):
+                if not stolen:
+                    print(f"    スキップ（他のノードが変換中・変換済み）: {pdf_filename}")
+                    elsewhere += 1
+                continue
+
+            convert_syllabus_url(url, course_id, output_path, manifest, statuses, cache, retry_queue, policy,
+                                 failures, trace, engine=engine, mergers=mergers)
+            converted += 1
+        elif not stolen:
+            print(f"    コースID抽出失敗: {url}")
+    return elsewhere, converted
+
+def iter_sample_urls(index):
+    """試し変換用のシラバスURLを、ディレクトリの先頭から必要な分だけ返す
+
+    変更のないファイルは前回の走査結果を使い、それ以外はその場で走査する。
+    """
+    for html_file in iter_html_files(index.search_dir):
+        try:
+            stat = os.stat(html_file)
+        except OSError:
+            continue
+        urls = index.lookup(html_file, stat)
+        yield from urls if urls is not None else scan_html_file(html_file)[1]
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description="保存済みHTMLからシラバスURLを抽出してPDFに変換します")
+    parser.add_argument("search_dir", nargs="?", help="HTMLファイルを検索するディレクトリ")
+    parser.add_argument("--cache-dir",
+                        help="HTTPキャッシュの保存先。指定するとETag/Last-Modifiedで再検証し、未変更のページは再ダウンロードしない")
+    parser.add_argument("--max-cache-mb", type=float, default=DEFAULT_MAX_CACHE_MB,
+                        help=f"HTTPキャッシュの上限サイズ（MB、デフォルト: {DEFAULT_MAX_CACHE_MB}）")
+    parser.add_argument("--host-limit", action="append", type=parse_host_limit, default=[],
+                        metavar="HOST=RATE[:MAX]",
+                        help="--cache-dir 指定時のページ取得について、ホストごとの毎秒リクエスト数と最大同時接続数（例: syllabus.u-hyogo.ac.jp=4:6）")
+    parser.add_argument("--scan-workers", type=int, default=os.cpu_count() or 1,
+                        help="HTMLファイルを並列に走査するプロセス数（デフォルト: CPU数）")
+    parser.add_argument("--rescan", action="store_true",
+                        help=f"走査インデックス（{SCAN_INDEX_FILENAME}）を使わず全てのHTMLファイルを走査し直す")
+    parser.add_argument("--resume", action="store_true",
+                        help="前回の実行を再開する（未着手・中断したURLだけを変換し、失敗したURLは飛ばす）")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="前回失敗したURLだけを変換し直す")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="一時的な通信エラー・5xx・変換エンジンの異常終了時の1件あたりの最大試行回数（デフォルト: 3）")
+    parser.add_argument("--retry-budget", type=int, default=50,
+                        help="1回の実行全体での再試行回数の上限（デフォルト: 50）")
+    parser.add_argument("--engine", choices=ENGINE_CHOICES, default="pdfkit",
+                        help="PDF変換エンジン。auto は最初に見つかったページで試し変換し、最速のエンジンを選ぶ（デフォルト: pdfkit）")
+    parser.add_argument("--preset", choices=list(OUTPUT_PRESETS), default=DEFAULT_PRESET,
+                        help="出力サイズのプリセット。archive / screen / print は画像を縮小・再圧縮する（デフォルト: default）")
+    parser.add_argument("--merge", action="store_true",
+                        help="クラスのディレクトリごとに、PDFを1つにまとめた結合PDF（授業コードごとのしおり付き）を作る")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="URLごとの段階別の所要時間・バイト数・ステータスをJSONL形式で追記するファイル")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="各URLをcProfileで計測し、遅かったN件のプロファイルを検索ディレクトリの profiles/ に保存する")
+    parser.add_argument("--recycle-after", type=int, default=DEFAULT_RECYCLE_DOCUMENTS, metavar="N",
+                        help=f"WeasyPrintの描画プロセスをN件描画するごとに入れ替える（デフォルト: {DEFAULT_RECYCLE_DOCUMENTS}）")
+    parser.add_argument("--max-worker-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB, metavar="MB",
+                        help=f"描画プロセスのRSSがこれを超えたら入れ替える（デフォルト: {DEFAULT_MAX_RSS_MB}。"
+                             "両方0なら描画プロセスを使わない）")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="複数のPCで検索ディレクトリを分担するときの担当（N台中I台目、例: 1/3）。URLのハッシュで分ける")
+    parser.add_argument("--steal", action="store_true",
+                        help="--shard の担当分が終わったら、他のPCの未着手の分を引き受ける（全台で指定する）")
+    args = parser.parse_args(argv)
+    if args.steal and args.shard is None:
+        parser.error("--steal は --shard と一緒に指定してください")
+    if args.merge and args.shard is not None:
+        # 結合PDFは全授業のPDFがそろったPCで作る必要がある
+        parser.error("--merge は --shard と一緒に指定できません（分担が終わってから --merge だけで実行してください）")
+    return args
 
 def main():
+    args = parse_args()
+
     # 検索対象のディレクトリを取得
-    search_dir = input("HTMLファイルを検索するディレクトリを入力してください: ")
+    if args.search_dir:
+        search_dir = args.search_dir
+    else:
+        search_dir = input("HTMLファイルを検索するディレクトリを入力してください: ")
 
     if not os.path.exists(search_dir):
         print(f"ディレクトリが見つかりません: {search_dir}")
         return
 
-    # 全てのサブディレクトリからHTMLファイルを検索
-    html_files = []
-    for root, dirs, files in os.walk(search_dir):
-        for file in files:
-            if file.endswith('.html'):
-                html_files.append(os.path.join(root, file))
-
-    if not html_files:
+    if next(iter_html_files(search_dir), None) is None:
         print("HTMLファイルが見つかりませんでした。")
         return
 
-    print(f"見つかったHTMLファイル数: {len(html_files)}")
+    cache = None
+    if args.cache_dir:
+        # ページ取得はホストごとの送信速度と同時接続数を応答に合わせて調整する
+        http = SharedHTTPSession(pool_size=1, limiter=HostRateLimiter(dict(args.host_limit)))
+        cache = HTTPCache(args.cache_dir, args.max_cache_mb, http=http)
 
-    # 各HTMLファイルを処理
-    for html_file in html_files:
-        print(f"\n処理中: {html_file}")
+    # 全クラスディレクトリの変換状態を検索ディレクトリのマニフェストで管理する
+    manifest = RunManifest.for_directory(search_dir)
+    statuses = manifest.statuses()
+    if args.shard is not None:
+        manifest.node = args.shard.node
+        print(f"分担: {args.shard.label}（{args.shard.node}"
+              f"{'、終わったら他の担当分を引き受け' if args.steal else ''}）")
+    since = time.time() if args.steal else None
 
-        # HTMLファイルからディレクトリ名を取得（1-2, 4-3などの形式）
-        dir_name = os.path.basename(os.path.dirname(html_file))
+    # 前回から変更のないファイルは保存済みのURLを使い、新規・変更ファイルだけを走査する
+    index = ScanIndex(search_dir)
+    if args.rescan:
+        index.entries = {}
 
-        # シラバスURLを抽出
-        urls = extract_syllabus_urls(html_file)
+    # 再試行は待ち時間を付けて後回しにし、全ファイルを処理してからまとめて行う
+    policy = RetryPolicy(args.max_attempts, args.retry_budget)
+    retry_queue = RetryQueue()
+    failures = []
 
-        if not urls:
-            print(f"  シラバスURLが見つかりませんでした")
-            continue
+    # 段階別の所要時間は --trace / --profile 指定時だけ記録する
+    trace = None
+    if args.trace or args.profile:
+        trace = TraceRecorder(args.trace, args.profile, os.path.join(search_dir, "profiles"))
 
-        print(f"  見つかったURL数: {len(urls)}")
+    # 結合PDFは完成したPDFから順に書き足す（--merge 指定時のみ）
+    mergers = None
+    if args.merge:
+        # pypdfは読み込みに時間がかかるため、--merge 指定時だけ読み込む
+        from pdf_merge import merge_available
+        reason = merge_available()
+        if reason:
+            print(reason)
+            manifest.close()
+            return
+        mergers = {}
 
-        # 出力ディレクトリを作成（HTMLファイルと同じディレクトリ名）
-        output_dir = os.path.join(search_dir, dir_name)
-        os.makedirs(output_dir, exist_ok=True)
+    # 変換エンジンを準備する（auto の場合は最初に見つかったシラバスURLで試し変換して選ぶ）
+    try:
+        engine = open_engine(args.engine, http=cache.http if cache is not None else None, cache=cache,
+                             sample_urls=iter_sample_urls(index),
+                             fetch=cache.get if cache is not None else None, preset=args.preset,
+                             # --profile は描画を自プロセスで行い、cProfileで計測できるようにする
+                             process_limits=None if args.profile else process_limits(args.recycle_after,
+                                                                                     args.max_worker_rss_mb))
+    except RuntimeError as e:
+        print(e)
+        manifest.close()
+        return
 
-        # 各URLをPDFに変換
-        for url in urls:
-            course_id = extract_course_id(url)
-            if course_id:
-                pdf_filename = f"{course_id}.pdf"
-                output_path = os.path.join(output_dir, pdf_filename)
+    convert_args = (manifest, statuses, args, cache, retry_queue, policy, failures, trace, engine, mergers, since)
 
-                # 既にファイルが存在する場合はスキップ
-                if os.path.exists(output_path):
-                    print(f"    スキップ（既に存在）: {pdf_filename}")
-                    continue
+    # ディレクトリの列挙と変更ファイルの走査を進めながら、URLが揃ったファイルから変換する
+    # --steal の場合は担当分が終わったら、同じURLの一覧から他のノードが未着手の分を引き受ける
+    elsewhere = stolen = 0
+    # 引き受けるときに読み直すため、処理したHTMLファイルとURLを覚えておく
+    scanned = [] if args.steal else None
+    try:
+        with multiprocessing.Pool(max(1, args.scan_workers)) as pool:
+            for html_file, urls in index.scan(pool):
+                if scanned is not None:
+                    scanned.append((html_file, urls))
+                elsewhere += convert_html_file_urls(search_dir, html_file, urls, *convert_args)[0]
 
-                print(f"    変換中: {url} -> {pdf_filename}")
-                success = convert_url_to_pdf(url, output_path)
+        print(f"HTMLファイル数: {index.scanned + index.reused}"
+              f"（走査: {index.scanned}件 / 前回の結果を再利用: {index.reused}件）")
 
-                if success:
-                    print(f"    成功: {pdf_filename}")
-                else:
-                    print(f"    失敗: {pdf_filename}")
-            else:
-                print(f"    コースID抽出失敗: {url}")
+        if args.steal:
+            for html_file, urls in scanned:
+                stolen += convert_html_file_urls(search_dir, html_file, urls, *convert_args, stolen=True)[1]
+
+        if retry_queue.waiting():
+            print(f"\n再試行待ち: {retry_queue.waiting()}件")
+        while True:
+            item = retry_queue.get()
+            if item is None:
+                break
+            url, course_id, output_path, attempt = item
+            convert_syllabus_url(url, course_id, output_path, manifest, statuses, cache, retry_queue, policy,
+                                 failures, trace, attempt, engine, mergers)
+            retry_queue.task_done()
+
+        merged = [merger for _, merger in sorted((mergers or {}).items()) if merger.close()]
+    finally:
+        index.save()
+        if args.steal:
+            manifest.release_all()
+        manifest.close()
+        for merger in (mergers or {}).values():
+            merger.abort()
+        # 中断・エラー時も wkhtmltopdf や描画プロセスを終了させる
+        for line in engine.summary():
+            print(line)
+        engine.close()
+
+    # プリセットの削減量は、先頭の数件を default プリセットで描画し直したサイズと比べて見積もる
+    for line in manifest.size_summary(PresetReference(cache.http if cache is not None else None, cache)):
+        print(line)
+
+    if mergers is not None:
+        print()
+        for merger in merged:
+            print(f"結合PDF: {merger.output_path}（{len(merger.titles)}件 / {merger.page_count}ページ）")
+
+    if args.shard is not None:
+        print(f"\n分担 {args.shard.label}: 他のノードが変換 {elsewhere}件 / 引き受け {stolen}件"
+              f"（全体の状況は python shard_report.py {search_dir}）")
+
+    if cache is not None:
+        print(f"\nHTTPキャッシュ: 未変更 {cache.hits}件 / ダウンロード {cache.misses}件")
+        for line in cache.http.limiter.summary():
+            print(f"実効レート {line}")
+
+    if policy.retries:
+        print(f"再試行: {policy.retries}回（上限 {policy.budget}回）")
+    if failures:
+        print(f"\n失敗の内訳（{len(failures)}件）:")
+        for line in summarize_failures(error_class for _, error_class in failures):
+            print(f"  {line}")
+
+    if trace is not None:
+        print()
+        for line in trace.summary():
+            print(line)
+        for path, seconds, url in trace.close():
+            print(f"プロファイル: {path}（{seconds:.2f}秒 {url}）")
+        if args.trace:
+            print(f"トレース: {args.trace}")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -1,70 +1,193 @@
-import pdfkit
+import argparse
+import collections
+import multiprocessing
 import os
-import re
-import sys
-from urllib.parse import urlparse
-
-def sanitize_filename(filename):
-    """ファイル名から無効な文字を削除または置換する"""
-    return re.sub(r'[^a-zA-Z0-9_\-.]', '_', filename)
-
-def extract_course_id_from_url(url):
-    """URLからコースIDを抽出する（syllabus形式の場合）"""
-    match = re.search(r'SyllabusHtml\.2025\.([A-Za-z0-9]+)\.html', url)
-    if match:
-        return match.group(1)
-
-    # syllabus形式でない場合は、URLから適当なファイル名を生成
-    parsed_url = urlparse(url)
-    filename = os.path.basename(parsed_url.path)
-    if filename and filename.endswith('.html'):
-        return filename[:-5]  # .htmlを除去
-    elif filename:
-        return filename
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http_cache import HTTPCache, DEFAULT_MAX_CACHE_MB
+from http_session import SharedHTTPSession
+from host_limiter import HostRateLimiter, parse_host_limit
+from run_manifest import RunManifest, STATUS_DONE, STATUS_FAILED, temporary_output
+from retry_policy import (RetryPolicy, RetryQueue, ERROR_LABELS, ERROR_OTHER, classify_error,
+                          summarize_failures)
+from stage_trace import TraceRecorder, timed
+from pdf_engines import (AUTO, CALIBRATION_SAMPLE, ENGINE_CHOICES, DEFAULT_PRESET, OUTPUT_PRESETS, EngineSet,
+                         PdfkitEngine, PresetReference, open_engine)
+from input_records import FORMAT_AUTO, INPUT_FORMATS, STDIN, Deduplicator, peek, read_records
+from sharding import parse_shard
+from render_workers import DEFAULT_MAX_RSS_MB, DEFAULT_RECYCLE_DOCUMENTS, process_limits
+
+# 他のノードが確保中・変換済みで、このノードでは変換しない行の結果
+CLAIMED_ELSEWHERE = 'claimed'
+
+# 結果を入力の順に表示するため、並列数のこの倍数まで先の行を読んで投入しておく
+READ_AHEAD_PER_JOB = 4
+
+# 終了時に一覧表示する失敗の上限（超えた分は分類ごとの件数だけを数える）
+MAX_LISTED_FAILURES = 100
+
+def render_url_to_pdf(url, output_path, cache=None, timer=None, engine=None):
+    """URLをPDFに変換する（失敗時は例外を送出する）
+
+    cacheを指定するとページはHTTPキャッシュ経由で取得し、取得済みの本文からPDFにする。
+    engineを省略するとpdfkitを使う。
+    """
+    if engine is None:
+        engine = PdfkitEngine()
+    if cache is None:
+        engine.render_url(url, output_path, timer)
     else:
-        # パスからファイル名を生成
-        path_parts = [part for part in parsed_url.path.split('/') if part]
-        if path_parts:
-            return path_parts[-1]
-        else:
-            return parsed_url.netloc.replace('.', '_')
-
-def convert_url_to_pdf(url, output_path):
-    """URLをPDFに変換する"""
-    try:
-        options = {
-            'page-size': 'A4',
-            'margin-top': '0.75in',
-            'margin-right': '0.75in',
-            'margin-bottom': '0.75in',
-            'margin-left': '0.75in',
-            'encoding': "UTF-8",
-            'no-outline': None
-        }
-        pdfkit.from_url(url, output_path, options=options)
-        return True
-    except Exception as e:
-        print(f'PDF変換失敗 {url}: {e}')
-        return False
+        with timed(timer, 'fetch'):
+            page = cache.get(url)
+        if timer is not None:
+            timer.response(page)
+        engine.render_page(page, output_path, timer)
+
+def convert_task(url, output_path, cache=None, manifest=None, trace=None, attempt=1, engine=None):
+    """ワーカースレッドで変換し、ログは呼び出し元でまとめて表示する
+
+    一時ファイルに書き出してから出力パスへrenameし、結果をマニフェストに記録する。
+    traceを指定すると段階ごとの所要時間を記録する。
+    (成功したか, ログ, 失敗の分類) を返す。
+    """
+    messages = []
+    error_class = None
+    timer = trace.timer(url, attempt) if trace is not None else None
+    started = time.perf_counter()
+    if manifest is not None:
+        manifest.start(output_path, url)
+
+    with temporary_output(output_path) as temp_path:
+        try:
+            render_url_to_pdf(url, temp_path, cache, timer, engine)
+            with timed(timer, 'write'):
+                os.replace(temp_path, output_path)
+        except Exception as e:
+            messages.append(f'PDF変換失敗 {url}: {e}')
+            error_class = classify_error(e)
+            if timer is not None:
+                timer.fail(e)
+
+    if manifest is not None:
+        duration = time.perf_counter() - started
+        with timed(timer, 'manifest'):
+            if error_class is None:
+                manifest.finish(output_path, duration, url, engine=engine)
+            else:
+                manifest.fail(output_path, duration, messages[-1], url, error_class=error_class)
+    if trace is not None:
+        trace.record(timer, error_class, output_path)
+    return error_class is None, messages, error_class
+
+def convert_worker(work_queue, policy, cache=None, manifest=None, trace=None, engine=None):
+    """キューから変換ジョブを取り出して処理するワーカー
+
+    再試行できる失敗は待ち時間を付けてキューの末尾に戻し、その間は次のジョブを処理する。
+    最終的な結果はジョブのFutureに (成功したか, ログ, 失敗の分類) として設定する。
+    ジョブにエンジンが指定されていればそれを、なければ engine を使う。
+    """
+    while True:
+        job = work_queue.get()
+        if job is None:
+            return
+        url, output_path, future, attempt, messages, job_engine = job
+        try:
+            success, attempt_messages, error_class = convert_task(url, output_path, cache, manifest,
+                                                                  trace, attempt, job_engine or engine)
+            messages.extend(attempt_messages)
+            delay = None if success else policy.next_delay(error_class, attempt)
+        except Exception as e:
+            future.set_exception(e)
+            work_queue.task_done()
+            continue
+
+        if delay is not None:
+            messages.append(f"                再試行（{ERROR_LABELS[error_class]}、{attempt}回目の失敗、{delay:.1f}秒後）")
+            work_queue.retry((url, output_path, future, attempt + 1, messages, job_engine), delay)
+            continue
+
+        future.set_result((success, messages, error_class))
+        work_queue.task_done()
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description="URLリストからPDFを一括生成します")
+    parser.add_argument("input_file", nargs="?",
+                        help="URLリストファイル（1行1URL、または .csv / .jsonl）。- で標準入力から読む")
+    parser.add_argument("output_dir", nargs="?", help="PDFの保存先ディレクトリ")
+    parser.add_argument("--input-format", choices=INPUT_FORMATS, default=FORMAT_AUTO,
+                        help="入力の形式。auto は拡張子で判定する（標準入力では先頭行が { ならJSONL）（デフォルト: auto）")
+    parser.add_argument("--year", type=int,
+                        help="入力に授業コードだけが書かれた行のシラバスの年度（行ごとの year 列が優先）")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="同時に変換するURL数（デフォルト: 1）")
+    parser.add_argument("--cache-dir",
+                        help="HTTPキャッシュの保存先。指定するとETag/Last-Modifiedで再検証し、未変更のページは再ダウンロードしない")
+    parser.add_argument("--max-cache-mb", type=float, default=DEFAULT_MAX_CACHE_MB,
+                        help=f"HTTPキャッシュの上限サイズ（MB、デフォルト: {DEFAULT_MAX_CACHE_MB}）")
+    parser.add_argument("--host-limit", action="append", type=parse_host_limit, default=[],
+                        metavar="HOST=RATE[:MAX]",
+                        help="--cache-dir 指定時のページ取得について、ホストごとの毎秒リクエスト数と最大同時接続数（例: syllabus.u-hyogo.ac.jp=4:6）")
+    parser.add_argument("--resume", action="store_true",
+                        help="前回の実行を再開する（未着手・中断したURLだけを変換し、失敗したURLは飛ばす）")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="前回失敗したURLだけを変換し直す")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="一時的な通信エラー・5xx・変換エンジンの異常終了時の1件あたりの最大試行回数（デフォルト: 3）")
+    parser.add_argument("--retry-budget", type=int, default=50,
+                        help="1回の実行全体での再試行回数の上限（デフォルト: 50）")
+    parser.add_argument("--engine", choices=ENGINE_CHOICES, default="pdfkit",
+                        help="PDF変換エンジン。auto は先頭のページで試し変換し、最速のエンジンを選ぶ（デフォルト: pdfkit）")
+    parser.add_argument("--preset", choices=list(OUTPUT_PRESETS), default=DEFAULT_PRESET,
+                        help="出力サイズのプリセット。archive / screen / print は画像を縮小・再圧縮する（デフォルト: default）")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="URLごとの段階別の所要時間・バイト数・ステータスをJSONL形式で追記するファイル")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="各URLをcProfileで計測し、遅かったN件のプロファイルを出力先の profiles/ に保存する")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="複数のPCで1つのリストを分担するときの担当（N台中I台目、例: 1/3）。URLのハッシュで分ける")
+    parser.add_argument("--steal", action="store_true",
+                        help="--shard の担当分が終わったら、他のPCの未着手の分を引き受ける（全台で指定する）")
+    parser.add_argument("--recycle-after", type=int, default=DEFAULT_RECYCLE_DOCUMENTS, metavar="N",
+                        help=f"WeasyPrintの描画プロセスをN件描画するごとに入れ替える（デフォルト: {DEFAULT_RECYCLE_DOCUMENTS}）")
+    parser.add_argument("--max-worker-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB, metavar="MB",
+                        help=f"描画プロセスのRSSがこれを超えたら入れ替える（デフォルト: {DEFAULT_MAX_RSS_MB}。"
+                             "両方0なら描画プロセスを使わない）")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs は1以上を指定してください")
+    if args.steal and args.shard is None:
+        parser.error("--steal は --shard と一緒に指定してください")
+    if args.steal and args.input_file == STDIN:
+        parser.error("--steal は入力を読み直すため、標準入力とは一緒に使えません")
+    return args
 
 def main():
+    args = parse_args()
+
     print("URL to PDF Converter")
     print("=" * 30)
 
     # URLリストファイルのパスを取得
-    if len(sys.argv) > 1:
-        input_file_path = sys.argv[1]
+    if args.input_file:
+        input_file_path = args.input_file
     else:
         input_file_path = input("URLリストファイルのパスを入力してください: ")
 
-    if not os.path.exists(input_file_path):
+    if input_file_path != STDIN and not os.path.exists(input_file_path):
         print(f"ファイルが見つかりません: {input_file_path}")
         input("Enterキーを押して終了...")
         return
 
     # 出力ディレクトリを取得
-    if len(sys.argv) > 2:
-        output_dir = sys.argv[2]
+    if args.output_dir:
+        output_dir = args.output_dir
+    elif input_file_path == STDIN:
+        # 標準入力はURLリストに使うため、保存先を対話的には尋ねない
+        print("標準入力から読む場合は保存先ディレクトリも指定してください")
+        return
     else:
         output_dir = input("PDFファイルを保存するディレクトリを入力してください（空白で現在のディレクトリ）: ").strip()
         if not output_dir:
@@ -73,57 +196,272 @@ def main():
     # 出力ディレクトリを作成
     os.makedirs(output_dir, exist_ok=True)
 
+    manifest = None
+    engines = None
     try:
-        # URLリストを読み取る
-        with open(input_file_path, 'r', encoding='utf-8') as file:
-            urls = [line.strip() for line in file.readlines() if line.strip()]
+        # 入力は1行ずつ読み、読んだ行から順に変換を始める
+        records = read_records(input_file_path, args.input_format, args.year)
 
-        if not urls:
-            print("URLが見つかりませんでした。")
-            input("Enterキーを押して終了...")
-            return
+        # auto の試し変換には先頭の数件を使う（その分だけ先に読み込む）
+        sample_urls = []
+        if args.engine == AUTO:
+            head, records = peek(records, CALIBRATION_SAMPLE * 3)
+            sample_urls = [record.url for record in head if record.error is None]
 
-        print(f"\n{len(urls)}個のURLを変換します...")
+        print(f"\n入力: {'標準入力' if input_file_path == STDIN else input_file_path}")
         print(f"出力先: {output_dir}")
+        if args.jobs > 1:
+            print(f"並列数: {args.jobs}")
+        shard = args.shard
+        if shard is not None:
+            print(f"分担: {shard.label}（{shard.node}{'、終わったら他の担当分を引き受け' if args.steal else ''}）")
         print()
 
         success_count = 0
+        total = 0
+        stolen_count = 0
+        elsewhere_count = 0
+        # 失敗は先頭の MAX_LISTED_FAILURES 件だけを保持し、全体は分類ごとの件数で数える
+        failures = []
+        failure_classes = collections.Counter()
+        cache = None
+        if args.cache_dir:
+            # ページ取得はホストごとの送信速度と同時接続数を応答に合わせて調整する
+            http = SharedHTTPSession(pool_size=args.jobs, limiter=HostRateLimiter(dict(args.host_limit)))
+            cache = HTTPCache(args.cache_dir, args.max_cache_mb, http=http)
+
+        # スキップ判定は出力ディレクトリのマニフェストで行単位に行う（全件を読み込まない）
+        # 分担する場合は共有の出力ディレクトリのマニフェストに、どのノードが変換したかも記録する
+        manifest = RunManifest.for_directory(output_dir)
+        if shard is not None:
+            manifest.node = shard.node
+        started_at = time.time()
+
+        # 失敗したジョブは待ち時間を付けてキューの末尾に戻し、再試行する
+        policy = RetryPolicy(args.max_attempts, args.retry_budget)
+        work_queue = RetryQueue(more_input=True)
+
+        # 段階別の所要時間は --trace / --profile 指定時だけ記録する
+        trace = None
+        if args.trace or args.profile:
+            trace = TraceRecorder(args.trace, args.profile, os.path.join(output_dir, "profiles"))
+
+        # 変換エンジンを準備する（auto の場合は入力の先頭のページで試し変換して選ぶ）
+        # 行ごとにエンジン・プリセットが指定されていれば、その組み合わせを最初に使うときに準備する
+        # WeasyPrintは --jobs 個の描画プロセスで描画する（--profile は自プロセスで計測するため使わない）
+        engine = open_engine(args.engine, args.jobs, http=cache.http if cache is not None else None,
+                             cache=cache, sample_urls=sample_urls,
+                             fetch=cache.get if cache is not None else None, preset=args.preset,
+                             process_limits=None if args.profile else process_limits(args.recycle_after,
+                                                                                     args.max_worker_rss_mb))
+        engines = EngineSet(engine, args.jobs, http=cache.http if cache is not None else None, cache=cache)
+        if args.engine == AUTO:
+            print()
 
-        # URLごとにPDFを生成
-        for i, url in enumerate(urls, 1):
+        # 同名の出力先は最初の行だけが担当する（出力先ごとに最初の行番号を覚える）
+        claimed_paths = Deduplicator()
+
+        def targets():
+            """変換対象の行と、他のノードの担当分を引き受けたかどうかを返す"""
+            for record in records:
+                if shard is None or shard.owns(record.shard_key):
+                    yield record, False
+            if args.steal:
+                # 自分の担当分を読み終えたら入力を読み直し、他のノードがまだ手を付けていない行を引き受ける
+                for record in read_records(input_file_path, args.input_format, args.year):
+                    if record.error is None and not shard.owns(record.shard_key):
+                        yield record, True
+
+        def submit(i, record, stolen=False):
+            """1行分の変換ジョブを投入し、結果の表示に使う (番号, URL, ファイル名, 結果, エラー, 引き受けたか) を返す
+
+            他のノードの担当分は、引き受けて変換する場合だけ返す（それ以外はNone）。
+            """
             try:
-                # ファイル名を生成
-                course_id = extract_course_id_from_url(url)
-                filename = sanitize_filename(f"{course_id}.pdf")
+                if record.error:
+                    raise ValueError(f"{record.line}行目: {record.error}")
+                filename = record.filename()
                 output_path = os.path.join(output_dir, filename)
 
-                # 既にファイルが存在する場合はスキップ
-                if os.path.exists(output_path):
-                    print(f"[{i}/{len(urls)}] スキップ（既に存在）: {filename}")
-                    success_count += 1
-                    continue
+                # マニフェストにない既存ファイル（マニフェスト導入前の出力）は完了済みとして登録
+                status = manifest.status(output_path)
+                if status is None and os.path.exists(output_path):
+                    manifest.mark_existing(output_path, record.url)
+                    status = STATUS_DONE
+
+                # 変換済み（--resume時は前回失敗、--retry-failed時は失敗以外）はスキップ
+                if not manifest.should_convert(status, args.resume, args.retry_failed, output_path):
+                    return None if stolen else (i, record.url, filename, status, None, stolen)
+
+                # 同じファイル名になる先行の行がある場合はその結果に従う
+                claimed = claimed_paths.add(manifest.key(output_path), i)
+                if claimed is not None:
+                    return None if stolen else (i, record.url, filename, claimed, None, stolen)
+
+                # 分担する場合は変換前に出力先を確保する（他のノードが確保中・変換済みならスキップ）
+                if args.steal and not manifest.claim(output_path, since=started_at):
+                    return None if stolen else (i, record.url, filename, CLAIMED_ELSEWHERE, None, stolen)
+
+                future = Future()
+                job_engine = engines.get(record.engine, record.preset)
+                work_queue.put((record.url, output_path, future, 1, [], job_engine))
+                return i, record.url, filename, future, None, stolen
+            except Exception as e:
+                return i, record.url or record.label, None, None, e, stolen
+
+        def record_failure(url, reason, error_class):
+            failure_classes[error_class] += 1
+            if len(failures) < MAX_LISTED_FAILURES:
+                failures.append((url, reason, error_class))
+
+        def report(job):
+            """ジョブの結果を表示する（入力の順に呼ぶ）"""
+            nonlocal success_count, stolen_count, elsewhere_count
+            i, url, filename, future, error, stolen = job
+            if error is not None:
+                print(f"[{i}] エラー: {url} - {error}")
+                record_failure(url, str(error), ERROR_OTHER)
+                return
+
+            if future == STATUS_DONE:
+                print(f"[{i}] スキップ（変換済み）: {filename}")
+                success_count += 1
+                return
 
-                print(f"[{i}/{len(urls)}] 変換中: {url}")
-                print(f"                -> {filename}")
+            if future == CLAIMED_ELSEWHERE:
+                print(f"[{i}] スキップ（他のノードが変換中・変換済み）: {filename}")
+                elsewhere_count += 1
+                return
 
-                success = convert_url_to_pdf(url, output_path)
+            if isinstance(future, str) or future is None:
+                reason = "前回失敗" if future == STATUS_FAILED else "再試行の対象外"
+                print(f"[{i}] スキップ（{reason}）: {filename}")
+                return
 
-                if success:
-                    print(f"                ✓ 成功")
+            if isinstance(future, int):
+                # 先行の行の結果は表示済みなので、マニフェストに記録された結果を見る
+                status, error_class = manifest.state(os.path.join(output_dir, filename))
+                if status == STATUS_DONE:
+                    print(f"[{i}] スキップ（既に存在）: {filename}")
                     success_count += 1
                 else:
-                    print(f"                ✗ 失敗")
+                    print(f"[{i}] スキップ（[{future}]と同じファイル名で、変換に失敗）: {filename}")
+                    record_failure(url, f"[{future}]と出力先が重複", error_class or ERROR_OTHER)
+                return
 
+            print(f"[{i}] 変換中{'（他のノードの担当分を引き受け）' if stolen else ''}: {url}")
+            print(f"                -> {filename}")
+
+            try:
+                success, messages, error_class = future.result()
             except Exception as e:
-                print(f"[{i}/{len(urls)}] エラー: {url} - {e}")
+                success, messages, error_class = False, [f'PDF変換失敗 {url}: {e}'], classify_error(e)
+            if args.steal:
+                manifest.release(os.path.join(output_dir, filename))
+            if stolen:
+                stolen_count += 1
+
+            for message in messages:
+                print(message)
+
+            if success:
+                print(f"                ✓ 成功")
+                success_count += 1
+            else:
+                print(f"                ✗ 失敗")
+                record_failure(url, messages[-1] if messages else "不明なエラー", error_class)
+
+        def report_all(jobs):
+            """キューのジョブを終わりの印(None)まで順に表示する
+
+            1件の表示でエラーが起きても止まらずに読み続ける（止まると入力側が
+            満杯のキューへの投入で待ち続けてしまう）。
+            """
+            for job in iter(jobs.get, None):
+                try:
+                    report(job)
+                except Exception as e:
+                    print(f"[{job[0]}] 結果の処理でエラー: {job[1]} - {e}")
 
+        with ThreadPoolExecutor(max_workers=args.jobs, thread_name_prefix="convert") as executor:
+            for _ in range(args.jobs):
+                executor.submit(convert_worker, work_queue, policy, cache, manifest, trace, engine)
+
+            # 結果は別スレッドで入力の順に表示する
+            # （先読みは並列数の READ_AHEAD_PER_JOB 倍までにして、巨大な入力でもメモリを一定に保つ）
+            jobs = queue.Queue(maxsize=args.jobs * READ_AHEAD_PER_JOB)
+            reporter = threading.Thread(target=report_all, args=(jobs,), name="report")
+            reporter.start()
+            try:
+                for record, stolen in targets():
+                    job = submit(total + 1, record, stolen)
+                    if job is not None:
+                        total += 1
+                        jobs.put(job)
+            finally:
+                work_queue.end_input()
+                jobs.put(None)
+                reporter.join()
+                if args.steal:
+                    manifest.release_all()
+
+        if not total:
+            print("URLが見つかりませんでした。")
         print()
-        print(f"完了: {success_count}/{len(urls)} 件のPDFを生成しました")
+        print(f"完了: {success_count}/{total} 件のPDFを生成しました")
+        if claimed_paths.duplicates:
+            print(f"同じ出力先の重複: {claimed_paths.duplicates}件")
+        if shard is not None:
+            print(f"分担 {shard.label}: 担当 {total - stolen_count}件（うち他のノードが変換 {elsewhere_count}件）"
+                  f" / 引き受け {stolen_count}件（全体の状況は python shard_report.py {output_dir}）")
+        claimed_paths.close()
+        for line in engines.summary():
+            print(line)
+        engines.close()
+        # プリセットの削減量は、先頭の数件を default プリセットで描画し直したサイズと比べて見積もる
+        for line in manifest.size_summary(PresetReference(cache.http if cache is not None else None, cache)):
+            print(line)
+        if cache is not None:
+            print(f"HTTPキャッシュ: 未変更 {cache.hits}件 / ダウンロード {cache.misses}件")
+            for line in cache.http.limiter.summary():
+                print(f"実効レート {line}")
+        if policy.retries:
+            print(f"再試行: {policy.retries}回（上限 {policy.budget}回）")
+        if policy.budget_exhausted:
+            print(f"再試行の上限に達したため再試行しなかった失敗: {policy.budget_exhausted}件")
+        if trace is not None:
+            for line in trace.summary():
+                print(line)
+            for path, seconds, url in trace.close():
+                print(f"プロファイル: {path}（{seconds:.2f}秒 {url}）")
+            if args.trace:
+                print(f"トレース: {args.trace}")
+
+        if failures:
+            failure_count = sum(failure_classes.values())
+            print(f"\n失敗したURL（{failure_count}件）:")
+            for url, reason, error_class in failures:
+                print(f"  ✗ {url}")
+                print(f"      [{ERROR_LABELS[error_class]}] {reason}")
+            if failure_count > len(failures):
+                print(f"  …ほか {failure_count - len(failures)}件（マニフェストに記録されています）")
+            print("\n失敗の内訳:")
+            for line in summarize_failures(failure_classes.elements()):
+                print(f"  {line}")
 
     except Exception as e:
         print(f"エラーが発生しました: {e}")
+    finally:
+        # 中断・エラー時も wkhtmltopdf や描画プロセスを終了させる（終了済みなら何もしない）
+        if engines is not None:
+            engines.close()
+        if manifest is not None:
+            manifest.close()
 
-    input("Enterキーを押して終了...")
+    if input_file_path != STDIN:
+        input("Enterキーを押して終了...")
 
 if __name__ == "__main__":
+    # 描画プロセスを実行ファイル（PyInstaller）からも起動できるようにする
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
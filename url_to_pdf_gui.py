@@ -1,24 +1,176 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
+import argparse
+import multiprocessing
+import queue
 import os
-import re
-import requests
-from urllib.parse import urlparse
-import weasyprint
-from weasyprint import HTML, CSS
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http_session import SharedHTTPSession
+from host_limiter import HostRateLimiter, parse_host_limit
+from http_cache import HTTPCache, DEFAULT_MAX_CACHE_MB
+from run_manifest import RunManifest, STATUS_DONE, temporary_output
+from content_fingerprint import content_hash, link_or_copy
+from gui_events import GuiEventPump
+from retry_policy import (RetryPolicy, RetryQueue, ERROR_LABELS, ERROR_OTHER, ERROR_RENDERER,
+                          classify_error, summarize_failures)
+from stage_trace import TraceRecorder, timed
+from pdf_engines import (CALIBRATION_SAMPLE, ENGINE_CHOICES, DEFAULT_PRESET, OUTPUT_PRESETS, EngineSet,
+                         PresetReference, WeasyPrintEngine, open_engine)
+from input_records import Deduplicator, count_records, peek, read_records
+from sharding import parse_shard
+from render_workers import DEFAULT_MAX_RSS_MB, DEFAULT_RECYCLE_DOCUMENTS, process_limits
+
+class FetchRenderPipeline:
+    """asyncioの取得ステージで先読みしたページを描画ステージへ渡すパイプライン
+
+    描画ステージは results() で受け取った各ジョブについて task_done() か retry() を呼ぶ。
+    retry() したジョブは待ち時間の後に取得からやり直す。
+    traceを指定すると、ジョブごとのStageTimerを fetch(url, timer) に渡して取得から計測する。
+    ジョブは入力を読みながら投入し、取得待ち・処理中のジョブが backlog 件を超えないようにする。
+    """
+
+    def __init__(self, fetch, concurrency=4, queue_depth=8, trace=None):
+        self.fetch = fetch
+        self.trace = trace
+        self.concurrency = max(1, concurrency)
+        self.queue = queue.Queue(maxsize=max(1, queue_depth))
+        # 取得中・取得済み・描画中のジョブがすべて埋まっても、次に取得するジョブが残る件数
+        self.backlog = self.concurrency * 2 + self.queue.maxsize
+        self.jobs = None
+        self.feed_error = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self, jobs):
+        """jobs（イテレーター）を読み進めながら、取得ステージを別スレッドのイベントループで開始する"""
+        import asyncio  # 起動を速くするため、最初の変換まで読み込まない
+        self.jobs = RetryQueue(more_input=True)
+        threading.Thread(target=self._feed, args=(jobs,), daemon=True).start()
+        self.thread = threading.Thread(target=asyncio.run, args=(self._fetch_stage(),), daemon=True)
+        self.thread.start()
+
+    def _feed(self, jobs):
+        try:
+            for job in jobs:
+                if not self.jobs.wait_for_room(self.backlog):
+                    return
+                self.jobs.put(job)
+        except Exception as e:
+            # 入力の読み取りエラーは描画ステージの終了後に表示する
+            self.feed_error = e
+        finally:
+            self.jobs.end_input()
+
+    def stop(self):
+        """取得ステージを停止する（取得済みのページは破棄される）"""
+        self.stop_event.set()
+        if self.jobs is not None:
+            self.jobs.close()
+
+    def task_done(self):
+        """results() で受け取ったジョブの処理が終わったことを知らせる"""
+        self.jobs.task_done()
+
+    def retry(self, job, delay):
+        """ジョブをdelay秒後に取得からやり直す（他のジョブの取得は止めない）"""
+        self.jobs.retry(job, delay)
+
+    def results(self):
+        """取得が完了した順に (job, page, error, timer) を返す（traceなしではtimerはNone）"""
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return
+                continue
+            if item is None:
+                return
+            yield item
+
+    async def _fetch_stage(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+
+        async def worker(executor, waiter):
+            # 同じキューを全ワーカーで共有し、空いたワーカーが次のURLを取る
+            # （再試行待ちのジョブは待ち時間が過ぎるとキューの末尾から取り出される）
+            while not self.stop_event.is_set():
+                job = await loop.run_in_executor(waiter, self.jobs.get)
+                if job is None:
+                    return
+                # cProfileは描画ステージのスレッドで開始する
+                timer = self.trace.timer(job[1], profile=False) if self.trace is not None else None
+                try:
+                    page = await loop.run_in_executor(executor, self.fetch, job[1], timer)
+                    item = (job, page, None, timer)
+                except Exception as e:
+                    if timer is not None:
+                        timer.fail(e)
+                    item = (job, None, e, timer)
+                # キューが満杯の間は待機し、描画ステージより先に進みすぎないようにする
+                if not await loop.run_in_executor(waiter, self._put, item):
+                    return
+
+        # ジョブ待ち・キュー待ちはワーカーごとに1スレッドを確保し、待機同士で詰まらないようにする
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as waiter:
+            await asyncio.gather(*(worker(executor, waiter) for _ in range(self.concurrency)))
+
+        self._put(None)
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
 class URLtoPDFConverter:
-    def __init__(self, root):
+    def __init__(self, root, cache_dir=None, max_cache_mb=DEFAULT_MAX_CACHE_MB, host_limits=None,
+                 trace_path=None, profile_top=0, shard=None, steal=False, process_limits=None):
         self.root = root
         self.root.title("URL to PDF Converter")
         self.root.geometry("700x600")
 
         # 変換中フラグ
         self.converting = False
+        self.pipeline = None
+
+        # keep-aliveの接続プール（変換開始時に同時取得数に合わせて作り直す）
+        self.http = SharedHTTPSession()
+
+        # ホストごとの送信速度・同時接続数の設定（未指定のホストは既定値から自動調整）
+        self.host_limits = host_limits or {}
+
+        # 再実行時に未変更ページを再ダウンロードしないためのHTTPキャッシュ
+        self.cache_dir = cache_dir
+        self.max_cache_mb = max_cache_mb
+        self.cache = None
+
+        # PDF変換エンジン（変換開始時に選択されたものを準備し、行ごとの指定があれば追加する EngineSet）
+        self.engine = None
+
+        # 段階別の所要時間の記録先（JSONL）と、プロファイルを保存する遅い文書の件数
+        self.trace_path = trace_path
+        self.profile_top = profile_top
+
+        # 複数のPCで1つのリストを分担する場合の担当（sharding.Shard）と、他の担当分を引き受けるか
+        self.shard = shard
+        self.steal = steal
+
+        # WeasyPrintの描画プロセスを入れ替える (文書数, RSSの上限MB)。Noneならこのプロセスで描画する
+        self.process_limits = process_limits
 
         self.create_widgets()
 
+        # ワーカースレッドからのログ・進捗はキュー経由でメインループが一定間隔で反映する
+        self.events = GuiEventPump(self.root, self.log_text, self.progress_var, self.progress_bar)
+
     def create_widgets(self):
         # メインフレーム
         main_frame = ttk.Frame(self.root, padding="10")
@@ -49,7 +201,35 @@ class URLtoPDFConverter:
 
         self.skip_existing_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(options_frame, text="既存ファイルをスキップ",
-                       variable=self.skip_existing_var).grid(row=0, column=0, sticky=tk.W)
+                       variable=self.skip_existing_var).grid(row=0, column=0, columnspan=4, sticky=tk.W)
+
+        ttk.Label(options_frame, text="同時取得数:").grid(row=1, column=0, sticky=tk.W)
+        self.fetch_concurrency_var = tk.StringVar(value="4")
+        ttk.Spinbox(options_frame, from_=1, to=32, textvariable=self.fetch_concurrency_var,
+                    width=5).grid(row=1, column=1, sticky=tk.W, padx=(5, 20))
+
+        ttk.Label(options_frame, text="先読み数:").grid(row=1, column=2, sticky=tk.W)
+        self.queue_depth_var = tk.StringVar(value="8")
+        ttk.Spinbox(options_frame, from_=1, to=100, textvariable=self.queue_depth_var,
+                    width=5).grid(row=1, column=3, sticky=tk.W, padx=5)
+
+        self.retry_failed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="前回失敗したURLのみ再試行",
+                       variable=self.retry_failed_var).grid(row=2, column=0, columnspan=4, sticky=tk.W)
+
+        self.refresh_changed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="変換済みでも内容が変わったURLは再変換",
+                       variable=self.refresh_changed_var).grid(row=3, column=0, columnspan=4, sticky=tk.W)
+
+        ttk.Label(options_frame, text="変換エンジン:").grid(row=4, column=0, sticky=tk.W)
+        self.engine_var = tk.StringVar(value=WeasyPrintEngine.name)
+        ttk.Combobox(options_frame, textvariable=self.engine_var, values=ENGINE_CHOICES,
+                     state="readonly", width=12).grid(row=4, column=1, columnspan=3, sticky=tk.W, padx=5)
+
+        ttk.Label(options_frame, text="出力サイズ:").grid(row=5, column=0, sticky=tk.W)
+        self.preset_var = tk.StringVar(value=DEFAULT_PRESET)
+        ttk.Combobox(options_frame, textvariable=self.preset_var, values=list(OUTPUT_PRESETS),
+                     state="readonly", width=12).grid(row=5, column=1, columnspan=3, sticky=tk.W, padx=5)
 
         # 変換ボタン
         button_frame = ttk.Frame(main_frame)
@@ -92,7 +272,8 @@ class URLtoPDFConverter:
     def select_file(self):
         filename = filedialog.askopenfilename(
             title="URLリストファイルを選択",
-            filetypes=[("テキストファイル", "*.txt"), ("すべてのファイル", "*.*")]
+            filetypes=[("URLリスト", "*.txt *.csv *.tsv *.jsonl *.ndjson"), ("テキストファイル", "*.txt"),
+                       ("すべてのファイル", "*.*")]
         )
         if filename:
             self.file_path_var.set(filename)
@@ -106,78 +287,39 @@ class URLtoPDFConverter:
             self.output_dir_var.set(dirname)
 
     def log(self, message):
-        """ログメッセージを表示"""
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
-
-    def sanitize_filename(self, filename):
-        """ファイル名から無効な文字を削除または置換する"""
-        return re.sub(r'[^a-zA-Z0-9_\-.]', '_', filename)
-
-    def extract_course_id_from_url(self, url):
-        """URLからコースIDを抽出する"""
-        match = re.search(r'SyllabusHtml\.2025\.([A-Za-z0-9]+)\.html', url)
-        if match:
-            return match.group(1)
-
-        # syllabus形式でない場合は、URLから適当なファイル名を生成
-        parsed_url = urlparse(url)
-        filename = os.path.basename(parsed_url.path)
-        if filename and filename.endswith('.html'):
-            return filename[:-5]
-        elif filename:
-            return filename
-        else:
-            path_parts = [part for part in parsed_url.path.split('/') if part]
-            if path_parts:
-                return path_parts[-1]
-            else:
-                return parsed_url.netloc.replace('.', '_')
-
-    def convert_url_to_pdf(self, url, output_path):
-        """WeasyPrintを使用してURLをPDFに変換する"""
+        """ログメッセージを表示（どのスレッドからでも呼べる。表示はメインループでまとめて行う）"""
+        self.events.log(message)
+
+    def fetch_html(self, url, timer=None):
+        """URLのページを取得する（HTTPキャッシュで再検証し、未変更なら保存済みの本文を使う）
+
+        取得ステージのスレッドで文字コードの判定まで済ませたCachedResponseを返す。
+        """
+        if self.cache is None:
+            self.cache = HTTPCache(self.cache_dir, self.max_cache_mb, http=self.http)
+        with timed(timer, 'fetch'):
+            page = self.cache.get(url, timeout=30)
+        if timer is not None:
+            timer.response(page)
+        with timed(timer, 'decode'):
+            page.text
+        return page
+
+    def render_pdf(self, page, output_path, timer=None, engine=None):
+        """取得済みのページを変換エンジン（省略時は選択中のエンジン）でPDFにする"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            response.encoding = response.apparent_encoding or 'utf-8'
-
-            # CSS for better PDF formatting
-            css_style = CSS(string="""
-                @page {
-                    size: A4;
-                    margin: 2cm;
-                }
-                body {
-                    font-family: "Helvetica", "Arial", sans-serif;
-                    font-size: 12pt;
-                    line-height: 1.4;
-                }
-                table {
-                    border-collapse: collapse;
-                    width: 100%;
-                }
-                th, td {
-                    border: 1px solid #ddd;
-                    padding: 8px;
-                    text-align: left;
-                }
-                th {
-                    background-color: #f2f2f2;
-                }
-            """)
-
-            html_doc = HTML(string=response.text, base_url=url)
-            html_doc.write_pdf(output_path, stylesheets=[css_style])
+            # 一時ファイルに書き出し、完成してから出力パスに置き換える
+            with temporary_output(output_path) as temp_path:
+                (engine or self.engine.default).render_page(page, temp_path, timer)
+                with timed(timer, 'write'):
+                    os.replace(temp_path, output_path)
 
             return True
 
         except Exception as e:
             self.log(f"    エラー: {str(e)}")
+            if timer is not None:
+                timer.fail(e)
             return False
 
     def start_conversion(self):
@@ -201,7 +343,7 @@ class URLtoPDFConverter:
         self.converting = True
 
         # ログをクリア
-        self.log_text.delete(1.0, tk.END)
+        self.events.clear()
 
         # 別スレッドで変換処理を実行
         self.conversion_thread = threading.Thread(target=self.conversion_worker)
@@ -211,6 +353,8 @@ class URLtoPDFConverter:
     def stop_conversion(self):
         """変換処理を停止"""
         self.converting = False
+        if self.pipeline:
+            self.pipeline.stop()
         self.log("停止が要求されました...")
 
     def conversion_worker(self):
@@ -219,82 +363,360 @@ class URLtoPDFConverter:
             # 出力ディレクトリを作成
             os.makedirs(self.output_dir_var.get(), exist_ok=True)
 
-            # URLリストを読み取る
-            with open(self.file_path_var.get(), 'r', encoding='utf-8') as file:
-                urls = [line.strip() for line in file.readlines() if line.strip()]
+            # ログ欄には直近の行だけを残し、全ログは出力ディレクトリのファイルに書き出す
+            log_path = self.events.open_log_file(self.output_dir_var.get(), "url_to_pdf")
+            self.log(f"ログファイル: {log_path}")
 
-            if not urls:
+            # URLリストは1行ずつ読み、読んだ行から順に取得を始める（件数は進捗表示用に先に数える）
+            # 分担する場合は担当の件数を数える（他のノードの分を引き受けると増える）
+            input_path = self.file_path_var.get()
+            if self.shard is None:
+                total_urls = count_records(input_path)
+            else:
+                total_urls = sum(1 for record in read_records(input_path) if self.shard.owns(record.shard_key))
+            if not total_urls and not self.steal:
                 self.log("URLが見つかりませんでした")
                 return
 
-            total_urls = len(urls)
-            self.progress_bar.config(maximum=total_urls)
+            self.events.progress(maximum=total_urls)
 
             self.log(f"変換開始: {total_urls}個のURL")
             self.log(f"出力先: {self.output_dir_var.get()}")
+            if self.shard is not None:
+                self.log(f"分担: {self.shard.label}（{self.shard.node}"
+                         f"{'、終わったら他の担当分を引き受け' if self.steal else ''}）")
             self.log("=" * 50)
 
-            success_count = 0
-
-            for i, url in enumerate(urls):
-                if not self.converting:
-                    self.log("変換が停止されました")
-                    break
-
-                # 進捗更新
-                self.progress_var.set(f"[{i+1}/{total_urls}] 変換中...")
-                self.progress_bar.config(value=i)
-
-                try:
-                    # ファイル名を生成
-                    course_id = self.extract_course_id_from_url(url)
-                    filename = self.sanitize_filename(f"{course_id}.pdf")
-                    output_path = os.path.join(self.output_dir_var.get(), filename)
-
-                    # 既存ファイルのスキップチェック
-                    if self.skip_existing_var.get() and os.path.exists(output_path):
-                        self.log(f"[{i+1}/{total_urls}] スキップ（既に存在）: {filename}")
-                        success_count += 1
-                        continue
-
-                    self.log(f"[{i+1}/{total_urls}] 変換中: {url}")
-                    self.log(f"    -> {filename}")
-
-                    success = self.convert_url_to_pdf(url, output_path)
+            # 取得前のスキップ判定（入力を読むスレッド）と描画ステージの両方から数える
+            counts = {'done': 0, 'success': 0, 'total': total_urls, 'stolen': 0, 'elsewhere': 0}
+            counts_lock = threading.Lock()
 
+            def count_done(success=False):
+                with counts_lock:
+                    counts['done'] += 1
                     if success:
-                        self.log("    ✓ 成功")
-                        success_count += 1
-                    else:
-                        self.log("    ✗ 失敗")
-
-                except Exception as e:
-                    self.log(f"[{i+1}/{total_urls}] エラー: {str(e)}")
+                        counts['success'] += 1
+                    self.events.progress(value=counts['done'])
+
+            # スキップ判定は出力ディレクトリのマニフェストで行単位に行う（全件を読み込まない）
+            manifest = RunManifest.for_directory(self.output_dir_var.get())
+            if self.shard is not None:
+                manifest.node = self.shard.node
+            started_at = time.time()
+            retry_failed = self.retry_failed_var.get()
+            refresh_changed = self.refresh_changed_var.get() and not retry_failed
+            skip_existing = self.skip_existing_var.get() or retry_failed
+
+            # 取得ステージとWeasyPrintのサブリソース取得で接続プールを共有する
+            concurrency = int(self.fetch_concurrency_var.get())
+            self.http.close()
+            self.http = SharedHTTPSession(pool_size=concurrency + 1,
+                                          limiter=HostRateLimiter(self.host_limits))
+            self.cache = HTTPCache(self.cache_dir, self.max_cache_mb, http=self.http)
+
+            # 変換エンジンを準備する（auto の場合は入力の先頭のページで試し変換して選ぶ）
+            # 行ごとにエンジン・プリセットが指定されていれば、その組み合わせを最初に使うときに準備する
+            records = read_records(input_path)
+            head, records = peek(records, CALIBRATION_SAMPLE * 3)
+            # 描画は入れ替える子プロセスで行い、長い実行でもこのプロセスのメモリが増えないようにする
+            # （--profile は描画を自プロセスで計測するため、子プロセスを使わない）
+            engine = open_engine(self.engine_var.get(), http=self.http, cache=self.cache,
+                                 sample_urls=[record.url for record in head if record.error is None],
+                                 fetch=self.cache.get, log=self.log, preset=self.preset_var.get(),
+                                 process_limits=None if self.profile_top else self.process_limits)
+            self.engine = EngineSet(engine, http=self.http, cache=self.cache, log=self.log)
+
+            # 同じファイル名になる行は最初の行だけを変換する
+            claimed_paths = Deduplicator()
+
+            def targets():
+                """変換対象の行と、他のノードの担当分を引き受けたかどうかを返す"""
+                for record in records:
+                    if self.shard is None or self.shard.owns(record.shard_key):
+                        yield record, False
+                if self.steal:
+                    # 自分の担当分を読み終えたら入力を読み直し、他のノードがまだ手を付けていない行を引き受ける
+                    for record in read_records(input_path):
+                        if record.error is None and not self.shard.owns(record.shard_key):
+                            yield record, True
+
+            def pending_jobs():
+                """取得対象のジョブを入力の順に返す（変換済み・重複・誤った行は取得前にスキップ）
+
+                他のノードの担当分は、引き受ける行だけに番号を付けて返す（スキップしてもログに出さない）。
+                """
+                i = 0
+                for record, stolen in targets():
+                    if not self.converting:
+                        return
+                    if not stolen:
+                        i += 1
+                    try:
+                        if record.error:
+                            raise ValueError(f"{record.line}行目: {record.error}")
+                        filename = record.filename()
+                        output_path = os.path.join(self.output_dir_var.get(), filename)
+
+                        # 変換済みのスキップチェック（マニフェスト導入前の既存ファイルは完了済みとして登録）
+                        # 引き受ける行は他のノードが変換済みでないものだけにする
+                        if skip_existing or stolen:
+                            status = manifest.status(output_path)
+                            if status is None and os.path.exists(output_path):
+                                manifest.mark_existing(output_path, record.url)
+                                status = STATUS_DONE
+
+                            # 内容の変更を確認する場合、変換済みのURLも取得してハッシュを比較する
+                            recheck = refresh_changed and status == STATUS_DONE
+                            if not recheck and not manifest.should_convert(status, retry_failed=retry_failed,
+                                                                                output_path=output_path):
+                                if stolen:
+                                    continue
+                                if status == STATUS_DONE:
+                                    self.log(f"[{i}/{counts['total']}] スキップ（変換済み）: {filename}")
+                                else:
+                                    self.log(f"[{i}/{counts['total']}] スキップ（再試行の対象外）: {filename}")
+                                count_done(status == STATUS_DONE)
+                                continue
+
+                            # 同じファイル名のURLが先にある場合はスキップ
+                            claimed = claimed_paths.add(manifest.key(output_path), i)
+                            if claimed is not None:
+                                if not stolen:
+                                    self.log(f"[{i}/{counts['total']}] スキップ（[{claimed}]と同じファイル名）: {filename}")
+                                    count_done()
+                                continue
+
+                        # 分担する場合は取得前に出力先を確保する（他のノードが確保中・変換済みならスキップ）
+                        if self.steal and not manifest.claim(output_path, since=started_at):
+                            if not stolen:
+                                self.log(f"[{i}/{counts['total']}] スキップ（他のノードが変換中・変換済み）: {filename}")
+                                counts['elsewhere'] += 1
+                                count_done()
+                            continue
+
+                        if stolen:
+                            i += 1
+                            with counts_lock:
+                                counts['total'] += 1
+                                counts['stolen'] += 1
+                                self.events.progress(maximum=counts['total'])
+                        job_engine = self.engine.get(record.engine, record.preset)
+                        yield i, record.url, filename, output_path, job_engine
+
+                    except Exception as e:
+                        self.log(f"[{i}/{counts['total']}] エラー: {str(e)}")
+                        count_done()
+
+            # 段階別の所要時間は --trace / --profile 指定時だけ記録する
+            trace = None
+            if self.trace_path or self.profile_top:
+                trace = TraceRecorder(self.trace_path, self.profile_top,
+                                      os.path.join(self.output_dir_var.get(), "profiles"))
+
+            # 取得ステージが先読みしたページを順に描画する
+            self.pipeline = FetchRenderPipeline(self.fetch_html,
+                                                concurrency=concurrency,
+                                                queue_depth=int(self.queue_depth_var.get()),
+                                                trace=trace)
+            self.pipeline.start(pending_jobs())
+
+            # 失敗したURLは待ち時間を付けて取得からやり直す（待ち時間中も他のURLを処理する）
+            retry_policy = RetryPolicy()
+            attempts = {}
+            failure_classes = []
+            try:
+                for job, page, error, timer in self.pipeline.results():
+                    if not self.converting:
+                        break
+                    i, url, filename, output_path, engine = job
+                    attempts[i] = attempts.get(i, 0) + 1
+                    retry_delay = None
+                    error_class = None
+                    if timer is not None:
+                        timer.attempt = attempts[i]
+                        timer.start_profile()
+
+                    # 進捗更新
+                    self.events.progress(text=f"[{i}/{counts['total']}] 変換中...")
+
+                    try:
+                        # 正規化したHTMLのハッシュが前回と同じエンジン・プリセットでの描画時と同じなら描画しない
+                        # （PDFが削除されていれば描画する）
+                        digest = content_hash(page.text) if error is None else None
+                        if (refresh_changed and digest is not None
+                                and manifest.content_hash(output_path, engine) == digest
+                                and os.path.exists(output_path)):
+                            self.log(f"[{i}/{counts['total']}] スキップ（内容に変更なし）: {filename}")
+                            manifest.mark_unchanged(output_path, url)
+                            success = True
+                            if timer is not None:
+                                timer.result = 'unchanged'
+                            continue
+
+                        self.log(f"[{i}/{counts['total']}] 変換中: {url}")
+                        self.log(f"    -> {filename}")
+
+                        started = time.perf_counter()
+                        manifest.start(output_path, url)
+                        if error is not None:
+                            self.log(f"    エラー: {str(error)}")
+                            error_class = classify_error(error)
+                            success = False
+                        else:
+                            error_class = ERROR_RENDERER
+                            # 別のURLで同じ内容を同じ設定で描画済みなら、そのPDFをハードリンクする
+                            source_path = manifest.find_by_content_hash(digest, engine) if refresh_changed else None
+                            if source_path and source_path != os.path.abspath(output_path) and os.path.exists(source_path):
+                                with timed(timer, 'write'):
+                                    link_or_copy(source_path, output_path)
+                                self.log(f"    = 同じ内容のPDFをリンク: {os.path.basename(source_path)}")
+                                if timer is not None:
+                                    timer.result = 'linked'
+                                success = True
+                            else:
+                                success = self.render_pdf(page, output_path, timer, engine)
+
+                        if success:
+                            error_class = None
+                            with timed(timer, 'manifest'):
+                                manifest.finish(output_path, time.perf_counter() - started, url,
+                                                content_hash=digest, engine=engine)
+                            self.log("    ✓ 成功")
+                        else:
+                            with timed(timer, 'manifest'):
+                                manifest.fail(output_path, time.perf_counter() - started,
+                                              str(error) if error is not None else None, url,
+                                              error_class=error_class)
+                            retry_delay = retry_policy.next_delay(error_class, attempts[i])
+                            if retry_delay is not None:
+                                self.log(f"    ✗ 失敗（{ERROR_LABELS[error_class]}）: {retry_delay:.1f}秒後に再試行します")
+                            else:
+                                self.log(f"    ✗ 失敗（{ERROR_LABELS[error_class]}）")
+                                failure_classes.append(error_class)
+
+                    except Exception as e:
+                        self.log(f"[{i}/{counts['total']}] エラー: {str(e)}")
+                        success = False
+                        failure_classes.append(ERROR_OTHER)
+                        error_class = ERROR_OTHER
+                        if timer is not None:
+                            timer.fail(e)
+
+                    finally:
+                        if timer is not None:
+                            trace.record(timer, error_class, output_path)
+                        if retry_delay is not None:
+                            self.pipeline.retry(job, retry_delay)
+                        else:
+                            self.pipeline.task_done()
+                            attempts.pop(i, None)
+                            if self.steal:
+                                manifest.release(output_path)
+                            count_done(success)
+            finally:
+                self.pipeline.stop()
+                if self.steal:
+                    manifest.release_all()
+                manifest.close()
+
+            if self.pipeline.feed_error is not None:
+                self.log(f"URLリストの読み取りエラー: {self.pipeline.feed_error}")
+            if claimed_paths.duplicates:
+                self.log(f"同じファイル名の重複: {claimed_paths.duplicates}件")
+            claimed_paths.close()
+            success_count = counts['success']
+            total_urls = counts['total']
+            if not self.converting and counts['done'] < total_urls:
+                self.log("変換が停止されました")
 
             # 完了
-            self.progress_bar.config(value=total_urls)
-            self.progress_var.set("完了")
+            self.events.progress(value=total_urls, text="完了")
 
             self.log("=" * 50)
             self.log(f"変換完了: {success_count}/{total_urls} 件のPDFを生成しました")
+            if self.shard is not None:
+                self.log(f"分担 {self.shard.label}: 担当 {total_urls - counts['stolen']}件"
+                         f"（うち他のノードが変換 {counts['elsewhere']}件） / 引き受け {counts['stolen']}件")
+            self.log(f"HTTPキャッシュ: 未変更 {self.cache.hits}件 / ダウンロード {self.cache.misses}件")
+            for line in self.engine.summary():
+                self.log(line)
+            for line in manifest.size_summary(PresetReference(self.http, self.cache)):
+                self.log(line)
+            for line in self.http.limiter.summary():
+                self.log(f"実効レート {line}")
+            if retry_policy.retries:
+                self.log(f"再試行: {retry_policy.retries}回（上限 {retry_policy.budget}回）")
+            if trace is not None:
+                for line in trace.summary():
+                    self.log(line)
+                for path, seconds, trace_url in trace.close():
+                    self.log(f"プロファイル: {path}（{seconds:.2f}秒 {trace_url}）")
+                if self.trace_path:
+                    self.log(f"トレース: {self.trace_path}")
+            if failure_classes:
+                self.log(f"失敗の内訳（{len(failure_classes)}件）:")
+                for line in summarize_failures(failure_classes):
+                    self.log(f"    {line}")
 
             if self.converting:  # 正常完了の場合
-                messagebox.showinfo("完了", f"{success_count}/{total_urls} 件のPDFを生成しました")
+                self.events.call(messagebox.showinfo, "完了", f"{success_count}/{total_urls} 件のPDFを生成しました")
 
         except Exception as e:
             self.log(f"エラーが発生しました: {str(e)}")
-            messagebox.showerror("エラー", f"エラーが発生しました: {str(e)}")
+            self.events.call(messagebox.showerror, "エラー", f"エラーが発生しました: {str(e)}")
 
         finally:
+            # 変換エンジンと接続プールを解放
+            if self.engine is not None:
+                self.engine.close()
+                self.engine = None
+            self.http.close()
+
             # UIの状態を戻す
-            self.convert_button.config(state=tk.NORMAL)
-            self.stop_button.config(state=tk.DISABLED)
+            self.events.call(self.convert_button.config, state=tk.NORMAL)
+            self.events.call(self.stop_button.config, state=tk.DISABLED)
             self.converting = False
+            self.events.close_log_file()
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description="URL to PDF Converter (GUI)")
+    parser.add_argument("--cache-dir",
+                        help="HTTPキャッシュの保存先（デフォルト: ユーザーのキャッシュディレクトリ）")
+    parser.add_argument("--max-cache-mb", type=float, default=DEFAULT_MAX_CACHE_MB,
+                        help=f"HTTPキャッシュの上限サイズ（MB、デフォルト: {DEFAULT_MAX_CACHE_MB}）")
+    parser.add_argument("--host-limit", action="append", type=parse_host_limit, default=[],
+                        metavar="HOST=RATE[:MAX]",
+                        help="ホストごとの毎秒リクエスト数と最大同時接続数（例: syllabus.u-hyogo.ac.jp=4:6）")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="URLごとの段階別の所要時間・バイト数・ステータスをJSONL形式で追記するファイル")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="描画をcProfileで計測し、遅かったN件のプロファイルを出力先の profiles/ に保存する")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="複数のPCで1つのリストを分担するときの担当（N台中I台目、例: 1/3）。URLのハッシュで分ける")
+    parser.add_argument("--steal", action="store_true",
+                        help="--shard の担当分が終わったら、他のPCの未着手の分を引き受ける（全台で指定する）")
+    parser.add_argument("--recycle-after", type=int, default=DEFAULT_RECYCLE_DOCUMENTS, metavar="N",
+                        help=f"WeasyPrintの描画プロセスをN件描画するごとに入れ替える（デフォルト: {DEFAULT_RECYCLE_DOCUMENTS}）")
+    parser.add_argument("--max-worker-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB, metavar="MB",
+                        help=f"描画プロセスのRSSがこれを超えたら入れ替える（デフォルト: {DEFAULT_MAX_RSS_MB}。"
+                             "両方0なら描画プロセスを使わない）")
+    args = parser.parse_args(argv)
+    if args.steal and args.shard is None:
+        parser.error("--steal は --shard と一緒に指定してください")
+    return args
 
 def main():
+    args = parse_args()
     root = tk.Tk()
-    app = URLtoPDFConverter(root)
+    app = URLtoPDFConverter(root, cache_dir=args.cache_dir, max_cache_mb=args.max_cache_mb,
+                            host_limits=dict(args.host_limit),
+                            trace_path=args.trace, profile_top=args.profile,
+                            shard=args.shard, steal=args.steal,
+                            process_limits=process_limits(args.recycle_after, args.max_worker_rss_mb))
     root.mainloop()
 
 if __name__ == "__main__":
+    # 描画プロセスを実行ファイル（PyInstaller）からも起動できるようにする
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
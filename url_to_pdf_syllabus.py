@@ -1,44 +1,80 @@
+import argparse
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
 import os
-import requests
-import subprocess
 import sys
 import datetime
+import itertools
+import multiprocessing
+import time
+from run_manifest import RunManifest, STATUS_DONE, temporary_output
+from content_fingerprint import content_hash, link_or_copy
+from gui_events import GuiEventPump
+from http_session import SharedHTTPSession
+from http_cache import HTTPCache
+from host_limiter import HostRateLimiter, parse_host_limit
+from retry_policy import (RetryPolicy, RetryQueue, ERROR_LABELS, ERROR_NOT_FOUND, ERROR_OTHER,
+                          ERROR_RENDERER, classify_error, summarize_failures)
+from stage_trace import TraceRecorder, timed
+from pdf_engines import (CALIBRATION_SAMPLE, ENGINE_CHOICES, DEFAULT_PRESET, OUTPUT_PRESETS, EngineSet,
+                         PresetReference, WkhtmltopdfEngine, probe_wkhtmltopdf, open_engine, syllabus_url)
+from input_records import Deduplicator, count_records, read_records
+from sharding import parse_shard
+from render_workers import DEFAULT_MAX_RSS_MB, DEFAULT_RECYCLE_DOCUMENTS, process_limits
+
+# 読み込んでキューに入れておく授業コードの数（変換ワーカー数に対する倍率）
+READ_AHEAD_PER_WORKER = 4
+
+# 存在しないと確認した授業コードを再確認せずにスキップする期間（日）
+DEFAULT_MISSING_TTL_DAYS = 7
 
 class SyllabusPDFConverter:
-    def __init__(self, root):
+    def __init__(self, root, host_limits=None, missing_ttl_days=DEFAULT_MISSING_TTL_DAYS,
+                 trace_path=None, profile_top=0, shard=None, steal=False, process_limits=None):
         self.root = root
+        self.host_limits = host_limits or {}
+        self.missing_ttl = missing_ttl_days * 24 * 60 * 60
+        # 段階別の所要時間の記録先（JSONL）と、プロファイルを保存する遅い授業の件数
+        self.trace_path = trace_path
+        self.profile_top = profile_top
+        self.trace = None
+        # 複数のPCで1つのリストを分担する場合の担当（sharding.Shard）と、他の担当分を引き受けるか
+        self.shard = shard
+        self.steal = steal
+        # WeasyPrintの描画プロセスを入れ替える (文書数, RSSの上限MB)。Noneならこのプロセスで描画する
+        self.process_limits = process_limits
         self.root.title("兵庫県立大学 シラバス PDF変換ツール")
         self.root.geometry("750x650")
         self.converting = False
-        self.wkhtmltopdf_path = self.find_wkhtmltopdf()
+        self.engine = None
+        self.manifest = None
+        self.cache = None
+        self.code_queue = None
+        self.log_lock = threading.Lock()
+        self.wkhtmltopdf_path = None
         self.create_widgets()
+        # ワーカースレッドからのログ・進捗はキュー経由でメインループが一定間隔で反映する
+        self.events = GuiEventPump(self.root, self.log_text, self.progress_var, self.progress_bar)
+        # wkhtmltopdf --version の確認はウィンドウの表示を待たせないよう別スレッドで行う
+        self.wkhtmltopdf_probe = threading.Thread(target=self.find_wkhtmltopdf, daemon=True)
+        self.wkhtmltopdf_probe.start()
 
     def find_wkhtmltopdf(self):
-        """wkhtmltopdfの場所を探す"""
-        possible_paths = [
-            r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe",
-            r"C:\Program Files (x86)\wkhtmltopdf\bin\wkhtmltopdf.exe",
-            r"wkhtmltopdf.exe"  # PATH環境変数にある場合
-        ]
-
-        for path in possible_paths:
-            try:
-                # Windowsでコマンドプロンプトウィンドウを表示しないように設定
-                startupinfo = None
-                if os.name == 'nt':  # Windows
-                    startupinfo = subprocess.STARTUPINFO()
-                    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                    startupinfo.wShowWindow = subprocess.SW_HIDE
-
-                result = subprocess.run([path, "--version"], capture_output=True, text=True, timeout=5, startupinfo=startupinfo)
-                if result.returncode == 0:
-                    return path
-            except:
-                continue
-        return None
+        """wkhtmltopdfの場所を探し、結果をステータス欄に反映する（別スレッドから呼ぶ）"""
+        path, version = probe_wkhtmltopdf()
+        self.wkhtmltopdf_path = path
+        self.events.call(self.show_wkhtmltopdf_status, path, version)
+
+    def show_wkhtmltopdf_status(self, path, version):
+        if path:
+            detail = f"（{version}）" if version else ""
+            self.status_label.config(text=f"✅ wkhtmltopdf 検出済み - PDF変換可能{detail}", foreground="green")
+            self.status_label.grid_configure(pady=(0, 15))
+        else:
+            self.status_label.config(text="❌ wkhtmltopdf が見つかりません", foreground="red")
+            self.status_label.grid_configure(pady=(0, 5))
+            self.help_label.grid()
 
     def create_widgets(self):
         main_frame = ttk.Frame(self.root, padding="15")
@@ -48,16 +84,14 @@ class SyllabusPDFConverter:
         ttk.Label(main_frame, text="兵庫県立大学 シラバス PDF変換ツール",
                  font=("Yu Gothic", 16, "bold")).grid(row=0, column=0, columnspan=4, pady=(0, 10))
 
-        # Status
-        if self.wkhtmltopdf_path:
-            status_text = "✅ wkhtmltopdf 検出済み - PDF変換可能"
-            ttk.Label(main_frame, text=status_text, foreground="green").grid(row=1, column=0, columnspan=4, pady=(0, 15))
-        else:
-            status_text = "❌ wkhtmltopdf が見つかりません"
-            ttk.Label(main_frame, text=status_text, foreground="red").grid(row=1, column=0, columnspan=4, pady=(0, 5))
+        # Status（wkhtmltopdfの確認が終わったら show_wkhtmltopdf_status で書き換える）
+        self.status_label = ttk.Label(main_frame, text="⏳ wkhtmltopdf を確認中...", foreground="gray")
+        self.status_label.grid(row=1, column=0, columnspan=4, pady=(0, 15))
 
-            help_text = "インストール: https://wkhtmltopdf.org/downloads.html"
-            ttk.Label(main_frame, text=help_text, foreground="blue").grid(row=2, column=0, columnspan=4, pady=(0, 15))
+        help_text = "インストール: https://wkhtmltopdf.org/downloads.html"
+        self.help_label = ttk.Label(main_frame, text=help_text, foreground="blue")
+        self.help_label.grid(row=2, column=0, columnspan=4, pady=(0, 15))
+        self.help_label.grid_remove()
 
         # Year input
         year_frame = ttk.LabelFrame(main_frame, text="年度設定", padding="10")
@@ -71,6 +105,37 @@ class SyllabusPDFConverter:
         ttk.Label(year_frame, text="例: 2025年度のシラバスの場合は「2025」を入力",
                  foreground="gray").grid(row=0, column=2, sticky=tk.W, padx=(20, 0))
 
+        ttk.Label(year_frame, text="並列数:").grid(row=1, column=0, sticky=tk.W, padx=(0, 10), pady=(10, 0))
+        self.workers_var = tk.StringVar(value="4")
+        ttk.Spinbox(year_frame, from_=1, to=16, textvariable=self.workers_var, width=10).grid(row=1, column=1, sticky=tk.W, pady=(10, 0))
+
+        ttk.Label(year_frame, text="起動したままのwkhtmltopdfを何個使うか",
+                 foreground="gray").grid(row=1, column=2, sticky=tk.W, padx=(20, 0), pady=(10, 0))
+
+        self.retry_failed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(year_frame, text="前回失敗した授業コードのみ再試行",
+                        variable=self.retry_failed_var).grid(row=2, column=0, columnspan=3, sticky=tk.W, pady=(10, 0))
+
+        self.refresh_changed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(year_frame, text="変換済みでも内容が変わったシラバスは再変換",
+                        variable=self.refresh_changed_var).grid(row=3, column=0, columnspan=3, sticky=tk.W)
+
+        ttk.Label(year_frame, text="変換エンジン:").grid(row=4, column=0, sticky=tk.W, padx=(0, 10), pady=(10, 0))
+        self.engine_var = tk.StringVar(value=WkhtmltopdfEngine.name)
+        ttk.Combobox(year_frame, textvariable=self.engine_var, values=ENGINE_CHOICES, state="readonly",
+                     width=12).grid(row=4, column=1, sticky=tk.W, pady=(10, 0))
+
+        ttk.Label(year_frame, text="auto: 最初の数件で試し変換して最速のものを使う",
+                 foreground="gray").grid(row=4, column=2, sticky=tk.W, padx=(20, 0), pady=(10, 0))
+
+        ttk.Label(year_frame, text="出力サイズ:").grid(row=5, column=0, sticky=tk.W, padx=(0, 10), pady=(10, 0))
+        self.preset_var = tk.StringVar(value=DEFAULT_PRESET)
+        ttk.Combobox(year_frame, textvariable=self.preset_var, values=list(OUTPUT_PRESETS), state="readonly",
+                     width=12).grid(row=5, column=1, sticky=tk.W, pady=(10, 0))
+
+        ttk.Label(year_frame, text="archive / screen / print: 画像を縮小してPDFを小さくする",
+                 foreground="gray").grid(row=5, column=2, sticky=tk.W, padx=(20, 0), pady=(10, 0))
+
         # File selection
         ttk.Label(main_frame, text="授業コードリストファイル:").grid(row=4, column=0, sticky=tk.W, pady=5)
         self.file_path_var = tk.StringVar()
@@ -126,12 +191,13 @@ class SyllabusPDFConverter:
 
     def generate_syllabus_url(self, course_code, year):
         """授業コードと年度からシラバスURLを生成"""
-        return f"https://syllabus.u-hyogo.ac.jp/slResult/{year}/japanese/syllabusHtml/SyllabusHtml.{year}.{course_code}.html"
+        return syllabus_url(course_code, year)
 
     def select_file(self):
         filename = filedialog.askopenfilename(
             title="授業コードリストファイルを選択してください",
-            filetypes=[("テキストファイル", "*.txt"), ("すべてのファイル", "*.*")]
+            filetypes=[("授業コードリスト", "*.txt *.csv *.tsv *.jsonl *.ndjson"), ("テキストファイル", "*.txt"),
+                       ("すべてのファイル", "*.*")]
         )
         if filename:
             self.file_path_var.set(filename)
@@ -148,48 +214,267 @@ class SyllabusPDFConverter:
     def log(self, message):
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         formatted_message = f"[{timestamp}] {message}"
-        self.log_text.insert(tk.END, formatted_message + "\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        self.events.log(formatted_message)
+
+    def process_course_codes(self, code_queue, counts):
+        """キューから授業コードを取り出して変換するワーカースレッド
+
+        再試行できる失敗は待ち時間を付けてキューの末尾に戻し、その間は次の授業コードを処理する。
+        """
+        manifest = self.manifest
+        while self.converting:
+            item = code_queue.get()
+            if item is None:
+                return
+            i, record, engine, attempt = item
+            url = record.url
+            # 他のノードの担当分を引き受けると件数が増える
+            total_codes = counts['total']
+            output_path = None
+
+            # 並列実行でも1件分のログがまとまるよう、最後にまとめて出力する
+            lines = []
+            success = False
+            error_class = None
+            retry_delay = None
+            try:
+                # ファイル名を生成（行で指定がなければ授業コード.pdf）
+                filename = record.filename()
+                output_path = os.path.join(self.output_dir_var.get(), filename)
+
+                # 変換済みチェック（マニフェスト導入前の既存ファイルは完了済みとして登録）
+                status = manifest.status(output_path)
+                if status is None and os.path.exists(output_path):
+                    manifest.mark_existing(output_path, url, record.course_code)
+                    status = STATUS_DONE
+
+                # 内容の変更を確認する場合、変換済みの授業もページを取得してハッシュを比較する
+                recheck = self.refresh_changed and status == STATUS_DONE
+                if url in self.missing_urls:
+                    lines.append(f"[{i}/{total_codes}] スキップ（シラバスなし・確認済み）: {record.label}")
+                    error_class = ERROR_NOT_FOUND
+                elif not recheck and not manifest.should_convert(status, retry_failed=self.retry_failed,
+                                                                 output_path=output_path):
+                    if status == STATUS_DONE:
+                        lines.append(f"[{i}/{total_codes}] スキップ（既存）: {record.label}")
+                        success = True
+                    else:
+                        lines.append(f"[{i}/{total_codes}] スキップ（再試行の対象外）: {record.label}")
+                else:
+                    error_class = self.convert_course_code(i, total_codes, record, output_path, lines, engine,
+                                                           attempt)
+                    success = error_class is None
+                    if not success:
+                        retry_delay = self.retry_policy.next_delay(error_class, attempt)
+
+            except Exception as e:
+                lines.append(f"[{i}/{total_codes}] エラー: {record.label} - {str(e)}")
+                error_class = ERROR_OTHER
+
+            if retry_delay is not None:
+                lines.append(f"    → {retry_delay:.1f}秒後に再試行します（{ERROR_LABELS[error_class]}、{attempt}回目の失敗）")
+                code_queue.retry((i, record, engine, attempt + 1), retry_delay)
+                with self.log_lock:
+                    for line in lines:
+                        self.log(line)
+                continue
+            code_queue.task_done()
+            if self.steal and output_path is not None:
+                manifest.release(output_path)
+            self.report_course_code(lines, record.label, success, error_class, counts)
+
+    def report_course_code(self, lines, label, success, error_class, counts):
+        """1件分のログをまとめて出力し、完了数を進める"""
+        with self.log_lock:
+            for line in lines:
+                self.log(line)
+            counts['done'] += 1
+            if success:
+                counts['success'] += 1
+            elif error_class is not None:
+                self.failure_classes.append(error_class)
+            self.events.progress(value=counts['done'],
+                                 text=f"[{counts['done']}/{counts['total']}] {label} 変換中...")
+
+    def shard_records(self, records):
+        """分担する場合は自分の担当の行だけを返す"""
+        if self.shard is None:
+            return records
+        return (record for record in records if self.shard.owns(record.shard_key))
+
+    def feed_course_codes(self, code_queue, input_path, year, counts, backlog):
+        """入力を1行ずつ読んでキューに入れる（重複・誤った行はここでスキップする）
+
+        未処理・再試行待ち・処理中の授業コードが backlog 件に達したら、空きができるまで読み進めない。
+        --steal の場合は担当分を読み終えたら入力を読み直し、他のノードがまだ手を付けていない
+        授業コードを引き受ける（引き受けない行はログに出さず、引き受けた行だけに番号を付ける）。
+        """
+        manifest = self.manifest
+        claimed_paths = Deduplicator()
+
+        def targets():
+            for record in self.shard_records(read_records(input_path, default_year=year)):
+                yield record, False
+            if self.steal:
+                for record in read_records(input_path, default_year=year):
+                    if record.error is None and not self.shard.owns(record.shard_key):
+                        yield record, True
 
-    def convert_url_to_pdf(self, url, output_path):
-        """wkhtmltopdfを使用してPDF変換"""
         try:
-            if not self.wkhtmltopdf_path:
-                return False
-
-            cmd = [
-                self.wkhtmltopdf_path,
-                "--page-size", "A4",
-                "--orientation", "Portrait",
-                "--margin-top", "0.75in",
-                "--margin-right", "0.75in",
-                "--margin-bottom", "0.75in",
-                "--margin-left", "0.75in",
-                "--encoding", "UTF-8",
-                "--load-error-handling", "ignore",
-                "--load-media-error-handling", "ignore",
-                "--quiet",
-                url,
-                output_path
-            ]
-
-            # Windowsでコマンドプロンプトウィンドウを表示しないように設定
-            startupinfo = None
-            if os.name == 'nt':  # Windows
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                startupinfo.wShowWindow = subprocess.SW_HIDE
-
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60, startupinfo=startupinfo)
-            return result.returncode == 0
+            i = 0
+            for record, stolen in targets():
+                if not self.converting or not code_queue.wait_for_room(backlog):
+                    return
+                if not stolen:
+                    i += 1
+                try:
+                    if record.error:
+                        raise ValueError(f"{record.line}行目: {record.error}")
+                    output_path = os.path.join(self.output_dir_var.get(), record.filename())
+                    if stolen:
+                        # 引き受けるのは他のノードが変換済みでない授業コードだけにする
+                        status = manifest.status(output_path)
+                        if status is None and os.path.exists(output_path):
+                            continue
+                        if not manifest.should_convert(status, retry_failed=self.retry_failed,
+                                                       output_path=output_path):
+                            continue
+                    claimed = claimed_paths.add(manifest.key(output_path), i)
+                    if claimed is not None:
+                        if not stolen:
+                            self.report_course_code([f"[{i}/{counts['total']}] スキップ（[{claimed}]と同じファイル名）: "
+                                                     f"{record.label}"], record.label, False, None, counts)
+                        continue
+                    # 分担する場合は出力先を確保する（他のノードが確保中・変換済みならスキップ）
+                    if self.steal and not manifest.claim(output_path, since=self.started_at):
+                        if not stolen:
+                            counts['elsewhere'] += 1
+                            self.report_course_code([f"[{i}/{counts['total']}] スキップ（他のノードが変換中・変換済み）: "
+                                                     f"{record.label}"], record.label, False, None, counts)
+                        continue
+                    if stolen:
+                        i += 1
+                        with self.log_lock:
+                            counts['total'] += 1
+                            counts['stolen'] += 1
+                            self.events.progress(maximum=counts['total'])
+                    engine = self.engine.get(record.engine, record.preset)
+                except Exception as e:
+                    self.report_course_code([f"[{i}/{counts['total']}] エラー: {record.label} - {str(e)}"],
+                                            record.label, False, ERROR_OTHER, counts)
+                    continue
+                code_queue.put((i, record, engine, 1))
+        except Exception as e:
+            self.log(f"授業コードリストの読み取りエラー: {str(e)}")
+        finally:
+            if claimed_paths.duplicates:
+                self.log(f"同じファイル名の重複: {claimed_paths.duplicates}件")
+            claimed_paths.close()
+            code_queue.end_input()
+
+    def convert_course_code(self, i, total_codes, record, output_path, lines, engine, attempt=1):
+        """1件の授業コードを変換する（内容に変更がなければ描画しない）
+
+        成功したらNone、失敗したら失敗の分類（retry_policy.ERROR_*）を返す。
+        --trace / --profile 指定時は段階ごとの所要時間を記録する。
+        """
+        if self.trace is None:
+            return self._convert_course_code(i, total_codes, record, output_path, lines, engine, None)
+
+        timer = self.trace.timer(record.url, attempt)
+        error_class = ERROR_OTHER
+        try:
+            error_class = self._convert_course_code(i, total_codes, record, output_path, lines, engine, timer)
+            return error_class
+        finally:
+            self.trace.record(timer, error_class, output_path)
+
+    def _convert_course_code(self, i, total_codes, record, output_path, lines, engine, timer):
+        manifest = self.manifest
+        url, course_code = record.url, record.course_code
+        filename = os.path.basename(output_path)
+        started = time.perf_counter()
 
+        # ページを取得して正規化したHTMLのハッシュを求める（HTTPキャッシュで未変更なら304で済む）
+        # 取得はホストごとのレート制限を通るので、描画も変換エンジンに再取得させず取得済みの本文から行う
+        try:
+            with timed(timer, 'fetch'):
+                page = self.cache.get(url)
         except Exception as e:
-            self.log(f"    PDF変換エラー: {str(e)}")
-            return False
+            if timer is not None:
+                timer.fail(e)
+            error_class = classify_error(e)
+            lines.append(f"[{i}/{total_codes}] 取得失敗: {record.label}")
+            lines.append(f"    URL: {url}")
+            if error_class == ERROR_NOT_FOUND:
+                lines.append(f"    ✗ 失敗: シラバスが存在しません")
+                if getattr(e, 'response', None) is not None:
+                    manifest.mark_missing(url, e.response.status_code)
+            else:
+                lines.append(f"    ✗ 失敗: {ERROR_LABELS[error_class]}（{str(e)}）")
+            manifest.fail(output_path, time.perf_counter() - started, str(e), url, course_code,
+                          error_class=error_class)
+            return error_class
+        if timer is not None:
+            timer.response(page)
+        digest = content_hash(page.content)
+
+        if (self.refresh_changed and manifest.content_hash(output_path, engine) == digest
+                and os.path.exists(output_path)):
+            lines.append(f"[{i}/{total_codes}] スキップ（内容に変更なし）: {record.label}")
+            manifest.mark_unchanged(output_path, url, course_code)
+            if timer is not None:
+                timer.result = 'unchanged'
+            return None
+
+        lines.append(f"[{i}/{total_codes}] 変換中: {record.label}")
+        lines.append(f"    URL: {url}")
+
+        manifest.start(output_path, url, course_code)
+
+        # 別の授業コードで同じ内容を同じ設定で描画済みなら、そのPDFをハードリンクする
+        source_path = manifest.find_by_content_hash(digest, engine) if self.refresh_changed else None
+        if source_path and source_path != os.path.abspath(output_path) and os.path.exists(source_path):
+            with timed(timer, 'write'):
+                link_or_copy(source_path, output_path)
+            lines.append(f"    = 同じ内容のPDFをリンク: {os.path.basename(source_path)}")
+            if timer is not None:
+                timer.result = 'linked'
+            converted = True
+        else:
+            # 一時ファイルに書き出し、完成してから出力パスに置き換える
+            with temporary_output(output_path) as temp_path:
+                try:
+                    engine.render_page(page, temp_path, timer)
+                    converted = os.path.exists(temp_path)
+                except Exception as e:
+                    if timer is not None:
+                        timer.fail(e)
+                    lines.append(f"    PDF変換エラー: {str(e)}")
+                    converted = False
+                if converted:
+                    with timed(timer, 'write'):
+                        os.replace(temp_path, output_path)
+
+        if not converted:
+            with timed(timer, 'manifest'):
+                manifest.fail(output_path, time.perf_counter() - started,
+                              "PDF作成エラー", url, course_code, error_class=ERROR_RENDERER)
+            lines.append(f"    ✗ 失敗: PDF作成エラー")
+            return ERROR_RENDERER
+
+        with timed(timer, 'manifest'):
+            manifest.finish(output_path, time.perf_counter() - started, url, course_code,
+                            content_hash=digest, engine=engine)
+        file_size = os.path.getsize(output_path) / 1024
+        lines.append(f"    ✓ 成功: {filename} ({file_size:.1f} KB)")
+        return None
 
     def start_conversion(self):
-        if not self.wkhtmltopdf_path:
+        if self.engine_var.get() == WkhtmltopdfEngine.name:
+            # 確認が終わっていなければ待つ（通常は起動直後に終わっている）
+            self.wkhtmltopdf_probe.join()
+        if self.engine_var.get() == WkhtmltopdfEngine.name and not self.wkhtmltopdf_path:
             messagebox.showerror("エラー", "wkhtmltopdf がインストールされていません。\n\nhttps://wkhtmltopdf.org/downloads.html\n\nからダウンロードしてインストールしてください。")
             return
 
@@ -221,99 +506,219 @@ class SyllabusPDFConverter:
         self.stop_button.config(state=tk.NORMAL)
         self.converting = True
 
-        self.log_text.delete(1.0, tk.END)
+        self.events.clear()
         self.conversion_thread = threading.Thread(target=self.conversion_worker, daemon=True)
         self.conversion_thread.start()
 
     def stop_conversion(self):
         self.converting = False
+        if self.code_queue is not None:
+            self.code_queue.close()
         self.log("停止が要求されました...")
 
     def conversion_worker(self):
         try:
             os.makedirs(self.output_dir_var.get(), exist_ok=True)
 
-            # 授業コードリストを読み込み
-            with open(self.file_path_var.get(), 'r', encoding='utf-8') as file:
-                course_codes = [line.strip() for line in file.readlines() if line.strip()]
+            # ログ欄には直近の行だけを残し、全ログは出力ディレクトリのファイルに書き出す
+            log_path = self.events.open_log_file(self.output_dir_var.get(), "syllabus_pdf")
+            self.log(f"ログファイル: {log_path}")
 
-            if not course_codes:
+            # 授業コードリストは1行ずつ読む（件数は進捗表示用に先に数える）
+            # 行で年度が指定されていなければ画面の年度を使う
+            # 分担する場合は担当の件数を数える（他のノードの分を引き受けると増える）
+            input_path = self.file_path_var.get()
+            year = int(self.year_var.get())
+            if self.shard is None:
+                total_codes = count_records(input_path)
+            else:
+                total_codes = sum(1 for _ in self.shard_records(read_records(input_path, default_year=year)))
+            if not total_codes and not self.steal:
                 self.log("授業コードが見つかりませんでした")
                 return
 
-            year = self.year_var.get()
-            total_codes = len(course_codes)
-            self.progress_bar.config(maximum=total_codes)
+            self.events.progress(maximum=total_codes)
 
             self.log(f"シラバスPDF変換開始: {total_codes}件の授業コード")
             self.log(f"対象年度: {year}年度")
             self.log(f"出力先: {self.output_dir_var.get()}")
+            if self.shard is not None:
+                self.log(f"分担: {self.shard.label}（{self.shard.node}"
+                         f"{'、終わったら他の担当分を引き受け' if self.steal else ''}）")
             self.log("=" * 70)
 
-            success_count = 0
-
-            for i, course_code in enumerate(course_codes):
-                if not self.converting:
-                    self.log("変換が停止されました")
-                    break
-
-                self.progress_var.set(f"[{i+1}/{total_codes}] {course_code} 変換中...")
-                self.progress_bar.config(value=i)
-
-                try:
-                    # URLを生成
-                    url = self.generate_syllabus_url(course_code, year)
-
-                    # ファイル名を生成（授業コード.pdf）
-                    filename = f"{course_code}.pdf"
-                    output_path = os.path.join(self.output_dir_var.get(), filename)
-
-                    # 既存ファイルチェック
-                    if os.path.exists(output_path):
-                        self.log(f"[{i+1}/{total_codes}] スキップ（既存）: {course_code}")
-                        success_count += 1
-                        continue
-
-                    self.log(f"[{i+1}/{total_codes}] 変換中: {course_code}")
-                    self.log(f"    URL: {url}")
-
-                    success = self.convert_url_to_pdf(url, output_path)
-
-                    if success and os.path.exists(output_path):
-                        file_size = os.path.getsize(output_path) / 1024
-                        self.log(f"    ✓ 成功: {filename} ({file_size:.1f} KB)")
-                        success_count += 1
-                    else:
-                        self.log(f"    ✗ 失敗: PDF作成エラー（シラバスが存在しない可能性）")
-
-                except Exception as e:
-                    self.log(f"[{i+1}/{total_codes}] エラー: {course_code} - {str(e)}")
+            # 授業コードを読みながらキューに入れ、各ワーカースレッドが変換エンジンで順に変換する
+            # 失敗した授業コードは待ち時間を付けてキューの末尾に戻し、再試行する
+            code_queue = self.code_queue = RetryQueue(more_input=True)
+            self.retry_policy = RetryPolicy()
+            self.failure_classes = []
+
+            # 担当分がなくても引き受ける分があるため、--steal の場合は件数でワーカー数を絞らない
+            worker_count = int(self.workers_var.get())
+            if not self.steal:
+                worker_count = max(1, min(worker_count, total_codes))
+            counts = {'done': 0, 'success': 0, 'total': total_codes, 'stolen': 0, 'elsewhere': 0}
+
+            # スキップ判定は出力ディレクトリのマニフェストで行単位に行う（全件を読み込まない）
+            self.manifest = RunManifest.for_directory(self.output_dir_var.get())
+            if self.shard is not None:
+                self.manifest.node = self.shard.node
+            self.started_at = time.time()
+            self.retry_failed = self.retry_failed_var.get()
+            self.refresh_changed = self.refresh_changed_var.get() and not self.retry_failed
+
+            # 内容ハッシュ用のページ取得（ETag/Last-Modifiedで再検証し、未変更なら本文を再取得しない）
+            # シラバスサーバーへの送信速度と同時接続数は応答を見ながら自動調整する
+            limiter = HostRateLimiter(self.host_limits)
+            self.cache = HTTPCache(http=SharedHTTPSession(pool_size=worker_count + 1, limiter=limiter))
+
+            # 段階別の所要時間は --trace / --profile 指定時だけ記録する
+            self.trace = None
+            if self.trace_path or self.profile_top:
+                self.trace = TraceRecorder(self.trace_path, self.profile_top,
+                                           os.path.join(self.output_dir_var.get(), "profiles"))
+
+            # シラバスの有無は各授業コードのページ取得で確かめ（404/410はマニフェストに記録し、描画しない）、
+            # 有効期限内に存在しないと確認済みの授業コードは取得せずにスキップする
+            # （事前にまとめて確認すると、全件の確認が終わるまで1件も変換が始まらないため）
+            self.missing_urls = self.manifest.missing_urls(self.missing_ttl) if self.missing_ttl > 0 else {}
+            if self.missing_urls:
+                self.log(f"シラバスなしと確認済みのURL: {len(self.missing_urls)}件（取得せずにスキップします）")
+
+            # 変換エンジンを準備する（auto の場合は存在するシラバスの先頭の数件で試し変換して選ぶ）
+            # 行ごとにエンジン・プリセットが指定されていれば、その組み合わせを最初に使うときに準備する
+            target_urls = (record.url for record in self.shard_records(read_records(input_path, default_year=year))
+                           if record.error is None and record.url not in self.missing_urls)
+            try:
+                sample_urls = list(itertools.islice(target_urls, CALIBRATION_SAMPLE * 3))
+                target_urls.close()
+                # WeasyPrintは並列数分の描画プロセスで描画する（--profile は自プロセスで計測するため使わない）
+                engine = open_engine(self.engine_var.get(), worker_count, http=self.cache.http,
+                                     cache=self.cache, sample_urls=sample_urls,
+                                     fetch=self.cache.get, log=self.log, preset=self.preset_var.get(),
+                                     process_limits=None if self.profile_top else self.process_limits)
+                self.engine = EngineSet(engine, worker_count, http=self.cache.http, cache=self.cache, log=self.log)
+            except Exception:
+                self.manifest.close()
+                self.cache.http.close()
+                raise
+            self.log(f"変換ワーカー: {worker_count}個")
+
+            feeder = threading.Thread(target=self.feed_course_codes,
+                                      args=(code_queue, input_path, year, counts,
+                                            worker_count * READ_AHEAD_PER_WORKER),
+                                      daemon=True)
 
-            self.progress_bar.config(value=total_codes)
-            self.progress_var.set("完了")
+            try:
+                feeder.start()
+                threads = [threading.Thread(target=self.process_course_codes,
+                                            args=(code_queue, counts), daemon=True)
+                           for _ in range(worker_count)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            finally:
+                # 停止された場合もキューが閉じられるため、入力の読み取りはすぐに終わる
+                code_queue.close()
+                if feeder.is_alive():
+                    feeder.join()
+                engine_summary = self.engine.summary()
+                self.engine.close()
+                self.engine = None
+                if self.steal:
+                    self.manifest.release_all()
+                self.manifest.close()
+                # プリセットの削減量は、接続を閉じる前に先頭の数件を default プリセットで描画し直して見積もる
+                size_summary = self.manifest.size_summary(PresetReference(self.cache.http, self.cache))
+                self.cache.http.close()
+
+            success_count = counts['success']
+            total_codes = counts['total']
+            if not self.converting:
+                self.log("変換が停止されました")
+            for line in engine_summary:
+                self.log(line)
+            for line in size_summary:
+                self.log(line)
+            if self.retry_policy.retries:
+                self.log(f"再試行: {self.retry_policy.retries}回（上限 {self.retry_policy.budget}回）")
+            if self.failure_classes:
+                self.log(f"失敗の内訳（{len(self.failure_classes)}件）:")
+                for line in summarize_failures(self.failure_classes):
+                    self.log(f"    {line}")
+            for line in limiter.summary():
+                self.log(f"実効レート {line}")
+            if self.trace is not None:
+                for line in self.trace.summary():
+                    self.log(line)
+                for path, seconds, url in self.trace.close():
+                    self.log(f"プロファイル: {path}（{seconds:.2f}秒 {url}）")
+                if self.trace_path:
+                    self.log(f"トレース: {self.trace_path}")
+                self.trace = None
+
+            self.events.progress(value=total_codes, text="完了")
 
             self.log("=" * 70)
             self.log(f"シラバスPDF変換完了: {success_count}/{total_codes} 件のPDFを作成")
+            if self.shard is not None:
+                self.log(f"分担 {self.shard.label}: 担当 {total_codes - counts['stolen']}件"
+                         f"（うち他のノードが変換 {counts['elsewhere']}件） / 引き受け {counts['stolen']}件")
 
             if self.converting:
-                messagebox.showinfo("完了", f"{success_count}/{total_codes} 件のシラバスPDFを作成しました")
+                self.events.call(messagebox.showinfo, "完了", f"{success_count}/{total_codes} 件のシラバスPDFを作成しました")
 
         except Exception as e:
             self.log(f"予期しないエラー: {str(e)}")
-            messagebox.showerror("エラー", f"予期しないエラー: {str(e)}")
+            self.events.call(messagebox.showerror, "エラー", f"予期しないエラー: {str(e)}")
 
         finally:
-            self.convert_button.config(state=tk.NORMAL)
-            self.stop_button.config(state=tk.DISABLED)
+            self.events.call(self.convert_button.config, state=tk.NORMAL)
+            self.events.call(self.stop_button.config, state=tk.DISABLED)
             self.converting = False
+            self.events.close_log_file()
+
+def parse_args(argv=None):
+    """コマンドライン引数を解析する"""
+    parser = argparse.ArgumentParser(description="兵庫県立大学 シラバス PDF変換ツール")
+    parser.add_argument("--missing-ttl-days", type=float, default=DEFAULT_MISSING_TTL_DAYS,
+                        help=f"存在しないと確認した授業コードを再確認せずにスキップする日数（0で毎回確認、デフォルト: {DEFAULT_MISSING_TTL_DAYS}）")
+    parser.add_argument("--host-limit", action="append", type=parse_host_limit, default=[],
+                        metavar="HOST=RATE[:MAX]",
+                        help="ホストごとの毎秒リクエスト数と最大同時接続数（例: syllabus.u-hyogo.ac.jp=4:6）")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="授業コードごとの段階別の所要時間・バイト数・ステータスをJSONL形式で追記するファイル")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="各授業の変換をcProfileで計測し、遅かったN件のプロファイルを出力先の profiles/ に保存する")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="複数のPCで1つのリストを分担するときの担当（N台中I台目、例: 1/3）。URLのハッシュで分ける")
+    parser.add_argument("--steal", action="store_true",
+                        help="--shard の担当分が終わったら、他のPCの未着手の分を引き受ける（全台で指定する）")
+    parser.add_argument("--recycle-after", type=int, default=DEFAULT_RECYCLE_DOCUMENTS, metavar="N",
+                        help=f"WeasyPrintの描画プロセスをN件描画するごとに入れ替える（デフォルト: {DEFAULT_RECYCLE_DOCUMENTS}）")
+    parser.add_argument("--max-worker-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB, metavar="MB",
+                        help=f"描画プロセスのRSSがこれを超えたら入れ替える（デフォルト: {DEFAULT_MAX_RSS_MB}。"
+                             "両方0なら描画プロセスを使わない）")
+    args = parser.parse_args(argv)
+    if args.steal and args.shard is None:
+        parser.error("--steal は --shard と一緒に指定してください")
+    return args
 
 def main():
+    args = parse_args()
     try:
         root = tk.Tk()
-        app = SyllabusPDFConverter(root)
+        app = SyllabusPDFConverter(root, host_limits=dict(args.host_limit),
+                                   missing_ttl_days=args.missing_ttl_days,
+                                   trace_path=args.trace, profile_top=args.profile,
+                                   shard=args.shard, steal=args.steal,
+                                   process_limits=process_limits(args.recycle_after, args.max_worker_rss_mb))
         root.mainloop()
     except Exception as e:
         messagebox.showerror("起動エラー", f"アプリケーションの起動に失敗しました: {str(e)}")
 
 if __name__ == "__main__":
+    # 描画プロセスを実行ファイル（PyInstaller）からも起動できるようにする
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
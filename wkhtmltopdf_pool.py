@@ -0,0 +1,145 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+
+def hidden_startupinfo():
+    """Windowsでコマンドプロンプトウィンドウを表示しないためのSTARTUPINFO"""
+    if os.name != 'nt':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return startupinfo
+
+def quote_arg(value):
+    """--read-args-from-stdin の1行に渡す引数をクォートする"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+class WkhtmltopdfWorker:
+    """--read-args-from-stdin で起動したままのwkhtmltopdfプロセス
+
+    標準入力に「URL 出力パス」を1行ずつ送ると、同じプロセス（起動済みのQt/WebKit）で
+    変換が行われる。標準エラーの進捗表示に出る "Done" で1件の完了を判定する。
+    """
+
+    def __init__(self, executable, options):
+        self.executable = executable
+        self.options = list(options)
+        self.process = None
+        self.lines = None
+        self.conversions = 0
+        self.restarts = 0
+
+    def start(self):
+        self.lines = queue.Queue()
+        self.process = subprocess.Popen(
+            [self.executable, *self.options, '--read-args-from-stdin'],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            startupinfo=hidden_startupinfo())
+        threading.Thread(target=self._read_stderr, args=(self.process, self.lines), daemon=True).start()
+
+    def _read_stderr(self, process, lines):
+        # 進捗バーは \r で上書きされるため、\r と \n の両方で行を区切る
+        buffer = b''
+        while True:
+            chunk = process.stderr.read1(4096)
+            if not chunk:
+                break
+            buffer += chunk.replace(b'\r', b'\n')
+            *complete, buffer = buffer.split(b'\n')
+            for line in complete:
+                if line.strip():
+                    lines.put(line.decode('utf-8', errors='replace').strip())
+        lines.put(None)
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def restart(self):
+        """応答しなくなったプロセスを破棄して起動し直す"""
+        self.stop(kill=True)
+        self.restarts += 1
+        self.start()
+
+    def stop(self, kill=False):
+        if self.process is None:
+            return
+        try:
+            if kill:
+                self.process.kill()
+            else:
+                self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def convert(self, url, output_path, timeout=60):
+        """1件変換し、成功したかどうかを返す（タイムアウト時はプロセスを再起動する）"""
+        if self.process is None:
+            self.start()
+        elif not self.is_alive():
+            self.restart()
+
+        # 前回の変換の残りの出力を捨てる
+        while True:
+            try:
+                if self.lines.get_nowait() is None:
+                    self.restart()
+                    break
+            except queue.Empty:
+                break
+
+        try:
+            self.process.stdin.write(f"{quote_arg(url)} {quote_arg(output_path)}\n".encode('utf-8'))
+            self.process.stdin.flush()
+        except OSError:
+            self.restart()
+            return False
+
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                # 応答しないワーカーは再起動して次の変換に備える
+                self.restart()
+                return False
+
+            if line is None:
+                # プロセスが異常終了した
+                self.restart()
+                return False
+            if line.startswith('Done'):
+                self.conversions += 1
+                return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+            if line.startswith('Exit with code'):
+                return False
+
+class WkhtmltopdfPool:
+    """起動済みのwkhtmltopdfワーカーをN個保持し、変換要求を空いているワーカーに割り当てる"""
+
+    def __init__(self, executable, size, options):
+        self.workers = [WkhtmltopdfWorker(executable, options) for _ in range(max(1, size))]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            worker.start()
+            self._idle.put(worker)
+
+    def convert(self, url, output_path, timeout=60):
+        worker = self._idle.get()
+        try:
+            return worker.convert(url, output_path, timeout)
+        finally:
+            self._idle.put(worker)
+
+    @property
+    def restarts(self):
+        return sum(worker.restarts for worker in self.workers)
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()